@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк разбивки длинных сообщений: старый посимвольный сплиттер против
+нового сплиттера HTML с подсчетом длины в UTF-16.
+
+Запуск: python benchmark_splitting.py [--sizes 8000,32000,128000] [--repeat 20]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from message_splitter import split_html, visible_length, utf16_length, MAX_MESSAGE_LENGTH
+from telegram_markdown import markdown_to_html, html_to_text
+
+
+def legacy_split(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Копия прежней реализации AILearningBot._split_long_message"""
+    if len(text) <= max_length:
+        return [text]
+
+    parts = []
+    remaining_text = text
+
+    while remaining_text:
+        if len(remaining_text) <= max_length:
+            parts.append(remaining_text.strip())
+            break
+
+        split_pos = max_length
+        double_newline_pos = remaining_text.rfind('\n\n', 0, max_length)
+        if double_newline_pos > max_length // 2:
+            split_pos = double_newline_pos + 2
+        else:
+            single_newline_pos = remaining_text.rfind('\n', 0, max_length)
+            if single_newline_pos > max_length // 2:
+                split_pos = single_newline_pos + 1
+            else:
+                sentence_pos = remaining_text.rfind('. ', 0, max_length - 1)
+                if sentence_pos > max_length // 2:
+                    split_pos = sentence_pos + 2
+                else:
+                    space_pos = remaining_text.rfind(' ', 0, max_length)
+                    if space_pos > max_length // 2:
+                        split_pos = space_pos + 1
+
+        parts.append(remaining_text[:split_pos].strip())
+        remaining_text = remaining_text[split_pos:].strip()
+
+    return parts
+
+
+def make_material(target_length: int) -> str:
+    """Материал темы в стиле ответов Grok: кириллица, эмодзи, длинный код и выделения"""
+    paragraph = (
+        "**Краткое введение в тему** 🚀 Детекция аномалий в данных 1C с использованием ИИ — "
+        "это метод выявления *необычных паттернов* в бухгалтерских транзакциях. "
+        "Используйте `IsolationForest` и [документацию](https://scikit-learn.org/stable/) 📚. "
+    ) * 6
+    # Строка из эмодзи: в UTF-16 каждый занимает две единицы
+    emoji_line = "✅ Итоги: " + "🔥🚀📊" * 40 + "\n"
+    code = (
+        "```python\n"
+        "# Пример: поиск аномалий 🔍\n"
+        "from sklearn.ensemble import IsolationForest\n"
+        + "".join(f"model_{i} = IsolationForest(contamination=0.0{i % 9 + 1})  # модель {i} ✅\n" for i in range(60))
+        + "```"
+    )
+    blocks = []
+    length = 0
+    index = 0
+    while length < target_length:
+        block = code if index % 4 == 3 else f"### Раздел {index} 💡\n{emoji_line}{paragraph}"
+        blocks.append(block)
+        length += len(block) + 2
+        index += 1
+    return "\n\n".join(blocks)
+
+
+def broken_parts(parts: List[str], is_html: bool) -> int:
+    """Сколько частей Telegram отклонит: превышение лимита или разорванная разметка"""
+    broken = 0
+    for part in parts:
+        if is_html:
+            too_long = visible_length(part) > MAX_MESSAGE_LENGTH
+            tags = re.findall(r'<(/?)(\w+)[^>]*>', part)
+            stack = []
+            unbalanced = False
+            for closing, tag in tags:
+                if closing:
+                    if not stack or stack.pop() != tag:
+                        unbalanced = True
+                else:
+                    stack.append(tag)
+            unbalanced = unbalanced or bool(stack)
+        else:
+            too_long = utf16_length(part) > MAX_MESSAGE_LENGTH
+            unbalanced = part.count('```') % 2 == 1 or part.count('**') % 2 == 1
+        if too_long or unbalanced:
+            broken += 1
+    return broken
+
+
+def measure(func: Callable[[], List[str]], repeat: int) -> float:
+    """Среднее время вызова в миллисекундах"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='8000,32000,128000', help='Длины тестовых материалов в символах')
+    parser.add_argument('--repeat', type=int, default=20, help='Количество повторов для усреднения')
+    args = parser.parse_args()
+
+    print(f"{'Размер':>8} {'UTF-16':>8} | {'Старый, мс':>10} {'частей':>6} {'битых':>5} | "
+          f"{'Новый, мс':>9} {'частей':>6} {'битых':>5} {'мкс/1K':>7}")
+    print("-" * 86)
+
+    for size in (int(value) for value in args.sizes.split(',')):
+        material = make_material(size)
+        rendered = markdown_to_html(material)
+
+        legacy_ms = measure(lambda: legacy_split(material), args.repeat)
+        legacy_parts = legacy_split(material)
+
+        new_ms = measure(lambda: split_html(markdown_to_html(material)), args.repeat)
+        new_parts = split_html(rendered)
+
+        # Ни один символ текста не должен потеряться при разбивке
+        original_text = re.sub(r'\s+', '', html_to_text(rendered))
+        split_text = re.sub(r'\s+', '', ''.join(html_to_text(part) for part in new_parts))
+        assert original_text == split_text, "Сплиттер потерял текст"
+
+        per_kilochar_us = new_ms * 1000 / (len(material) / 1000)
+        print(f"{len(material):>8} {utf16_length(material):>8} | "
+              f"{legacy_ms:>10.2f} {len(legacy_parts):>6} {broken_parts(legacy_parts, False):>5} | "
+              f"{new_ms:>9.2f} {len(new_parts):>6} {broken_parts(new_parts, True):>5} {per_kilochar_us:>7.1f}")
+
+    print("\nНовый сплиттер включает рендеринг Markdown -> HTML; 'мкс/1K' должно")
+    print("оставаться примерно постоянным с ростом размера (линейная сложность).")
+
+
+if __name__ == "__main__":
+    main()
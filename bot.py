@@ -1,20 +1,33 @@
 import os
+import math
 import logging
 import asyncio
 import signal
 from datetime import datetime, time, timedelta
 from typing import List, Dict, Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram.error import BadRequest
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes
 from database import Database
 from grok_service import GrokService
 from topic_service import TopicService
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from update_processor import PerUserUpdateProcessor
+from rate_limiter import TelegramRateLimiter
+from progress_indicator import ProgressIndicator
+from task_registry import TaskRegistry
+from callback_guard import CallbackGuard
+from question_quota import QuestionQuota
+from state_store import create_state_persistence
+from usage_ledger import UsageLedger, format_rollup
+from token_budget import budget
+from health_server import HealthServer
+from metrics import instrument_handlers
+from tracing import span, trace_handlers
+from telegram_markdown import markdown_to_html, html_to_text, escape_html
+from message_splitter import MAX_MESSAGE_LENGTH
+from material_pages import split_rendered, with_part_headers, section_start_pages
+
+# Логирование настраивает точка входа (setup_logging в main.py)
 logger = logging.getLogger(__name__)
 
 class AILearningBot:
@@ -22,32 +35,25 @@ class AILearningBot:
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
         self.db = Database()
         self.grok_service = GrokService()
+        # Журнал вызовов Grok: токены, время и стоимость по операциям и темам
+        self.usage_ledger = UsageLedger(self.db)
+        self.grok_service.ledger = self.usage_ledger
         self.topic_service = TopicService(self.db, self.grok_service)
+        self.update_processor = PerUserUpdateProcessor()
+        self.rate_limiter = TelegramRateLimiter()
+        # Долгие генерации выполняются в фоне, обработчики обновлений сразу освобождаются
+        self.tasks = TaskRegistry()
+        # Повторные нажатия кнопок и повторно доставленные обновления отбрасываются
+        self.callback_guard = CallbackGuard()
+        # Лимиты вопросов к Grok: на пользователя и общий (в Redis - для всех реплик)
+        self.question_quota = QuestionQuota()
+        # user_data/chat_data во внешнем хранилище: переживают перезапуск и видны всем репликам
+        self.state_persistence = create_state_persistence(self.db)
+        # HTTP-проверки здоровья по данным в памяти (без запросов к БД и Grok)
+        self.health = HealthServer(self)
+        # Telegram ID администраторов через запятую
+        self.admin_ids = {int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '152423085').split(',') if admin_id.strip()}
 
-    async def _send_loading_indicator(self, update_or_query, message: str = "⏳ Обрабатываю запрос, пожалуйста подождите...", context=None):
-        """Отправляет индикатор загрузки"""
-        try:
-            if hasattr(update_or_query, 'message') and update_or_query.message:
-                # Это callback query
-                loading_msg = await update_or_query.message.reply_text(message)
-            elif hasattr(update_or_query, 'effective_chat'):
-                # Это обычный update
-                loading_msg = await update_or_query.message.reply_text(message)
-            else:
-                return None
-            return loading_msg
-        except Exception as e:
-            logger.error(f"Ошибка отправки индикатора загрузки: {e}")
-            return None
-
-    async def _delete_loading_message(self, loading_msg):
-        """Удаляет сообщение с индикатором загрузки"""
-        try:
-            await loading_msg.delete()
-        except Exception:
-            # Игнорируем ошибки удаления (сообщение может быть уже удалено)
-            pass
-        
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /start - приветствие пользователя"""
         user_id = update.effective_user.id
@@ -84,17 +90,9 @@ class AILearningBot:
     async def _show_topics_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE, category: str):
         """Показать список тем определенной категории"""
         try:
-            # Показываем индикатор загрузки для списка тем
-            loading_msg = await self._send_loading_indicator(
-                update, 
-                "📚 Загружаю актуальные темы...",
-                context
-            )
-            
-            topics = await self.topic_service.get_topics_by_category(category)
-            
-            # Удаляем сообщение загрузки
-            await self._delete_loading_message(loading_msg)
+            # Статус "печатает" вместо временного сообщения (только если загрузка затянулась)
+            async with ProgressIndicator(context.bot, update.effective_chat.id):
+                topics = await self.topic_service.get_topics_by_category(category)
             
             if not topics:
                 await update.message.reply_text(
@@ -129,56 +127,54 @@ class AILearningBot:
     async def handle_topic_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка выбора темы"""
         query = update.callback_query
-        await query.answer()
-        
         topic_id = int(query.data.split('_')[1])
         user_id = query.from_user.id
-        
+
+        # Выбор темы - переход: незавершенные генерации пользователя в этом чате больше не нужны
+        self._cancel_generations(query)
+
+        # Загрузка и генерация материалов идут в фоне, обработчик сразу возвращается
+        task = self.tasks.submit(
+            user_id,
+            self._open_topic(query, context, topic_id, user_id),
+            name=f"topic_{topic_id}_user_{user_id}",
+            chat_id=query.message.chat_id
+        )
+        if task is None:
+            await query.answer("⏳ Дождитесь, пока будут готовы предыдущие материалы")
+            return
+        # Повторные нажатия этой кнопки игнорируются, пока материалы готовятся
+        self.callback_guard.hold(update, task)
+        await query.answer()
+
+    async def _open_topic(self, query, context: ContextTypes.DEFAULT_TYPE, topic_id: int, user_id: int,
+                          page_number: int = 1):
+        """Фоновая задача: получить страницы материалов и показать страницу page_number в сообщении со списком тем"""
         try:
-            # Показываем индикатор загрузки
-            loading_msg = await self._send_loading_indicator(
-                query, 
-                "🔄 Загружаю материалы по теме... Это может занять несколько секунд.",
-                context
-            )
-            
             # Получаем детали темы
             topic = await self.topic_service.get_topic_by_id(topic_id)
             if not topic:
-                await self._delete_loading_message(loading_msg)
                 await query.edit_message_text("❌ Тема не найдена.")
                 return
             
             # Устанавливаем текущую тему для пользователя
             await self.db.set_current_topic(user_id, topic_id)
             
-            # Показываем прогресс
-            if loading_msg:
-                await loading_msg.edit_text("🤖 Генерирую персональные учебные материалы с помощью ИИ...")
-            
-            # Генерируем материалы для обучения (длительная операция)
-            materials = await self.topic_service.generate_learning_materials(topic)
-            
-            # Удаляем сообщение загрузки
-            await self._delete_loading_message(loading_msg)
-            
-            # Форматируем ответ
-            response = self._format_topic_materials(topic, materials)
-            
-            # Кнопки для взаимодействия
-            keyboard = [
-                [InlineKeyboardButton("✅ Изучил!", callback_data=f"complete_{topic_id}")],
-                [InlineKeyboardButton("❓ Задать вопрос", callback_data=f"question_{topic_id}")],
-                [InlineKeyboardButton("📚 Назад к темам", callback_data="back_to_topics")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            # Отправляем сообщение с автоматической разбивкой на части
-            await self._send_long_message(
-                query, 
-                response,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
+            # Статус показывается в самом сообщении, которое затем заменят материалы
+            async with ProgressIndicator(context.bot, query.message.chat_id, message=query.message) as progress:
+                progress.update(
+                    "🤖 Генерирую персональные учебные материалы с помощью ИИ...",
+                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🚫 Отменить", callback_data="back_to_topics")]])
+                )
+                # Получаем готовые страницы материалов (при необходимости - генерация, длительная операция)
+                pages = await self.topic_service.get_material_pages(topic)
+            
+            # Одно сообщение с одной страницей, остальные страницы - по кнопкам
+            page_number = min(max(page_number, 1), len(pages))
+            await self._send_rendered(
+                query.edit_message_text,
+                pages[page_number - 1]['content'],
+                reply_markup=self._material_keyboard(topic_id, pages, page_number),
                 disable_web_page_preview=True
             )
             
@@ -186,201 +182,174 @@ class AILearningBot:
             logger.error(f"Error handling topic selection: {e}")
             await query.edit_message_text("❌ Произошла ошибка. Попробуйте позже.")
 
-    def _split_long_message(self, text: str, max_length: int = 4096) -> List[str]:
-        """Разбивает длинное сообщение на части, не превышающие max_length символов"""
-        if len(text) <= max_length:
-            return [text]
-        
-        parts = []
-        remaining_text = text
-        
-        while remaining_text:
-            if len(remaining_text) <= max_length:
-                # Если оставшийся текст помещается в лимит
-                parts.append(remaining_text.strip())
-                break
-            
-            # Ищем лучшее место для разрыва в пределах лимита
-            split_pos = max_length
-            
-            # Пытаемся найти разрыв по абзацам (двойной перенос)
-            double_newline_pos = remaining_text.rfind('\n\n', 0, max_length)
-            if double_newline_pos > max_length // 2:  # Если разрыв не слишком рано
-                split_pos = double_newline_pos + 2
-            else:
-                # Пытаемся найти разрыв по одинарному переносу
-                single_newline_pos = remaining_text.rfind('\n', 0, max_length)
-                if single_newline_pos > max_length // 2:
-                    split_pos = single_newline_pos + 1
-                else:
-                    # Пытаемся найти разрыв по предложению (точка + пробел)
-                    sentence_pos = remaining_text.rfind('. ', 0, max_length - 1)
-                    if sentence_pos > max_length // 2:
-                        split_pos = sentence_pos + 2
-                    else:
-                        # Пытаемся найти разрыв по пробелу
-                        space_pos = remaining_text.rfind(' ', 0, max_length)
-                        if space_pos > max_length // 2:
-                            split_pos = space_pos + 1
-                        # Иначе принудительный разрыв на max_length
-            
-            # Добавляем часть и продолжаем с оставшимся текстом
-            parts.append(remaining_text[:split_pos].strip())
-            remaining_text = remaining_text[split_pos:].strip()
-        
-        return parts
+    async def show_material_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Переход на страницу материалов темы в том же сообщении"""
+        query = update.callback_query
+        user_id = query.from_user.id
 
-    async def _send_long_text_message(self, update: Update, text: str, reply_markup=None, parse_mode='Markdown', disable_web_page_preview=True):
-        """Отправляет длинное текстовое сообщение, разбивая на части при необходимости"""
-        parts = self._split_long_message(text)
-        
-        async def safe_send_text(message_text, reply_markup_to_use=None):
-            """Безопасная отправка с fallback на plain text при ошибках Markdown"""
-            try:
-                await update.message.reply_text(
-                    message_text,
-                    reply_markup=reply_markup_to_use,
-                    parse_mode=parse_mode,
-                    disable_web_page_preview=disable_web_page_preview
-                )
-            except Exception as markdown_error:
-                # Если ошибка парсинга Markdown, отправляем как plain text
-                logger.warning(f"Markdown parse error, falling back to plain text: {markdown_error}")
-                try:
-                    await update.message.reply_text(
-                        message_text,
-                        reply_markup=reply_markup_to_use,
-                        parse_mode=None,  # Без форматирования
-                        disable_web_page_preview=disable_web_page_preview
-                    )
-                except Exception:
-                    # Последняя попытка - очищаем от всех спецсимволов
-                    clean_text = message_text.replace('*', '').replace('_', '').replace('`', '')
-                    await update.message.reply_text(
-                        clean_text,
-                        reply_markup=reply_markup_to_use,
-                        disable_web_page_preview=disable_web_page_preview
-                    )
-        
-        if len(parts) == 1:
-            # Если сообщение помещается в одну часть
-            await safe_send_text(parts[0], reply_markup)
-        else:
-            # Если сообщение нужно разбить
-            # Первую часть отправляем
-            await safe_send_text(f"📄 Часть 1/{len(parts)}\n\n{parts[0]}")
-            
-            # Остальные части отправляем новыми сообщениями
-            for i, part in enumerate(parts[1:], 2):
-                is_last_part = (i == len(parts))
-                message_text = f"📄 Часть {i}/{len(parts)}\n\n{part}"
-                
-                await safe_send_text(
-                    message_text,
-                    reply_markup if is_last_part else None
-                )
+        _, topic_id, page_number = query.data.split('_')
+        topic_id, page_number = int(topic_id), int(page_number)
 
-    async def _send_long_message(self, query, text: str, reply_markup=None, parse_mode='Markdown', disable_web_page_preview=True):
-        """Отправляет длинное сообщение, разбивая на части при необходимости"""
-        parts = self._split_long_message(text)
-        
-        async def safe_edit_text(message_text, reply_markup_to_use=None):
-            """Безопасное редактирование с fallback на plain text при ошибках"""
-            try:
-                await query.edit_message_text(
-                    message_text,
-                    reply_markup=reply_markup_to_use,
-                    parse_mode=parse_mode,
-                    disable_web_page_preview=disable_web_page_preview
-                )
-            except Exception as edit_error:
-                logger.warning(f"Error in edit_message_text, trying fallbacks: {edit_error}")
-                try:
-                    # Попытка без форматирования
-                    await query.edit_message_text(
-                        message_text,
-                        reply_markup=reply_markup_to_use,
-                        parse_mode=None,
-                        disable_web_page_preview=disable_web_page_preview
-                    )
-                except Exception:
-                    # Последняя попытка - очищаем от спецсимволов
-                    clean_text = message_text.replace('*', '').replace('_', '').replace('`', '')
-                    await query.edit_message_text(
-                        clean_text,
-                        reply_markup=reply_markup_to_use,
-                        disable_web_page_preview=disable_web_page_preview
-                    )
-        
-        async def safe_reply_text(message_text, reply_markup_to_use=None):
-            """Безопасная отправка нового сообщения с fallback"""
-            try:
-                await query.message.reply_text(
-                    message_text,
-                    reply_markup=reply_markup_to_use,
-                    parse_mode=parse_mode,
-                    disable_web_page_preview=disable_web_page_preview
-                )
-            except Exception as reply_error:
-                logger.warning(f"Error in reply_text, trying fallbacks: {reply_error}")
-                try:
-                    await query.message.reply_text(
-                        message_text,
-                        reply_markup=reply_markup_to_use,
-                        parse_mode=None,
-                        disable_web_page_preview=disable_web_page_preview
-                    )
-                except Exception:
-                    clean_text = message_text.replace('*', '').replace('_', '').replace('`', '')
-                    await query.message.reply_text(
-                        clean_text,
-                        reply_markup=reply_markup_to_use,
-                        disable_web_page_preview=disable_web_page_preview
-                    )
-        
-        if len(parts) == 1:
-            # Если сообщение помещается в одну часть
-            await safe_edit_text(parts[0], reply_markup)
-        else:
-            # Если сообщение нужно разбить
-            # Первую часть редактируем
-            await safe_edit_text(f"📄 Часть 1/{len(parts)}\n\n{parts[0]}")
-            
-            # Остальные части отправляем новыми сообщениями
-            for i, part in enumerate(parts[1:], 2):
-                is_last_part = (i == len(parts))
-                message_text = f"📄 Часть {i}/{len(parts)}\n\n{part}"
-                
-                await safe_reply_text(
-                    message_text,
-                    reply_markup if is_last_part else None
+        try:
+            # Страницы берутся из кеша; генерация нужна только если материалы устарели
+            pages = await self.topic_service.get_stored_pages(topic_id)
+            if not pages:
+                # Материалы обновляются - как при выборе темы, в фоновой задаче с прогрессом и отменой
+                task = self.tasks.submit(
+                    user_id,
+                    self._open_topic(query, context, topic_id, user_id, page_number),
+                    name=f"topic_{topic_id}_user_{user_id}",
+                    chat_id=query.message.chat_id
                 )
+                if task is None:
+                    await query.answer("⏳ Дождитесь, пока будут готовы предыдущие материалы")
+                    return
+                self.callback_guard.hold(update, task)
+                await query.answer("🔄 Материалы обновляются...")
+                return
+
+            await query.answer()
+            page_number = min(max(page_number, 1), len(pages))
+            await self._send_rendered(
+                query.edit_message_text,
+                pages[page_number - 1]['content'],
+                reply_markup=self._material_keyboard(topic_id, pages, page_number),
+                disable_web_page_preview=True
+            )
+
+        except Exception as e:
+            logger.error(f"Ошибка показа страницы {page_number} темы {topic_id}: {e}")
+            await query.edit_message_text("❌ Произошла ошибка. Попробуйте позже.")
 
-    def _format_topic_materials(self, topic: Dict, materials: Dict) -> str:
-        """Форматирование материалов темы в Markdown"""
-        response = f"""
-**📖 {topic['title']}**
+    async def send_material_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Отправка всех материалов темы одним HTML файлом"""
+        query = update.callback_query
+        await query.answer("📥 Готовлю файл...")
 
-_{topic['description']}_
+        topic_id = int(query.data.split('_')[1])
+        chat_id = query.message.chat_id
 
-⏱️ **Время изучения:** {topic['learning_time']}
-📊 **Сложность:** {topic['difficulty']}
+        try:
+            topic = await self.topic_service.get_topic_by_id(topic_id)
+            if not topic:
+                await query.message.reply_text("❌ Тема не найдена.")
+                return
 
-**📚 Материалы для изучения:**
+            document = await self.topic_service.get_material_document(topic)
+            caption = f"📖 <b>{escape_html(topic['title'])}</b>"
 
-{materials.get('tutorial', '')}
+            # Файл этой версии уже загружался - отправляем по file_id без повторной загрузки
+            if document['file_id']:
+                try:
+                    await context.bot.send_document(chat_id, document=document['file_id'], caption=caption, parse_mode='HTML')
+                    return
+                except BadRequest as e:
+                    logger.warning(f"file_id материалов темы {topic_id} недействителен, загружаем заново: {e}")
 
-**🔗 Полезные ссылки:**
-{materials.get('links', '')}
+            message = await context.bot.send_document(
+                chat_id,
+                document=InputFile(document['content'], filename=document['filename']),
+                caption=caption,
+                parse_mode='HTML'
+            )
+            if document['version'] and message.document:
+                await self.topic_service.save_document_file_id(topic_id, document['version'], message.document.file_id)
 
-**🎥 Видео и курсы:**
-{materials.get('courses', '')}
+        except Exception as e:
+            logger.error(f"Ошибка отправки файла материалов темы {topic_id}: {e}")
+            await query.message.reply_text("❌ Не удалось отправить файл. Попробуйте позже.")
+
+    async def ignore_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопки без действия (номер страницы)"""
+        await update.callback_query.answer()
+
+    def _material_keyboard(self, topic_id: int, pages: List[Dict], page_number: int) -> InlineKeyboardMarkup:
+        """Кнопки просмотра материалов: листание, переход к разделам и действия с темой"""
+        keyboard = []
+        total = len(pages)
+
+        if total > 1:
+            navigation = []
+            if page_number > 1:
+                navigation.append(InlineKeyboardButton("◀️", callback_data=f"page_{topic_id}_{page_number - 1}"))
+            navigation.append(InlineKeyboardButton(f"{page_number}/{total}", callback_data="page_noop"))
+            if page_number < total:
+                navigation.append(InlineKeyboardButton("▶️", callback_data=f"page_{topic_id}_{page_number + 1}"))
+            keyboard.append(navigation)
+
+            # Переход к разделам, которые начинаются на других страницах
+            sections = [
+                InlineKeyboardButton(label, callback_data=f"page_{topic_id}_{target}")
+                for label, target in section_start_pages(pages)
+                if target != page_number
+            ]
+            if sections:
+                keyboard.append(sections)
+
+            # Длинную тему удобнее получить целиком одним файлом
+            keyboard.append([InlineKeyboardButton("📥 Скачать файлом", callback_data=f"document_{topic_id}")])
+
+        keyboard += [
+            [InlineKeyboardButton("✅ Изучил!", callback_data=f"complete_{topic_id}")],
+            [InlineKeyboardButton("❓ Задать вопрос", callback_data=f"question_{topic_id}")],
+            [InlineKeyboardButton("📚 Назад к темам", callback_data="back_to_topics")]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+
+    def _split_long_message(self, text: str, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+        """Преобразует Markdown в HTML Telegram и разбивает на части не длиннее max_length.
 
-**💡 Практические примеры:**
-{materials.get('examples', '')}
+        Длина считается в UTF-16, как в Telegram; блоки кода и выделения
+        не разрываются, а при вынужденном разрыве разметка открывается заново.
         """
-        
-        return response  # Убираем ограничение, будем разбивать позже
+        with span('render.split', chars=len(text)) as render_span:
+            parts = split_rendered(markdown_to_html(text), max_length)
+            if render_span is not None:
+                render_span.set(parts=len(parts))
+            return parts
+
+    async def _send_rendered(self, send, rendered: str, reply_markup=None, disable_web_page_preview=True):
+        """Отправка готового HTML сообщения Telegram.
+
+        Рендерер гарантирует корректную разметку, поэтому обычно нужен ровно
+        один запрос к API. Если Telegram все же отклонит разметку, сообщение
+        один раз отправляется как plain text.
+        """
+        try:
+            return await send(
+                rendered,
+                reply_markup=reply_markup,
+                parse_mode='HTML',
+                disable_web_page_preview=disable_web_page_preview
+            )
+        except BadRequest as parse_error:
+            # Повторное нажатие той же страницы - сообщение уже актуально
+            if 'not modified' in str(parse_error).lower():
+                return None
+            logger.warning(f"Telegram отклонил HTML разметку, отправляем plain text: {parse_error}")
+            with span('render.plain_text_fallback', error=str(parse_error)):
+                return await send(
+                    html_to_text(rendered),
+                    reply_markup=reply_markup,
+                    parse_mode=None,
+                    disable_web_page_preview=disable_web_page_preview
+                )
+
+    async def _deliver_pages(self, message, pages: List[str], reply_markup=None, disable_web_page_preview=True):
+        """Доставка страниц правкой сообщения: первая страница заменяет message, остальные идут следом"""
+        with span('telegram.deliver', parts=len(pages)):
+            for i, page in enumerate(pages, 1):
+                is_last_part = (i == len(pages))
+                if i == 1:
+                    send = message.edit_text
+                else:
+                    send = message.reply_text
+                await self._send_rendered(
+                    send,
+                    page,
+                    reply_markup if is_last_part else None,
+                    disable_web_page_preview
+                )
 
     async def complete_topic(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отметить тему как завершенную"""
@@ -442,18 +411,9 @@ _{topic['description']}_
         user_id = update.effective_user.id
         
         try:
-            # Показываем индикатор загрузки для статистики
-            loading_msg = await self._send_loading_indicator(
-                update, 
-                "📊 Собираю вашу статистику обучения...",
-                context
-            )
-            
-            stats = await self.db.get_user_stats(user_id)
-            completed_topics = await self.db.get_completed_topics(user_id)
-            
-            # Удаляем сообщение загрузки
-            await self._delete_loading_message(loading_msg)
+            async with ProgressIndicator(context.bot, update.effective_chat.id):
+                stats = await self.db.get_user_stats(user_id)
+                completed_topics = await self.db.get_completed_topics(user_id)
             
             progress_bar = self._create_progress_bar(stats['completed_topics'], 20)
             
@@ -470,7 +430,7 @@ _{topic['description']}_
             """
             
             for topic in completed_topics:
-                progress_message += f"✅ {topic['title']}\n"
+                progress_message += f"✅ {escape_html(topic['title'])}\n"
             
             await update.message.reply_text(
                 progress_message,
@@ -493,16 +453,20 @@ _{topic['description']}_
         question = update.message.text
         
         try:
+            # Лимит фоновых задач проверяем до очистки контекста, чтобы вопрос можно было повторить
+            if not self.tasks.can_submit(user_id):
+                await update.message.reply_text("⏳ Предыдущий ответ еще готовится, подождите немного.")
+                return
+
             # Проверяем, есть ли контекст ожидания вопроса от кнопки
             if 'waiting_for_question' in context.user_data:
                 topic_id = int(context.user_data['waiting_for_question'])
-                # Очищаем контекст
-                del context.user_data['waiting_for_question']
                 
                 # Получаем тему по ID
                 topic = await self.topic_service.get_topic_by_id(topic_id)
                 
                 if not topic:
+                    del context.user_data['waiting_for_question']
                     await update.message.reply_text("❌ Тема не найдена.")
                     return
                 
@@ -518,18 +482,59 @@ _{topic['description']}_
                     )
                     return
 
-            # Показываем индикатор загрузки
-            loading_msg = await self._send_loading_indicator(
-                update, 
-                "🤔 Анализирую ваш вопрос и готовлю подробный ответ...",
-                context
+            # Лимит вопросов: отказ сразу, без обращения к Grok; контекст вопроса сохраняется
+            wait = await self.question_quota.check(user_id)
+            if wait > 0:
+                await update.message.reply_text(
+                    f"🐢 Слишком много вопросов подряд. Попробуйте через {math.ceil(wait)} сек."
+                )
+                return
+
+            # Заглушка сразу показывает, что вопрос принят; ответ заменит ее в фоновой задаче
+            placeholder = await update.message.reply_text(
+                "🤔 Готовлю ответ...",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("🚫 Отменить", callback_data=f"topic_{current_topic['id']}")
+                ]])
             )
+            task = self.tasks.submit(
+                user_id,
+                self._answer_question(update, context, placeholder, question, current_topic),
+                name=f"question_user_{user_id}",
+                chat_id=update.effective_chat.id
+            )
+            if task is None:
+                # Пока шли проверки, место заняла другая задача: вопрос не списываем,
+                # контекст ожидания вопроса сохраняется
+                await self.question_quota.refund(user_id)
+                await placeholder.edit_text("⏳ Предыдущий ответ еще готовится, подождите немного.")
+                return
+
+            # Очищаем контекст ожидания вопроса
+            context.user_data.pop('waiting_for_question', None)
             
-            # Генерируем ответ через Grok API (длительная операция)
-            answer = await self.grok_service.answer_question(question, current_topic)
-            
-            # Удаляем сообщение загрузки
-            await self._delete_loading_message(loading_msg)
+        except Exception as e:
+            logger.error(f"Error handling question: {e}")
+            await update.message.reply_text(
+                "❌ Произошла ошибка при обработке вопроса. Попробуйте позже."
+            )
+
+    async def _answer_question(self, update: Update, context: ContextTypes.DEFAULT_TYPE, placeholder,
+                               question: str, current_topic: Dict):
+        """Фоновая задача: получить ответ Grok и доставить его правкой сообщения-заглушки"""
+        try:
+            # Пока готовится ответ, в чате виден статус "печатает"
+            # Похожий вопрос по теме уже задавали - ответ отдается без обращения к Grok
+            answer = await self.topic_service.find_answer(current_topic, question)
+            generated = answer is None
+            if generated:
+                async with ProgressIndicator(context.bot, update.effective_chat.id):
+                    # Фрагменты материалов темы, относящиеся к вопросу - контекст для ответа
+                    material_context = await self.topic_service.get_question_context(
+                        current_topic, question, budget('answer')['context']
+                    )
+                    # Генерируем ответ через Grok API (длительная операция)
+                    answer = await self.grok_service.answer_question(question, current_topic, material_context)
 
             # Отправляем ответ с кнопкой возврата к теме
             keyboard = [
@@ -539,20 +544,24 @@ _{topic['description']}_
             
             response = f"💡 **Ответ по теме \"{current_topic['title']}\":**\n\n{answer}"
             
-            # Отправляем с автоматической разбивкой на части и обработкой ошибок Markdown
-            await self._send_long_text_message(
-                update,
-                response,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                disable_web_page_preview=True
-            )
+            # Первая часть заменяет заглушку, остальные отправляются следом
+            pages = with_part_headers(self._split_long_message(response))
+            await self._deliver_pages(placeholder, pages, reply_markup=reply_markup)
+
+            # Сообщения об ошибках Grok начинаются с ❌ - их не запоминаем
+            if generated and answer.strip() and not answer.startswith('❌'):
+                await self.topic_service.save_answer(current_topic, question, answer)
             
+        except asyncio.CancelledError:
+            # Пользователь ушел на другой экран - заглушка не должна висеть
+            try:
+                await placeholder.edit_text("🚫 Ответ отменен.")
+            except Exception:
+                pass
+            raise
         except Exception as e:
             logger.error(f"Error handling question: {e}")
-            await update.message.reply_text(
-                "❌ Произошла ошибка при обработке вопроса. Попробуйте позже."
-            )
+            await placeholder.edit_text("❌ Произошла ошибка при обработке вопроса. Попробуйте позже.")
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /help - справка"""
@@ -586,10 +595,7 @@ _{topic['description']}_
 
     async def update_topics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /update_topics - ручное обновление тем (только для админа)"""
-        # Проверка на админа (замените на ваш Telegram ID)
-        admin_ids = [152423085]  # Добавьте свой Telegram ID
-        
-        if update.effective_user.id not in admin_ids:
+        if update.effective_user.id not in self.admin_ids:
             await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
             return
         
@@ -610,10 +616,32 @@ _{topic['description']}_
             logger.error(f"Ошибка обновления тем: {e}")
             await update.message.reply_text(f"❌ Ошибка при обновлении тем: {str(e)}")
 
+    async def usage_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /usage [дней] - расходы и время вызовов Grok по операциям и темам (только для админа)"""
+        if update.effective_user.id not in self.admin_ids:
+            await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+            return
+
+        try:
+            days = int(context.args[0]) if context.args else 7
+        except ValueError:
+            await update.message.reply_text("Использование: /usage [число дней]")
+            return
+
+        try:
+            # Свежие вызовы еще в буфере журнала - сначала записываем их
+            await self.usage_ledger.flush()
+            rollup = await self.usage_ledger.rollup(days=max(1, days))
+            await update.message.reply_text(format_rollup(rollup))
+        except Exception as e:
+            logger.error(f"Ошибка сводки вызовов Grok: {e}")
+            await update.message.reply_text(f"❌ Ошибка при получении сводки: {str(e)}")
+
     async def show_general_topics_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать общие темы ИИ (callback обработчик)"""
         query = update.callback_query
         await query.answer()
+        self._cancel_generations(query)
         
         # Используем существующий метод _show_topics_list
         await self._show_topics_list_callback(query, "general")
@@ -622,6 +650,7 @@ _{topic['description']}_
         """Показать темы для 1C (callback обработчик)"""
         query = update.callback_query
         await query.answer()
+        self._cancel_generations(query)
         
         # Используем существующий метод _show_topics_list
         await self._show_topics_list_callback(query, "1c")
@@ -695,15 +724,15 @@ _{topic['description']}_
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await query.edit_message_text(
-                f"❓ **Задать вопрос по теме \"{topic['title']}\"**\n\n"
+                f"❓ <b>Задать вопрос по теме \"{escape_html(topic['title'])}\"</b>\n\n"
                 "Напишите свой вопрос следующим сообщением, и я дам подробный ответ на основе материалов этой темы.\n\n"
-                "💡 *Примеры хороших вопросов:*\n"
+                "💡 <i>Примеры хороших вопросов:</i>\n"
                 "• Как это применить на практике?\n"
                 "• В чем главные преимущества?\n"  
                 "• Какие есть альтернативы?\n"
                 "• Можете привести конкретный пример?",
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode='HTML'
             )
             
         except Exception as e:
@@ -714,6 +743,8 @@ _{topic['description']}_
         """Возврат к списку тем"""
         query = update.callback_query
         await query.answer()
+        # Пользователь ушел к списку тем - генерация для прежнего экрана не нужна
+        self._cancel_generations(query)
         
         keyboard = [
             [InlineKeyboardButton("🧠 Общие темы ИИ", callback_data="show_general_topics")],
@@ -726,6 +757,11 @@ _{topic['description']}_
             reply_markup=reply_markup
         )
 
+    def _cancel_generations(self, query):
+        """Отменить фоновые генерации пользователя в чате при переходе на другой экран"""
+        if query.message:
+            self.tasks.cancel_chat(query.from_user.id, query.message.chat_id)
+
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
         logger.error(f"Update {update} caused error {context.error}")
@@ -750,6 +786,41 @@ _{topic['description']}_
         except Exception as e:
             logger.error(f"❌ Ошибка при обновлении тем по расписанию: {e}")
 
+    async def shutdown(self, application: Application):
+        """Штатная остановка: прекращаем прием обновлений, дожидаемся фоновых задач, закрываем ресурсы"""
+        drain_timeout = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '20'))
+        # Проверка готовности сразу сообщает об остановке
+        self.health.stopping = True
+
+        # 1. Новые обновления больше не забираем; уже полученные доработают
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+
+        # 2. Даем фоновым генерациям завершиться до дедлайна, остальные отменяем
+        if self.tasks.in_flight:
+            logger.info(f"⏳ Ожидаем фоновые задачи ({self.tasks.in_flight}) до {drain_timeout:.0f} сек.")
+            if not await self.tasks.wait(timeout=drain_timeout):
+                cancelled = self.tasks.cancel_all()
+                logger.warning(f"🛑 Не успели завершиться и отменены задачи: {cancelled}")
+                await self.tasks.wait(timeout=5)
+
+        # 3. Останавливаем обработку и сохраняем состояние диалогов (persistence.flush)
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+
+        # 4. Закрываем соединения
+        for name, close in (("лимиты вопросов", self.question_quota.close),
+                            ("Grok API", self.grok_service.close),
+                            ("журнал вызовов Grok", self.usage_ledger.close),
+                            ("база данных", self.db.close),
+                            ("проверка здоровья", self.health.stop)):
+            try:
+                await close()
+            except Exception as e:
+                logger.error(f"Ошибка закрытия ({name}): {e}")
+        logger.info("✅ Бот остановлен штатно")
+
     def run(self):
         """Запуск бота с инициализацией сервисов"""
         
@@ -763,19 +834,42 @@ _{topic['description']}_
             
             logger.info("🤖 Бот готов к работе!")
             
-            # Создание приложения
-            application = Application.builder().token(self.token).build()
+            # Создание приложения: апдейты разных пользователей обрабатываются
+            # параллельно, апдейты одного пользователя - по порядку.
+            # Все исходящие запросы проходят через общий ограничитель скорости,
+            # поэтому пул соединений с Telegram можно держать небольшим
+            builder = (
+                Application.builder()
+                .token(self.token)
+                .concurrent_updates(self.update_processor)
+                .rate_limiter(self.rate_limiter)
+                .connection_pool_size(int(os.getenv('TELEGRAM_CONNECTION_POOL_SIZE', '32')))
+                .pool_timeout(float(os.getenv('TELEGRAM_POOL_TIMEOUT', '10')))
+                .connect_timeout(float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', '5')))
+                .read_timeout(float(os.getenv('TELEGRAM_READ_TIMEOUT', '15')))
+            )
+            if self.state_persistence:
+                builder = builder.persistence(self.state_persistence)
+            application = builder.build()
             
             # Регистрация обработчиков команд
+            # Дубликаты отсекаются до всех обработчиков, нажатие считается завершенным после них
+            application.add_handler(TypeHandler(Update, self.callback_guard.before), group=-1)
+            application.add_handler(TypeHandler(Update, self.callback_guard.after), group=1000)
+
             application.add_handler(CommandHandler("start", self.start))
             application.add_handler(CommandHandler("topics", self.show_topics))
             application.add_handler(CommandHandler("topics_1c", self.show_topics_1c))
             application.add_handler(CommandHandler("progress", self.show_progress))
             application.add_handler(CommandHandler("help", self.help_command))
             application.add_handler(CommandHandler("update_topics", self.update_topics_command))
+            application.add_handler(CommandHandler("usage", self.usage_command))
             
             # Обработчики callback запросов
             application.add_handler(CallbackQueryHandler(self.handle_topic_selection, pattern="^topic_"))
+            application.add_handler(CallbackQueryHandler(self.show_material_page, pattern=r"^page_\d+_\d+$"))
+            application.add_handler(CallbackQueryHandler(self.ignore_callback, pattern="^page_noop$"))
+            application.add_handler(CallbackQueryHandler(self.send_material_document, pattern=r"^document_\d+$"))
             application.add_handler(CallbackQueryHandler(self.complete_topic, pattern="^complete_"))
             application.add_handler(CallbackQueryHandler(self.handle_question_button, pattern="^question_"))
             application.add_handler(CallbackQueryHandler(self.back_to_topics, pattern="^back_to_topics"))
@@ -785,6 +879,11 @@ _{topic['description']}_
             # Обработчик текстовых сообщений (вопросы)
             application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_question))
             
+            # Время выполнения каждого обработчика - в метрики Prometheus
+            instrument_handlers(application)
+            # Спаны обработчиков внутри трейса обновления (tracing.py)
+            trace_handlers(application)
+            
             # Обработчик ошибок
             application.add_error_handler(self.error_handler)
             
@@ -804,27 +903,27 @@ _{topic['description']}_
             logger.info("🤖 AI Learning Bot запущен!")
             
             await application.initialize()
-            
+            await self.health.start(application)
+
+            # SIGTERM (docker stop) и SIGINT завершают работу штатно, а не через kill
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    loop.add_signal_handler(sig, stop_event.set)
+                except NotImplementedError:
+                    # Windows: обработчики сигналов event loop не поддерживаются
+                    signal.signal(sig, lambda s, f: loop.call_soon_threadsafe(stop_event.set))
+
             try:
                 await application.updater.start_polling()
                 await application.start()
-                
-                # Ждем бесконечно
-                stop_signals = (signal.SIGTERM, signal.SIGINT)
-                if stop_signals:
-                    for sig in stop_signals:
-                        signal.signal(sig, lambda s, f: None)
-                
+
                 # Блокируемся до сигнала
-                while True:
-                    await asyncio.sleep(1)
-                    
-            except KeyboardInterrupt:
+                await stop_event.wait()
                 logger.info("👋 Получен сигнал остановки")
             finally:
-                await application.stop()
-                await application.updater.stop()
-                await application.shutdown()
+                await self.shutdown(application)
         
         # Запуск в новом event loop
         try:
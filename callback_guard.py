@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+CallbackKey = Tuple[int, str]
+
+
+class CallbackGuard:
+    """Подавление повторных нажатий кнопок и повторно доставленных обновлений.
+
+    Регистрируется двумя TypeHandler: before - в группе до всех обработчиков,
+    after - в группе после них. Повторное нажатие той же кнопки тем же
+    пользователем (user_id, callback_data) отбрасывается, пока первое нажатие
+    обрабатывается, и еще window секунд после завершения. Если обработчик
+    передал работу в фоновую задачу, hold продлевает занятость до ее конца.
+
+    Обновления с уже виденным update_id (повторная доставка webhook)
+    отбрасываются целиком.
+    """
+
+    def __init__(self, window: Optional[float] = None, max_update_ids: Optional[int] = None,
+                 stale_after: float = 300.0):
+        self.window = window if window is not None else float(os.getenv('CALLBACK_DEDUP_WINDOW', '2'))
+        self.max_update_ids = max_update_ids or int(os.getenv('UPDATE_DEDUP_SIZE', '1024'))
+        # Защита от "вечной" занятости, если after по какой-то причине не вызвался
+        self.stale_after = stale_after
+
+        self._active: Dict[CallbackKey, float] = {}
+        self._held: Dict[CallbackKey, int] = {}
+        self._finished_at: Dict[CallbackKey, float] = {}
+        self._update_ids: "OrderedDict[int, None]" = OrderedDict()
+
+        # Статистика
+        self.duplicate_taps = 0
+        self.duplicate_updates = 0
+
+    async def before(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Проверка до обработчиков: дубликаты останавливают обработку обновления"""
+        if self._seen_update(update.update_id):
+            self.duplicate_updates += 1
+            logger.info(f"🔁 Повторное обновление {update.update_id} отброшено")
+            raise ApplicationHandlerStop
+
+        key = self._key(update)
+        if key is None:
+            return
+
+        if self._is_busy(key):
+            self.duplicate_taps += 1
+            logger.info(f"🔁 Повторное нажатие {key[1]} пользователем {key[0]} отброшено")
+            try:
+                await update.callback_query.answer("⏳ Уже выполняется...")
+            except Exception:
+                pass
+            raise ApplicationHandlerStop
+
+        self._active[key] = time.monotonic()
+
+    async def after(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка нажатия завершена (если работа не передана в фоновую задачу)"""
+        key = self._key(update)
+        if key is not None and key in self._active and not self._held.get(key):
+            self._release(key)
+
+    def hold(self, update: Update, task: Optional[asyncio.Task]):
+        """Считать нажатие выполняющимся, пока не завершится фоновая задача"""
+        key = self._key(update)
+        if key is None or task is None or task.done():
+            return
+        self._held[key] = self._held.get(key, 0) + 1
+        self._active.setdefault(key, time.monotonic())
+
+        def done(_):
+            self._held[key] -= 1
+            if self._held[key] <= 0:
+                del self._held[key]
+                self._release(key)
+
+        task.add_done_callback(done)
+
+    def _is_busy(self, key: CallbackKey) -> bool:
+        now = time.monotonic()
+        started = self._active.get(key)
+        if started is not None:
+            if now - started < self.stale_after:
+                return True
+            # Зависшая отметка - считаем нажатие завершенным
+            self._active.pop(key, None)
+        finished = self._finished_at.get(key)
+        return finished is not None and now - finished < self.window
+
+    def _release(self, key: CallbackKey):
+        self._active.pop(key, None)
+        now = time.monotonic()
+        self._finished_at[key] = now
+        # Убираем отметки старше окна, чтобы словарь не рос
+        if len(self._finished_at) > self.max_update_ids:
+            for old_key, finished in list(self._finished_at.items()):
+                if now - finished >= self.window:
+                    del self._finished_at[old_key]
+
+    def _seen_update(self, update_id: Optional[int]) -> bool:
+        if update_id is None:
+            return False
+        if update_id in self._update_ids:
+            return True
+        self._update_ids[update_id] = None
+        if len(self._update_ids) > self.max_update_ids:
+            self._update_ids.popitem(last=False)
+        return False
+
+    @staticmethod
+    def _key(update: Update) -> Optional[CallbackKey]:
+        query = update.callback_query
+        if query is None or query.from_user is None or not query.data:
+            return None
+        return query.from_user.id, query.data
@@ -3,11 +3,14 @@ import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, select
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, DateTime, Boolean, Float, ForeignKey, select
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
+from metrics import instrument_engine
+from tracing import trace_engine
+
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
@@ -70,10 +73,82 @@ class LearningMaterial(Base):
     # Отношения
     topic = relationship("Topic")
 
+class MaterialPage(Base):
+    """Готовая к отправке страница материалов темы (HTML Telegram с заголовком части)"""
+    __tablename__ = 'material_pages'
+
+    id = Column(Integer, primary_key=True)
+    topic_id = Column(Integer, ForeignKey('topics.id'), index=True)
+    page_number = Column(Integer, nullable=False)
+    sections = Column(String(200))  # ключи разделов на странице через запятую
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MaterialDocument(Base):
+    """file_id загруженного в Telegram файла с материалами темы (для повторной отправки без загрузки)"""
+    __tablename__ = 'material_documents'
+
+    id = Column(Integer, primary_key=True)
+    topic_id = Column(Integer, ForeignKey('topics.id'), index=True)
+    version = Column(String(40), nullable=False)  # время создания страниц материалов
+    file_id = Column(String(200), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MaterialChunk(Base):
+    """Фрагмент материалов темы для поиска контекста к вопросам (material_index.py)"""
+    __tablename__ = 'material_chunks'
+
+    id = Column(Integer, primary_key=True)
+    topic_id = Column(Integer, ForeignKey('topics.id'), index=True)
+    section = Column(String(20))
+    position = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    terms = Column(Text, nullable=False)  # термы BM25 через пробел - индекс строится без повторной разборки
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class QuestionAnswer(Base):
+    """Ответ Grok на вопрос по теме - повторно отдается на похожие вопросы (question_index.py)"""
+    __tablename__ = 'question_answers'
+
+    id = Column(Integer, primary_key=True)
+    topic_id = Column(Integer, ForeignKey('topics.id'), index=True)
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class BotState(Base):
+    """Состояние диалога (user_data/chat_data) в JSON - общее для всех реплик бота"""
+    __tablename__ = 'bot_state'
+
+    kind = Column(String(10), primary_key=True)  # 'user' или 'chat'
+    object_id = Column(BigInteger, primary_key=True)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class GrokCall(Base):
+    """Журнал вызовов Grok API: токены, время, стоимость (usage_ledger.py)"""
+    __tablename__ = 'grok_calls'
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    operation = Column(String(30), nullable=False)  # 'topics', 'materials', 'repair', 'answer', 'news'
+    model = Column(String(50))
+    backend = Column(String(50))  # ключ/адрес API из пула (llm_pool.py)
+    topic_id = Column(Integer, ForeignKey('topics.id'), nullable=True, index=True)
+    status = Column(String(20), nullable=False)  # HTTP-код, 'error' или 'timeout'
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    latency_ms = Column(Integer, default=0)
+    retries = Column(Integer, default=0)
+    cache = Column(String(20))  # 'miss' - вызов после промаха кеша, 'none' - путь без кеша
+    cost_usd = Column(Float, default=0.0)
+
 class Database:
     def __init__(self):
         self.database_url = os.getenv('DATABASE_URL', 'postgresql://ai_bot:password@db:5432/ai_learning')
         self.engine = create_async_engine(self.database_url)
+        instrument_engine(self.engine)
+        trace_engine(self.engine)
         self.async_session = sessionmaker(self.engine, class_=AsyncSession)
         
     async def init_db(self):
@@ -86,6 +161,21 @@ class Database:
             logger.error(f"Ошибка инициализации БД: {e}")
             raise
 
+    async def close(self):
+        """Закрыть соединения пула (при остановке бота)"""
+        await self.engine.dispose()
+        logger.info("База данных отключена")
+
+    def pool_status(self) -> Dict:
+        """Состояние пула соединений (без запросов к БД)"""
+        pool = self.engine.pool
+        status = {'pool': type(pool).__name__}
+        for name in ('size', 'checkedout', 'overflow', 'checkedin'):
+            method = getattr(pool, name, None)
+            if method is not None:
+                status[name] = method()
+        return status
+
     async def register_user(self, telegram_id: int, username: str) -> bool:
         """Регистрация пользователя или обновление информации о существующем"""
         try:
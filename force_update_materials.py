@@ -3,7 +3,7 @@
 
 import asyncio
 import os
-from database import Database, LearningMaterial
+from database import Database, LearningMaterial, MaterialPage, MaterialChunk
 from grok_service import GrokService
 from topic_service import TopicService
 
@@ -42,11 +42,17 @@ async def force_update_materials():
             
             print(f'📖 Обрабатываем тему: {topic.title}')
             
-            # Удаляем старые материалы
+            # Удаляем старые материалы и страницы
             print('🗑️ Удаляем старые материалы...')
             await session.execute(
                 delete(LearningMaterial).where(LearningMaterial.topic_id == topic_id)
             )
+            await session.execute(
+                delete(MaterialPage).where(MaterialPage.topic_id == topic_id)
+            )
+            await session.execute(
+                delete(MaterialChunk).where(MaterialChunk.topic_id == topic_id)
+            )
             await session.commit()
             
     # Генерируем новые материалы вне сессии
@@ -57,7 +63,7 @@ async def force_update_materials():
         print(f'✅ Получено от Grok: {len(str(materials))} символов')
         
         # Сохраняем в базу
-        await topic_service._save_materials_to_db(topic_id, materials)
+        await topic_service._save_materials_to_db(topic_dict, materials)
         print('💾 Материалы сохранены в базу данных')
         
         print('✅ Материалы полностью обновлены!')
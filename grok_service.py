@@ -2,21 +2,237 @@ import os
 import json
 import logging
 import asyncio
+import time
 import aiohttp
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from metrics import GROK_DURATION, GROK_TOKENS
+from tracing import annotate, span
+from logging_setup import log_payload
+from llm_pool import LLMPool, NoBackendAvailable, RETRYABLE_STATUSES
+from model_router import ModelRouter
+from usage_ledger import call_context
+from token_budget import ANSWER_MAX_CHARS, budget, estimate_messages, estimate_tokens, finish_cleanly, trim_to_tokens
+
 logger = logging.getLogger(__name__)
 
+MATERIALS_SYSTEM_PROMPT = "Ты эксперт-преподаватель по искусственному интеллекту. Создавай качественные, структурированные материалы для быстрого изучения технологий. ВСЯ ИНФОРМАЦИЯ И МАТЕРИАЛЫ ДОЛЖНЫ БЫТЬ НА РУССКОМ ЯЗЫКЕ."
+
+# Содержание разделов материалов (для дописывания пропущенных разделов)
+MATERIAL_SECTIONS = {
+    'tutorial': "Краткое введение и подробное объяснение темы (3-4 абзаца), основные концепции, пошаговый план изучения.",
+    'links': "Официальная документация, GitHub репозитории, статьи и руководства - списком со ссылками [название](URL).",
+    'courses': "YouTube видео и онлайн курсы - списком со ссылками [платформа - название](URL).",
+    'examples': "2-3 практических примера кода с комментариями на русском языке и объяснением.",
+}
+
 class GrokService:
     def __init__(self):
-        self.api_key = os.getenv('GROK_API_KEY')
-        self.base_url = 'https://api.x.ai/v1/chat/completions'
-        self.headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
+        # Ключи и адреса API: запросы распределяются по бэкендам с учетом лимитов и ошибок (llm_pool.py).
+        # У каждого бэкенда свой пул соединений; закрываются в close()
+        self.pool = LLMPool.from_env()
+
+        # Состояние API для проверки здоровья (без платных запросов)
+        self.failure_threshold = int(os.getenv('GROK_FAILURE_THRESHOLD', '3'))
+        self.consecutive_failures = 0
+        self.total_calls = 0
+        self.total_failures = 0
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+        # Журнал вызовов с токенами и стоимостью (usage_ledger.py); подключает бот
+        self.ledger = None
+        # Выбор модели и таймаута по операции (быстрая или сильная модель)
+        self.router = ModelRouter()
+
+    @property
+    def base_url(self) -> str:
+        """Адрес основного API (бэкенды из GROK_API_KEY/GROK_API_KEYS)"""
+        return self.pool.backends[0].url
+
+    @base_url.setter
+    def base_url(self, url: str):
+        current = self.base_url
+        for backend in self.pool.backends:
+            if backend.url == current:
+                backend.url = url
+
+    @asynccontextmanager
+    async def _post(self, payload: Dict, operation: str, topic_id: Optional[int] = None,
+                    stream_usage: Optional[Dict] = None, timeout: Optional[float] = None):
+        """Запрос к API с учетом успешных и неудачных вызовов, времени и токенов.
+
+        Бэкенд выбирает пул; при 429, 5xx, таймауте или ошибке соединения
+        запрос повторяется на другом бэкенде, пока такие есть. Каждая
+        попытка попадает в метрики и журнал вызовов.
+
+        Для потокового ответа (stream=True) usage заполняет вызывающий код
+        (_read_stream) в stream_usage; токены и журнал записываются после
+        чтения потока. timeout - общий лимит запроса для уровня модели (model_router.py).
+        """
+        model = payload.get('model')
+        options = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        tried: List[str] = []
+        with span(f'grok.{operation}', model=model, max_tokens=payload.get('max_tokens')) as grok_span:
+            while True:
+                try:
+                    backend = await self.pool.acquire(exclude=tried)
+                except NoBackendAvailable:
+                    self._record_call(False)
+                    raise
+                tried.append(backend.name)
+                can_fail_over = self.pool.has_alternative(tried)
+                retries = len(tried) - 1
+                responded = False
+                started = time.perf_counter()
+                backend.in_flight += 1
+                try:
+                    async with backend.session().post(backend.url, headers=backend.headers,
+                                                      json=backend.prepare(payload), **options) as response:
+                        status = str(response.status)
+                        GROK_DURATION.labels(operation, status).observe(time.perf_counter() - started)
+                        backend.record_response(response.status, time.perf_counter() - started, response.headers)
+                        if response.status in RETRYABLE_STATUSES and can_fail_over:
+                            self._record_result(operation, status, started, model, topic_id, {}, backend.name, retries)
+                            self.pool.failovers += 1
+                            logger.warning(f"🔀 Grok {operation}: HTTP {status} от {backend.name}, пробуем другой бэкенд")
+                            continue
+
+                        self._record_call(response.status == 200)
+                        if grok_span is not None:
+                            grok_span.set(status_code=response.status, backend=backend.name, attempts=len(tried))
+                        responded = True
+                        if not payload.get('stream'):
+                            usage = await self._read_usage(response) if response.status == 200 else {}
+                            # Время до полного ответа (тело уже прочитано для usage)
+                            self._record_result(operation, status, started, model, topic_id, usage,
+                                                backend.name, retries)
+                            yield response
+                        else:
+                            try:
+                                yield response
+                            finally:
+                                self._record_result(operation, status, started, model, topic_id,
+                                                    stream_usage or {}, backend.name, retries)
+                        return
+                except Exception as e:
+                    if responded:
+                        raise
+                    GROK_DURATION.labels(operation, 'error').observe(time.perf_counter() - started)
+                    backend.requests += 1
+                    backend.record_failure()
+                    status = 'timeout' if isinstance(e, asyncio.TimeoutError) else 'error'
+                    self._record_result(operation, status, started, model, topic_id, {}, backend.name, retries)
+                    if can_fail_over and isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                        self.pool.failovers += 1
+                        logger.warning(f"🔀 Grok {operation}: {type(e).__name__} от {backend.name}, пробуем другой бэкенд")
+                        continue
+                    self._record_call(False)
+                    raise
+                finally:
+                    backend.in_flight -= 1
+
+    @staticmethod
+    async def _read_usage(response: aiohttp.ClientResponse) -> Dict:
+        """Поле usage ответа (тело кешируется aiohttp и читается вызывающим повторно)"""
+        try:
+            return (await response.json()).get('usage') or {}
+        except Exception:
+            return {}
+
+    def _record_result(self, operation: str, status: str, started: float, model: Optional[str],
+                       topic_id: Optional[int], usage: Dict, backend: Optional[str] = None, retries: int = 0):
+        """Токены в метрики и трейс, вызов - в журнал (usage_ledger.py)"""
+        for kind in ('prompt_tokens', 'completion_tokens'):
+            if usage.get(kind):
+                GROK_TOKENS.labels(operation, kind.split('_')[0]).inc(usage[kind])
+                annotate(**{kind: usage[kind]})
+        if self.ledger:
+            self.ledger.record(
+                operation, status, time.perf_counter() - started, model=model, topic_id=topic_id,
+                prompt_tokens=usage.get('prompt_tokens') or 0,
+                completion_tokens=usage.get('completion_tokens') or 0,
+                retries=retries, backend=backend
+            )
+
+    @staticmethod
+    async def _read_stream(response: aiohttp.ClientResponse, payload: Dict, max_chars: int,
+                           usage: Dict) -> str:
+        """Текст потокового ответа (SSE); чтение прекращается, как только набрано max_chars символов.
+
+        Закрытие соединения останавливает генерацию - лишние токены не
+        оплачиваются и не ждутся. Ответ обрезается по концу предложения.
+        usage заполняется из последнего фрагмента потока, а при досрочной
+        остановке - оценкой token_budget.
+        """
+        if response.content_type == 'application/json':
+            # Прокси или API вернули обычный ответ вместо потока
+            data = await response.json()
+            usage.update(data.get('usage') or {})
+            text = data['choices'][0]['message']['content']
+            finish_reason = data['choices'][0].get('finish_reason')
+            return finish_cleanly(text, max_chars) if len(text) > max_chars or finish_reason == 'length' else text
+
+        parts: List[str] = []
+        length = 0
+        finish_reason = None
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            if chunk.get('usage'):
+                usage.update(chunk['usage'])
+            for choice in chunk.get('choices') or []:
+                delta = (choice.get('delta') or {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    length += len(delta)
+                finish_reason = choice.get('finish_reason') or finish_reason
+            if length >= max_chars:
+                finish_reason = 'budget'
+                break
+
+        text = ''.join(parts)
+        if finish_reason in ('budget', 'length'):
+            annotate(stopped_early=finish_reason)
+            text = finish_cleanly(text, max_chars)
+        if not usage:
+            usage.update(prompt_tokens=estimate_messages(payload['messages']),
+                         completion_tokens=estimate_tokens(''.join(parts)))
+        return text
+
+    def _record_call(self, success: bool):
+        self.total_calls += 1
+        if success:
+            self.consecutive_failures = 0
+            self.last_success_at = time.monotonic()
+        else:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            self.last_failure_at = time.monotonic()
+
+    def health(self) -> Dict:
+        """Состояние API по последним вызовам: failing после failure_threshold ошибок подряд"""
+        now = time.monotonic()
+        return {
+            'state': 'failing' if self.consecutive_failures >= self.failure_threshold else 'ok',
+            'consecutive_failures': self.consecutive_failures,
+            'total_calls': self.total_calls,
+            'total_failures': self.total_failures,
+            'last_success_age': round(now - self.last_success_at, 1) if self.last_success_at else None,
+            'last_failure_age': round(now - self.last_failure_at, 1) if self.last_failure_at else None,
+            'backends': self.pool.snapshot(),
         }
 
+    async def close(self):
+        """Закрыть пулы соединений бэкендов (при остановке бота)"""
+        await self.pool.close()
+
     async def generate_ai_topics(self, category: str = "general") -> List[Dict]:
         """Генерация списка актуальных тем по ИИ"""
         
@@ -69,54 +285,55 @@ class GrokService:
 Упорядочи по актуальности на текущую дату.
             """
 
+        tier = self.router.tier_for('topics')
         try:
-            async with aiohttp.ClientSession() as session:
-                payload = {
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "Ты эксперт по искусственному интеллекту и современным технологиям. Создавай только реалистичные и практические темы на основе существующих технологий. ВСЯ ИНФОРМАЦИЯ ДОЛЖНА БЫТЬ НА РУССКОМ ЯЗЫКЕ, включая названия, описания и все тексты."
-                        },
-                        {
-                            "role": "user", 
-                            "content": prompt
-                        }
-                    ],
-                    "model": "grok-4-latest",
-                    "stream": False,
-                    "temperature": 0.3
-                }
+            payload = {
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": "Ты эксперт по искусственному интеллекту и современным технологиям. Создавай только реалистичные и практические темы на основе существующих технологий. ВСЯ ИНФОРМАЦИЯ ДОЛЖНА БЫТЬ НА РУССКОМ ЯЗЫКЕ, включая названия, описания и все тексты."
+                    },
+                    {
+                        "role": "user", 
+                        "content": prompt
+                    }
+                ],
+                "model": self.router.model(tier),
+                "stream": False,
+                "temperature": 0.3,
+                "max_tokens": budget('topics')['max_tokens']
+            }
 
-                async with session.post(self.base_url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        content = data['choices'][0]['message']['content']
+            async with self._post(payload, 'topics', timeout=self.router.timeout(tier)) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    content = data['choices'][0]['message']['content']
                         
-                        # Парсим JSON из ответа
-                        try:
-                            # Ищем JSON в ответе
-                            start = content.find('[')
-                            end = content.rfind(']') + 1
-                            if start != -1 and end != 0:
-                                json_str = content[start:end]
-                                topics = json.loads(json_str)
+                    # Парсим JSON из ответа
+                    try:
+                        # Ищем JSON в ответе
+                        start = content.find('[')
+                        end = content.rfind(']') + 1
+                        if start != -1 and end != 0:
+                            json_str = content[start:end]
+                            topics = json.loads(json_str)
                                 
-                                # Добавляем категорию к каждой теме
-                                for topic in topics:
-                                    topic['category'] = category
+                            # Добавляем категорию к каждой теме
+                            for topic in topics:
+                                topic['category'] = category
                                 
-                                logger.info(f"Сгенерировано {len(topics)} тем для категории {category}")
-                                return topics
-                            else:
-                                logger.error("JSON не найден в ответе Grok")
-                                return []
-                                
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Ошибка парсинга JSON: {e}")
+                            logger.info(f"Сгенерировано {len(topics)} тем для категории {category}")
+                            return topics
+                        else:
+                            logger.error("JSON не найден в ответе Grok")
                             return []
-                    else:
-                        logger.error(f"Ошибка API Grok: {response.status}")
+                                
+                    except json.JSONDecodeError as e:
+                        logger.error(f"Ошибка парсинга JSON: {e}")
                         return []
+                else:
+                    logger.error(f"Ошибка API Grok: {response.status}")
+                    return []
                         
         except Exception as e:
             logger.error(f"Ошибка генерации тем: {e}")
@@ -124,11 +341,13 @@ class GrokService:
 
     async def generate_learning_materials(self, topic: Dict) -> Dict:
         """Генерация материалов для изучения темы"""
+        limits = budget('materials')
+        description = trim_to_tokens(topic.get('description', ''), limits['description'])
         
         prompt = f"""
 Создай подробные материалы для изучения темы: "{topic['title']}"
 
-Описание темы: {topic.get('description', '')}
+Описание темы: {description}
 Время изучения: {topic.get('learning_time', '1-3 дня')}
 Уровень: {topic.get('difficulty', 'Средний')}
 
@@ -169,52 +388,83 @@ class GrokService:
 Убедись, что все ссылки ведут на реальные, существующие ресурсы. Если не уверен в URL, используй заглушки вида [найди: "ключевые слова для поиска"].
 """
 
+        tier = self.router.tier_for('materials')
         try:
-            async with aiohttp.ClientSession() as session:
-                payload = {
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "Ты эксперт-преподаватель по искусственному интеллекту. Создавай качественные, структурированные материалы для быстрого изучения технологий. ВСЯ ИНФОРМАЦИЯ И МАТЕРИАЛЫ ДОЛЖНЫ БЫТЬ НА РУССКОМ ЯЗЫКЕ."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "model": "grok-4-latest", 
-                    "stream": False,
-                    "temperature": 0.2
-                }
+            payload = {
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": MATERIALS_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                "model": self.router.model(tier),
+                "stream": False,
+                "temperature": 0.2,
+                "max_tokens": limits['max_tokens']
+            }
 
-                async with session.post(self.base_url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        content = data['choices'][0]['message']['content']
-                        logger.info(f"Ответ от Grok API (первые 500 символов): {content[:500]}...")
-                        logger.info(f"ПОЛНЫЙ ОТВЕТ ОТ API: {content}")  # Добавили полное логирование
-                        
-                        # Парсим структурированный ответ
-                        materials = self._parse_materials(content)
-                        logger.info(f"Спарсенные материалы: tutorial={len(materials.get('tutorial', ''))}, links={len(materials.get('links', ''))}")
-                        return materials
-                    else:
-                        logger.error(f"Ошибка API при генерации материалов: {response.status}")
-                        error_text = await response.text()
-                        logger.error(f"Детали ошибки: {error_text}")
-                        return self._default_materials()
+            async with self._post(payload, 'materials', topic_id=topic.get('id'),
+                                  timeout=self.router.timeout(tier)) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    content = data['choices'][0]['message']['content']
+                    if data['choices'][0].get('finish_reason') == 'length':
+                        logger.warning(f"Материалы темы {topic.get('id')} уперлись в max_tokens={limits['max_tokens']}")
+                    # Полный ответ - только в выборке и с ограничением длины
+                    log_payload(logger, "Ответ Grok с материалами", content, topic=topic.get('title'))
                         
+                    # Парсим структурированный ответ
+                    sections = self._parse_sections(content)
+                else:
+                    logger.error(f"Ошибка API при генерации материалов: {response.status}")
+                    error_text = await response.text()
+                    logger.error(f"Детали ошибки: {error_text}")
+                    return self._default_materials()
+
+            # Досоздание разделов - уже после освобождения соединения и слота первого запроса
+            missing = [key for key, value in sections.items() if not value]
+            if missing and len(missing) < len(sections):
+                # Модель пропустила часть разделов - дописываем только их
+                sections.update(await self._repair_sections(topic, missing))
+            materials = self._fill_missing(sections)
+            logger.info(f"Спарсенные материалы: tutorial={len(materials.get('tutorial', ''))}, links={len(materials.get('links', ''))}")
+            return materials
+
         except Exception as e:
             logger.error(f"Ошибка генерации материалов: {e}")
             return self._default_materials()
 
-    async def answer_question(self, question: str, topic: Dict) -> str:
-        """Ответ на вопрос пользователя по текущей теме"""
+    async def answer_question(self, question: str, topic: Dict, context: Optional[str] = None) -> str:
+        """Ответ на вопрос пользователя по текущей теме.
+
+        context - фрагменты материалов темы, найденные по вопросу
+        (TopicService.get_question_context): модель опирается на то, что
+        пользователь уже читал, вместо одного описания темы.
+
+        Ответ читается потоком и укладывается в одно сообщение Telegram:
+        max_tokens рассчитан на ANSWER_MAX_CHARS, а набрав столько символов,
+        чтение прекращается и ответ заканчивается целым предложением.
+        """
+        limits = budget('answer')
+        description = trim_to_tokens(topic.get('description', ''), limits['description'])
+        question = trim_to_tokens(question, limits['question'])
+        materials = ''
+        if context:
+            materials = f"""
+Фрагменты учебных материалов темы, которые видел пользователь:
+{trim_to_tokens(context, limits['context'])}
+
+Опирайся на эти фрагменты, если они относятся к вопросу, и не противоречь им.
+"""
         
         prompt = f"""
 Пользователь изучает тему: "{topic['title']}"
-Описание темы: {topic.get('description', '')}
-
+Описание темы: {description}
+{materials}
 Вопрос пользователя: {question}
 
 Дай точный, краткий и полезный ответ на вопрос в контексте изучаемой темы НА РУССКОМ ЯЗЫКЕ.
@@ -226,41 +476,51 @@ class GrokService:
 - Все комментарии в коде должны быть на русском языке
         """
 
-        try:
-            async with aiohttp.ClientSession() as session:
+        messages = [
+            {
+                "role": "system", 
+                "content": "Ты эксперт-наставник по ИИ. Отвечай четко, кратко и полезно на вопросы учеников. ВСЕ ОТВЕТЫ ДОЛЖНЫ БЫТЬ НА РУССКОМ ЯЗЫКЕ."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+        # Короткий простой вопрос - быстрой модели; если она не справилась - сильной
+        attempts = self.router.attempts('answer', question)
+        for retries, tier in enumerate(attempts):
+            last_attempt = retries == len(attempts) - 1
+            try:
                 payload = {
-                    "messages": [
-                        {
-                            "role": "system", 
-                            "content": "Ты эксперт-наставник по ИИ. Отвечай четко, кратко и полезно на вопросы учеников. ВСЕ ОТВЕТЫ ДОЛЖНЫ БЫТЬ НА РУССКОМ ЯЗЫКЕ."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "model": "grok-4-latest",
-                    "stream": False,
-                    "temperature": 0.1
+                    "messages": messages,
+                    "model": self.router.model(tier),
+                    "stream": True,
+                    "stream_options": {"include_usage": True},
+                    "temperature": 0.1,
+                    "max_tokens": limits['max_tokens']
                 }
 
-                async with session.post(self.base_url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        answer = data['choices'][0]['message']['content']
-                        
-                        # Ограничиваем длину ответа для Telegram
-                        if len(answer) > 3000:
-                            answer = answer[:3000] + "..."
-                        
-                        return answer
-                    else:
-                        logger.error(f"Ошибка API при ответе на вопрос: {response.status}")
-                        return "❌ Извините, произошла ошибка при обработке вашего вопроса. Попробуйте позже."
-                        
-        except Exception as e:
-            logger.error(f"Ошибка ответа на вопрос: {e}")
-            return "❌ Произошла техническая ошибка. Пожалуйста, попробуйте задать вопрос позже."
+                usage = {}
+                with call_context(retries=retries):
+                    async with self._post(payload, 'answer', topic_id=topic.get('id'),
+                                          stream_usage=usage, timeout=self.router.timeout(tier)) as response:
+                        if response.status == 200:
+                            answer = await self._read_stream(response, payload, ANSWER_MAX_CHARS, usage)
+                            if answer.strip() or last_attempt:
+                                return answer
+                            self.router.escalate('answer', 'пустой ответ')
+                        elif last_attempt:
+                            logger.error(f"Ошибка API при ответе на вопрос: {response.status}")
+                            return "❌ Извините, произошла ошибка при обработке вашего вопроса. Попробуйте позже."
+                        else:
+                            self.router.escalate('answer', f'HTTP {response.status}')
+
+            except Exception as e:
+                if last_attempt:
+                    logger.error(f"Ошибка ответа на вопрос: {e}")
+                    return "❌ Произошла техническая ошибка. Пожалуйста, попробуйте задать вопрос позже."
+                self.router.escalate('answer', type(e).__name__)
 
     async def monitor_ai_news(self) -> List[Dict]:
         """Мониторинг новостей по ИИ технологиям"""
@@ -284,55 +544,103 @@ class GrokService:
 Верни в формате JSON массива объектов.
         """
 
+        tier = self.router.tier_for('news')
         try:
-            async with aiohttp.ClientSession() as session:
-                payload = {
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": f"Ты аналитик новостей в области ИИ. Сегодня {datetime.now().strftime('%d.%m.%Y')}. Предоставляй актуальную информацию из надежных источников. ВСЯ ИНФОРМАЦИЯ ДОЛЖНА БЫТЬ НА РУССКОМ ЯЗЫКЕ."
-                        },
-                        {
-                            "role": "user", 
-                            "content": prompt
-                        }
-                    ],
-                    "model": "grok-4-latest",
-                    "stream": False,
-                    "temperature": 0.3
-                }
+            payload = {
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": f"Ты аналитик новостей в области ИИ. Сегодня {datetime.now().strftime('%d.%m.%Y')}. Предоставляй актуальную информацию из надежных источников. ВСЯ ИНФОРМАЦИЯ ДОЛЖНА БЫТЬ НА РУССКОМ ЯЗЫКЕ."
+                    },
+                    {
+                        "role": "user", 
+                        "content": prompt
+                    }
+                ],
+                "model": self.router.model(tier),
+                "stream": False,
+                "temperature": 0.3,
+                "max_tokens": budget('news')['max_tokens']
+            }
 
-                async with session.post(self.base_url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        content = data['choices'][0]['message']['content']
+            async with self._post(payload, 'news', timeout=self.router.timeout(tier)) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    content = data['choices'][0]['message']['content']
                         
-                        # Парсим новости из ответа
-                        try:
-                            start = content.find('[')
-                            end = content.rfind(']') + 1
-                            if start != -1 and end != 0:
-                                json_str = content[start:end]
-                                news = json.loads(json_str)
-                                logger.info(f"Получено {len(news)} новостей по ИИ")
-                                return news
-                            else:
-                                logger.warning("Новости не найдены в ответе")
-                                return []
-                                
-                        except json.JSONDecodeError:
-                            logger.error("Ошибка парсинга новостей")
+                    # Парсим новости из ответа
+                    try:
+                        start = content.find('[')
+                        end = content.rfind(']') + 1
+                        if start != -1 and end != 0:
+                            json_str = content[start:end]
+                            news = json.loads(json_str)
+                            logger.info(f"Получено {len(news)} новостей по ИИ")
+                            return news
+                        else:
+                            logger.warning("Новости не найдены в ответе")
                             return []
-                    else:
-                        logger.error(f"Ошибка API при получении новостей: {response.status}")
+                                
+                    except json.JSONDecodeError:
+                        logger.error("Ошибка парсинга новостей")
                         return []
+                else:
+                    logger.error(f"Ошибка API при получении новостей: {response.status}")
+                    return []
                         
         except Exception as e:
             logger.error(f"Ошибка мониторинга новостей: {e}")
             return []
 
+    async def _repair_sections(self, topic: Dict, missing: List[str]) -> Dict:
+        """Дописать пропущенные разделы материалов (быстрая модель, при неудаче - сильная)"""
+        repaired = {}
+        attempts = self.router.attempts('repair')
+        for retries, tier in enumerate(attempts):
+            wanted = [key for key in missing if not repaired.get(key)]
+            formats = '\n'.join(f"### {key.upper()}\n{MATERIAL_SECTIONS[key]}" for key in wanted)
+            prompt = f"""
+Для темы "{topic['title']}" допиши только эти разделы учебных материалов НА РУССКОМ ЯЗЫКЕ,
+используя Markdown разметку и заголовки разделов ровно в таком виде:
+
+{formats}
+"""
+            payload = {
+                "messages": [
+                    {"role": "system", "content": MATERIALS_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                "model": self.router.model(tier),
+                "stream": False,
+                "temperature": 0.2,
+                "max_tokens": budget('repair')['max_tokens']
+            }
+            try:
+                with call_context(retries=retries):
+                    async with self._post(payload, 'repair', topic_id=topic.get('id'),
+                                          timeout=self.router.timeout(tier)) as response:
+                        if response.status == 200:
+                            data = await response.json()
+                            sections = self._parse_sections(data['choices'][0]['message']['content'])
+                            repaired.update({key: sections[key] for key in wanted if sections.get(key)})
+                        reason = f'HTTP {response.status}'
+            except Exception as e:
+                reason = type(e).__name__
+
+            still_missing = [key for key in missing if not repaired.get(key)]
+            if not still_missing:
+                logger.info(f"🩹 Разделы материалов темы {topic.get('id')} восстановлены: {', '.join(missing)}")
+                break
+            if retries < len(attempts) - 1:
+                self.router.escalate('repair', f"{reason}, нет разделов: {', '.join(still_missing)}")
+        return repaired
+
     def _parse_materials(self, content: str) -> Dict:
         """Парсинг структурированных материалов из ответа"""
+        return self._fill_missing(self._parse_sections(content))
+
+    def _parse_sections(self, content: str) -> Dict:
+        """Разделы материалов из ответа; пропущенные разделы - пустые строки"""
         materials = {
             'tutorial': '',
             'links': '', 
@@ -341,7 +649,7 @@ class GrokService:
         }
         
         try:
-            logger.info(f"Парсинг материалов, длина контента: {len(content)}")
+            logger.debug(f"Парсинг материалов, длина контента: {len(content)}")
             
             sections = {
                 '### TUTORIAL': 'tutorial',
@@ -364,27 +672,27 @@ class GrokService:
                 for section_marker, section_name in sections.items():
                     if line.startswith(section_marker):
                         current_section = section_name
-                        logger.info(f"Найдена секция: {section_marker}")
+                        logger.debug(f"Найдена секция: {section_marker}")
                         break
                 else:
                     # Добавляем содержимое к текущей секции
                     if current_section and line:
                         materials[current_section] += line + '\n'
-            
-            # Проверяем что получилось
-            for key, value in materials.items():
-                value = value.strip()
-                if not value:
-                    logger.warning(f"Секция {key} пустая, используем заглушку")
-                    materials[key] = "Материалы будут добавлены позже."
-                else:
-                    logger.info(f"Секция {key}: {len(value)} символов")
-                    materials[key] = value
+
+            return {key: value.strip() for key, value in materials.items()}
                     
         except Exception as e:
             logger.error(f"Ошибка парсинга материалов: {e}")
-            return self._default_materials()
-            
+            return {key: '' for key in materials}
+
+    def _fill_missing(self, materials: Dict) -> Dict:
+        """Заглушки вместо пустых разделов"""
+        for key, value in materials.items():
+            if not value:
+                logger.warning(f"Секция {key} пустая, используем заглушку")
+                materials[key] = "Материалы будут добавлены позже."
+            else:
+                logger.debug(f"Секция {key}: {len(value)} символов")
         return materials
 
     def _default_materials(self) -> Dict:
@@ -15,17 +15,24 @@ from typing import Dict, List, Tuple
 # Добавляем текущую директорию в путь для импорта модулей
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+# Загружаем переменные окружения из .env файла до импорта модулей бота:
+# часть настроек читается при импорте
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    print("⚠️ python-dotenv не установлен, переменные окружения должны быть установлены вручную")
+
 try:
     from database import Database
     from grok_service import GrokService  
     from topic_service import TopicService
+    from logging_setup import setup_logging, stop_logging
 except ImportError as e:
     print(f"❌ Ошибка импорта модулей: {e}")
     print("Убедитесь что установлены все зависимости: pip install -r requirements.txt")
     sys.exit(1)
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class SystemHealthCheck:
@@ -193,13 +200,6 @@ class SystemHealthCheck:
 
 async def main():
     """Главная функция"""
-    # Загружаем переменные окружения из .env файла
-    try:
-        from dotenv import load_dotenv
-        load_dotenv()
-    except ImportError:
-        print("⚠️ python-dotenv не установлен, переменные окружения должны быть установлены вручную")
-    
     # Создаем и запускаем проверки
     health_check = SystemHealthCheck()
     success = await health_check.run_all_checks()
@@ -211,4 +211,9 @@ async def main():
     sys.exit(0)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Разовая проверка: логи только в консоль
+    setup_logging(log_file=None)
+    try:
+        asyncio.run(main())
+    finally:
+        stop_logging()
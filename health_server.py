@@ -0,0 +1,115 @@
+import os
+import time
+import json
+import logging
+from typing import Dict, Optional
+
+from aiohttp import web
+
+from loop_monitor import LoopMonitor
+from metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class HealthServer:
+    """HTTP-проверки здоровья внутри процесса бота.
+
+    /health/live  - процесс жив и event loop не завис
+    /health/ready - бот принимает обновления (не запускается и не останавливается)
+    /metrics      - метрики Prometheus (metrics.py)
+
+    Ответ собирается только из данных в памяти: задержка event loop,
+    состояние пула соединений БД, ошибки Grok API по последним вызовам,
+    давность последнего обновления, число фоновых задач. Проверка не
+    обращается ни к БД, ни к Grok и стоит микросекунды.
+    """
+
+    def __init__(self, bot, host: Optional[str] = None, port: Optional[int] = None):
+        self.bot = bot
+        self.host = host or os.getenv('HEALTH_HOST', '0.0.0.0')
+        self.port = port if port is not None else int(os.getenv('HEALTH_PORT', '8080') or 0)
+        self.max_loop_lag = float(os.getenv('HEALTH_MAX_LOOP_LAG', '1'))
+        self.loop_monitor = LoopMonitor()
+        self.application = None
+        self.stopping = False
+        self.started_at = time.monotonic()
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, application=None):
+        """Запустить монитор event loop и HTTP-сервер (HEALTH_PORT=0 - без сервера)"""
+        self.application = application
+        self.loop_monitor.start()
+        if not self.port:
+            return
+
+        app = web.Application()
+        app.router.add_get('/health/live', self.live)
+        app.router.add_get('/health/ready', self.ready)
+        app.router.add_get('/health', self.ready)
+        app.router.add_get('/metrics', self.metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"🩺 Проверка здоровья: http://{self.host}:{self.port}/health/ready")
+
+    async def stop(self):
+        await self.loop_monitor.stop()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def snapshot(self) -> Dict:
+        """Состояние бота для проверок здоровья"""
+        now = time.monotonic()
+        last_update_at = self.bot.update_processor.last_update_at
+        application = self.application
+        return {
+            'uptime': round(now - self.started_at, 1),
+            'stopping': self.stopping,
+            'polling': bool(application and application.running
+                            and application.updater and application.updater.running),
+            'loop': self.loop_monitor.snapshot(),
+            'database': self.bot.db.pool_status(),
+            'grok': self.bot.grok_service.health(),
+            'last_update_age': round(now - last_update_at, 1) if last_update_at else None,
+            'updates': {
+                'active': self.bot.update_processor.active_updates,
+                'pending': self.bot.update_processor.pending_updates,
+            },
+            'background_tasks': self.bot.tasks.in_flight,
+        }
+
+    async def live(self, request: web.Request) -> web.Response:
+        """Живость: раз ответ пришел, event loop работает; монитор loop тоже должен тикать"""
+        loop = self.loop_monitor.snapshot()
+        last_tick = self.loop_monitor.last_tick_at
+        stalled = last_tick is not None and time.monotonic() - last_tick > self.loop_monitor.interval * 10
+        status = 503 if stalled else 200
+        return self._response(status, {'status': 'ok' if status == 200 else 'stalled', 'loop': loop})
+
+    async def ready(self, request: web.Request) -> web.Response:
+        """Готовность: бот забирает обновления и event loop не перегружен"""
+        snapshot = self.snapshot()
+        problems = []
+        if snapshot['stopping']:
+            problems.append('stopping')
+        if not snapshot['polling']:
+            problems.append('not_polling')
+        if snapshot['loop']['max_lag'] > self.max_loop_lag:
+            problems.append('loop_lag')
+        # Ошибки Grok не снимают готовность: меню, прогресс и сохраненные материалы работают без него
+        snapshot['status'] = 'ok' if not problems else 'unavailable'
+        snapshot['problems'] = problems
+        return self._response(200 if not problems else 503, snapshot)
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Метрики в формате Prometheus"""
+        rendered = render_metrics(self.bot)
+        response = web.Response(body=rendered['body'])
+        response.headers['Content-Type'] = rendered['content_type']
+        return response
+
+    @staticmethod
+    def _response(status: int, body: Dict) -> web.Response:
+        return web.json_response(body, status=status, dumps=lambda data: json.dumps(data, ensure_ascii=False))
@@ -0,0 +1,280 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = 'https://api.x.ai/v1/chat/completions'
+
+# Ответы, после которых запрос повторяется на другом бэкенде
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# Ключ не принимается - бэкенд выключается надолго
+AUTH_STATUSES = {401, 403}
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+class NoBackendAvailable(Exception):
+    """Все бэкенды выключены (ошибки) или исчерпали лимиты"""
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Секунды из Retry-After ("7") или x-ratelimit-reset-* ("1m30s", "250ms")"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class Backend:
+    """Один ключ API на одном OpenAI-совместимом адресе.
+
+    Свой пул соединений, свой лимит запросов в минуту (rpm), средняя
+    задержка ответа и состояние: после failure_threshold ошибок подряд
+    бэкенд выключается на время, растущее с каждым выключением; после 429
+    или исчерпанного x-ratelimit-remaining-requests - до сброса лимита.
+    """
+
+    def __init__(self, name: str, url: str, api_key: Optional[str], rpm: Optional[float] = None,
+                 max_connections: int = 20, model: Optional[str] = None, weight: float = 1.0,
+                 failure_threshold: int = 3):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        self.max_connections = max_connections
+        self.failure_threshold = failure_threshold
+        self.rpm = rpm
+        self.bucket = TokenBucket(rpm / 60, capacity=max(1.0, rpm / 10)) if rpm else None
+
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.consecutive_failures = 0
+        self.circuit_opens = 0
+        self.disabled_until = 0.0
+        self.limited_until = 0.0
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        return headers
+
+    def session(self) -> aiohttp.ClientSession:
+        """Пул соединений бэкенда (пересоздается в новом event loop)"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
+            self._session_loop = loop
+        return self._session
+
+    def prepare(self, payload: Dict) -> Dict:
+        """Тело запроса для бэкенда: локальные замены работают со своей моделью"""
+        if self.model:
+            return {**payload, 'model': self.model}
+        return payload
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд бэкенд сможет принять запрос"""
+        wait = max(0.0, self.disabled_until - now, self.limited_until - now)
+        if self.in_flight >= self.max_connections:
+            wait = max(wait, 0.05)
+        if self.bucket is not None:
+            wait = max(wait, self.bucket.wait_time())
+        return wait
+
+    def score(self) -> float:
+        """Ожидаемое время ответа с учетом очереди и недавних ошибок: меньше - лучше"""
+        latency = self.latency if self.latency is not None else 0.0
+        return (latency + 0.1) * (self.in_flight + 1) * (self.consecutive_failures + 1) / self.weight
+
+    def record_response(self, status: int, latency: float, headers=None):
+        self.requests += 1
+        headers = headers or {}
+        if status == 429:
+            self.rate_limited += 1
+            pause = parse_duration(headers.get('Retry-After')) or parse_duration(
+                headers.get('x-ratelimit-reset-requests')) or 10.0
+            self._limit(pause)
+            return
+        if status in AUTH_STATUSES:
+            self.failures += 1
+            self.disabled_until = time.monotonic() + 300
+            logger.error(f"🔑 Бэкенд {self.name}: ключ не принят (HTTP {status}), выключен на 5 мин.")
+            return
+        if status >= 500 or status == 408:
+            self.record_failure()
+            return
+
+        # Успех (или ошибка запроса 4xx, в которой бэкенд не виноват)
+        self.consecutive_failures = 0
+        self.latency = latency if self.latency is None else self.latency * 0.7 + latency * 0.3
+        if headers.get('x-ratelimit-remaining-requests') == '0':
+            self._limit(parse_duration(headers.get('x-ratelimit-reset-requests')) or 1.0)
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.circuit_opens += 1
+            cooldown = min(300.0, 10.0 * 2 ** (self.circuit_opens - 1))
+            self.disabled_until = time.monotonic() + cooldown
+            self.consecutive_failures = 0
+            logger.warning(f"⛔ Бэкенд {self.name} выключен на {cooldown:.0f} сек. после ошибок подряд")
+
+    def _limit(self, seconds: float):
+        self.limited_until = max(self.limited_until, time.monotonic() + seconds)
+        if self.bucket is not None:
+            self.bucket.pause(seconds)
+        logger.info(f"🐢 Бэкенд {self.name}: лимит запросов, пауза {seconds:.1f} сек.")
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        return {
+            'name': self.name,
+            'available_in': round(self.wait_time(now), 1),
+            'in_flight': self.in_flight,
+            'latency': round(self.latency, 2) if self.latency is not None else None,
+            'requests': self.requests,
+            'failures': self.failures,
+            'rate_limited': self.rate_limited,
+        }
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class LLMPool:
+    """Пул бэкендов Grok API (и OpenAI-совместимых замен).
+
+    Запрос уходит на доступный бэкенд с наименьшим ожидаемым временем
+    ответа: средняя задержка с учетом запросов в работе и веса. Бэкенды
+    в паузе по лимиту или выключенные после ошибок пропускаются; если
+    недоступны все, запрос ждет ближайший до max_wait секунд. Повтор на
+    другом бэкенде делает GrokService._post.
+    """
+
+    def __init__(self, backends: List[Backend], max_wait: Optional[float] = None):
+        if not backends:
+            raise ValueError("Нужен хотя бы один бэкенд")
+        self.backends = backends
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv('GROK_POOL_MAX_WAIT', '10'))
+        self.failovers = 0
+
+    @classmethod
+    def from_env(cls) -> 'LLMPool':
+        """Ключи GROK_API_KEYS (или GROK_API_KEY) к основному адресу плюс GROK_BACKENDS (JSON)"""
+        url = os.getenv('GROK_API_URL', DEFAULT_URL)
+        rpm = float(os.getenv('GROK_KEY_RPM', '0')) or None
+        max_connections = int(os.getenv('GROK_MAX_CONNECTIONS', '20'))
+        keys = [key.strip() for key in os.getenv('GROK_API_KEYS', '').split(',') if key.strip()]
+        if not keys:
+            keys = [os.getenv('GROK_API_KEY')]
+
+        backends = [
+            Backend(f'xai-{number}' if len(keys) > 1 else 'xai', url, key, rpm=rpm, max_connections=max_connections)
+            for number, key in enumerate(keys, 1)
+        ]
+        try:
+            extra = json.loads(os.getenv('GROK_BACKENDS', '') or '[]')
+        except ValueError as e:
+            logger.error(f"Некорректный GROK_BACKENDS, используем только основные ключи: {e}")
+            extra = []
+        if not isinstance(extra, list):
+            logger.error("GROK_BACKENDS должен быть JSON списком, используем только основные ключи")
+            extra = []
+        for number, spec in enumerate(extra, 1):
+            backend = cls._backend_from_spec(spec, number, max_connections)
+            if backend is not None:
+                backends.append(backend)
+        cls._make_names_unique(backends)
+        logger.info(f"🔀 Бэкенды Grok API: {', '.join(backend.name for backend in backends)}")
+        return cls(backends)
+
+    @staticmethod
+    def _backend_from_spec(spec, number: int, max_connections: int) -> Optional[Backend]:
+        """Бэкенд из элемента GROK_BACKENDS; некорректный элемент пропускается с ошибкой в логе"""
+        if not isinstance(spec, dict) or not isinstance(spec.get('url'), str) or not spec['url']:
+            logger.error(f"Пропускаем элемент {number} GROK_BACKENDS: нужен объект с полем url, получено {spec!r}")
+            return None
+        try:
+            rpm = float(spec['rpm']) if spec.get('rpm') else None
+            connections = int(spec.get('max_connections', max_connections))
+            weight = float(spec.get('weight', 1.0))
+            if connections < 1 or weight <= 0 or (rpm is not None and rpm <= 0):
+                raise ValueError("max_connections, weight и rpm должны быть положительными")
+        except (TypeError, ValueError) as e:
+            logger.error(f"Пропускаем элемент {number} GROK_BACKENDS ({spec.get('url')}): {e}")
+            return None
+        return Backend(
+            str(spec.get('name') or f'backend-{number}'), spec['url'], spec.get('key'),
+            rpm=rpm, max_connections=connections, model=spec.get('model'), weight=weight
+        )
+
+    @staticmethod
+    def _make_names_unique(backends: List[Backend]):
+        """Повторяющиеся имена получают суффикс: по имени исключаются уже опробованные бэкенды при повторе"""
+        seen = set()
+        for backend in backends:
+            name, suffix = backend.name, 2
+            while name in seen:
+                name, suffix = f'{backend.name}-{suffix}', suffix + 1
+            if name != backend.name:
+                logger.warning(f"Имя бэкенда {backend.name} ({backend.url}) уже занято, используем {name}")
+                backend.name = name
+            seen.add(name)
+
+    def has_alternative(self, tried: Iterable[str]) -> bool:
+        tried = set(tried)
+        return any(backend.name not in tried for backend in self.backends)
+
+    async def acquire(self, exclude: Iterable[str] = ()) -> Backend:
+        """Выбрать бэкенд для запроса (ждет, если все временно недоступны)"""
+        exclude = set(exclude)
+        candidates = [backend for backend in self.backends if backend.name not in exclude] or self.backends
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            now = time.monotonic()
+            ready = [backend for backend in candidates if backend.wait_time(now) == 0]
+            if ready:
+                backend = min(ready, key=Backend.score)
+                if backend.bucket is not None:
+                    backend.bucket.try_acquire()
+                return backend
+
+            wait = min(backend.wait_time(now) for backend in candidates)
+            if now + wait > deadline:
+                raise NoBackendAvailable(f"Все бэкенды Grok недоступны еще {wait:.0f} сек.")
+            await asyncio.sleep(wait)
+
+    def snapshot(self) -> List[Dict]:
+        return [backend.snapshot() for backend in self.backends]
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.close()
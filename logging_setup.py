@@ -0,0 +1,137 @@
+import os
+import copy
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Optional
+
+from tracing import current_span
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Большие тексты (ответы LLM) пишутся в лог выборочно и с ограничением длины
+PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.1'))
+PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '2000'))
+
+# Стандартные поля LogRecord - все остальные попадают в JSON как extra
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'trace_id'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись: время, уровень, логгер, сообщение, trace_id и extra-поля"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            data['trace_id'] = trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Запись в очередь без блокировки: форматирование и I/O - в потоке слушателя"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В вызывающем потоке только фиксируем сообщение, исключение и trace_id
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        span = current_span()
+        if span is not None:
+            record.trace_id = span.trace.trace_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Диск не успевает - теряем запись, но не останавливаем event loop
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None, log_file: Optional[str] = 'logs/bot.log') -> logging.handlers.QueueListener:
+    """Логи через очередь: обработчики (консоль, файл) работают в отдельном потоке.
+
+    LOG_FORMAT=json включает JSON и для консоли; в файл всегда пишется JSON.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    console = logging.StreamHandler()
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        console.setFormatter(JsonFormatter())
+    else:
+        console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+
+    if log_file:
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, encoding='utf-8',
+            maxBytes=int(os.getenv('LOG_FILE_MAX_MB', '20')) * 1024 * 1024,
+            backupCount=int(os.getenv('LOG_FILE_BACKUPS', '5'))
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level)
+    # Подробные логи HTTP-клиента Telegram не нужны даже при DEBUG
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Дописать записи из очереди и остановить поток (при завершении процесса)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_payload(logger: logging.Logger, label: str, text: str, **fields):
+    """Большой текст в лог: длина - всегда (DEBUG), сам текст - в выборке и обрезанным (INFO)"""
+    if random.random() < PAYLOAD_SAMPLE_RATE and logger.isEnabledFor(logging.INFO):
+        truncated = len(text) > PAYLOAD_MAX_CHARS
+        logger.info(
+            f"{label} ({len(text)} символов{', обрезано' if truncated else ''}): {text[:PAYLOAD_MAX_CHARS]}",
+            extra={'payload_chars': len(text), **fields}
+        )
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{label}: {len(text)} символов", extra={'payload_chars': len(text), **fields})
@@ -0,0 +1,125 @@
+import os
+import sys
+import math
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from itertools import islice
+from typing import Dict, Optional
+
+from metrics import LOOP_LAG, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """Задержка event loop и поиск блокирующего кода.
+
+    Таймер в loop просыпается каждые interval секунд; насколько позже
+    запланированного он проснулся - это задержка loop. Ее значения
+    копятся в окне для перцентилей и уходят в гистограмму Prometheus.
+
+    Сторожевой поток следит за тем же таймером снаружи: если loop не
+    тикал дольше block_threshold, значит какой-то callback его держит.
+    Поток снимает стек потока loop прямо во время блокировки и пишет его
+    в лог - по нему видно, какой синхронный код тормозит всех пользователей.
+    """
+
+    def __init__(self, interval: Optional[float] = None, block_threshold: Optional[float] = None,
+                 window: Optional[int] = None):
+        self.interval = interval if interval is not None else float(os.getenv('LOOP_MONITOR_INTERVAL', '0.5'))
+        self.block_threshold = block_threshold if block_threshold is not None else float(os.getenv('LOOP_BLOCK_THRESHOLD', '0.5'))
+        self.samples = deque(maxlen=window or int(os.getenv('LOOP_LAG_WINDOW', '1200')))
+        # За сколько последних секунд snapshot() показывает максимальную задержку
+        self.recent = float(os.getenv('LOOP_LAG_RECENT', '30'))
+        self.last_lag = 0.0
+        self.last_tick_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Сторожевой поток
+        self._watchdog: Optional[threading.Thread] = None
+        self._watchdog_stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._stall_reported = False
+        self.stalls = 0
+        self.last_stall_stack: Optional[str] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self.last_tick_at = time.monotonic()
+            self._task = asyncio.create_task(self._run(), name="loop_monitor")
+        if self.block_threshold > 0 and (self._watchdog is None or not self._watchdog.is_alive()):
+            self._loop_thread_id = threading.get_ident()
+            self._watchdog_stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop_watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        self._watchdog_stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_lag = max(0.0, now - started - self.interval)
+            self.last_tick_at = now
+            self.samples.append(self.last_lag)
+            LOOP_LAG.observe(self.last_lag)
+            if self._stall_reported:
+                self._stall_reported = False
+                logger.warning(f"🐌 Event loop снова работает, блокировка длилась ~{self.last_lag:.2f} сек.")
+
+    def _watch(self):
+        """Сторожевой поток: стек потока loop во время блокировки"""
+        check_interval = max(0.01, self.block_threshold / 2)
+        while not self._watchdog_stop.wait(check_interval):
+            last_tick = self.last_tick_at
+            if last_tick is None or self._stall_reported:
+                continue
+            blocked = time.monotonic() - last_tick - self.interval
+            if blocked < self.block_threshold:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            self._stall_reported = True
+            self.stalls += 1
+            self.last_stall_stack = stack
+            LOOP_STALLS.inc()
+            logger.warning(f"🐌 Event loop заблокирован уже {blocked:.2f} сек., стек:\n{stack}")
+
+    def percentiles(self) -> Dict:
+        """Перцентили задержки по окну последних измерений (секунды)"""
+        if not self.samples:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {name: round(ordered[min(last, int(last * q + 0.5))], 4)
+                for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))}
+
+    def recent_max(self) -> float:
+        """Максимальная задержка за последние recent секунд (секунды).
+
+        Измерения идут не чаще раза в interval, поэтому последние
+        recent / interval измерений покрывают не меньше recent секунд.
+        """
+        count = max(1, math.ceil(self.recent / self.interval))
+        return max(islice(reversed(self.samples), count), default=0.0)
+
+    def snapshot(self) -> Dict:
+        """Текущая и максимальная за последние recent секунд задержка (секунды); чтение ничего не сбрасывает"""
+        return {
+            'lag': round(self.last_lag, 4),
+            'max_lag': round(self.recent_max(), 4),
+            **self.percentiles(),
+            'stalls': self.stalls,
+            'running': self._task is not None and not self._task.done(),
+        }
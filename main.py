@@ -1,31 +1,25 @@
 import os
 import logging
 from dotenv import load_dotenv
-from bot import AILearningBot
-
-# Настройка логирования (до загрузки переменных)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  # Временно только в консоль
-    ]
-)
-
-logger = logging.getLogger(__name__)
 
 # Загрузка переменных окружения
-# Сначала загружаем .env, затем .env.local (приоритет у local)
+# Сначала загружаем .env, затем .env.local (приоритет у local).
+# До импорта модулей бота: часть настроек читается при импорте модулей
 load_dotenv()
-if os.path.exists('.env.local'):
+env_local = os.path.exists('.env.local')
+if env_local:
     load_dotenv('.env.local', override=True)
-    logger.info("📁 Загружены переменные из .env.local")
 
-# Создание директории для логов и добавление файлового логгера
-os.makedirs('logs', exist_ok=True)
-file_handler = logging.FileHandler('logs/bot.log', encoding='utf-8')
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-logging.getLogger().addHandler(file_handler)
+from bot import AILearningBot
+from logging_setup import setup_logging, stop_logging
+
+# Логи идут через очередь: запись в консоль и файл выполняется в отдельном
+# потоке и не блокирует event loop (файл logs/bot.log - JSON, с ротацией)
+setup_logging()
+
+logger = logging.getLogger(__name__)
+if env_local:
+    logger.info("📁 Загружены переменные из .env.local")
 
 def main():
     """Основная функция"""
@@ -49,6 +43,9 @@ def main():
     except Exception as e:
         logger.error(f"❌ Критическая ошибка: {e}")
         raise
+    finally:
+        # Дописываем оставшиеся в очереди записи
+        stop_logging()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,146 @@
+import os
+import re
+import math
+from collections import Counter
+from typing import Dict, List, Optional
+
+from token_budget import estimate_tokens
+
+# Размер фрагмента материалов для поиска (в токенах по оценке token_budget)
+CHUNK_TOKENS = int(os.getenv('MATERIAL_CHUNK_TOKENS', '160'))
+
+# Параметры BM25: насыщение частоты термина и нормировка по длине фрагмента
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r'[a-zа-яё0-9_+#]+')
+_CODE_BLOCK_RE = re.compile(r'```.*?(?:```|$)', re.DOTALL)
+_SENTENCE_RE = re.compile(r'(?<=[.!?…])\s+')
+
+# Служебные слова, которые есть почти в любом вопросе и фрагменте
+_STOP_WORDS = {
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так',
+    'его', 'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было',
+    'вот', 'от', 'меня', 'еще', 'нет', 'о', 'из', 'ему', 'ли', 'если', 'или', 'ни', 'быть', 'был',
+    'до', 'вас', 'нибудь', 'уже', 'для', 'это', 'этот', 'эта', 'эти', 'при', 'можно', 'нужно',
+    'какой', 'какие', 'чем', 'чего', 'где', 'когда', 'зачем', 'почему', 'такое', 'такой', 'мы', 'их', 'они',
+    'the', 'a', 'an', 'of', 'to', 'in', 'and', 'or', 'is', 'for', 'on', 'with', 'how', 'what',
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Термы для поиска: слова в нижнем регистре без служебных, с грубым стеммингом.
+
+    Русские слова усекаются до 6 символов - "эмбеддинги", "эмбеддингов"
+    и "эмбеддингам" дают один терм без словарей морфологии.
+    """
+    terms = []
+    for word in _WORD_RE.findall(text.lower().replace('ё', 'е')):
+        if word in _STOP_WORDS or len(word) < 2:
+            continue
+        if len(word) > 6 and not word.isascii():
+            word = word[:6]
+        terms.append(word)
+    return terms
+
+
+def chunk_materials(materials: Dict[str, str], chunk_tokens: int = CHUNK_TOKENS) -> List[Dict]:
+    """Разбивка разделов материалов на фрагменты по абзацам (блоки кода не разрываются)"""
+    chunks = []
+    for section, text in materials.items():
+        if not text or not text.strip():
+            continue
+        position = 0
+        current: List[str] = []
+        current_tokens = 0
+        for block in _blocks(text, chunk_tokens):
+            block_tokens = estimate_tokens(block)
+            if current and current_tokens + block_tokens > chunk_tokens:
+                chunks.append({'section': section, 'position': position, 'content': '\n\n'.join(current)})
+                position += 1
+                current, current_tokens = [], 0
+            current.append(block)
+            current_tokens += block_tokens
+        if current:
+            chunks.append({'section': section, 'position': position, 'content': '\n\n'.join(current)})
+    return chunks
+
+
+def _blocks(text: str, chunk_tokens: int) -> List[str]:
+    """Абзацы и блоки кода раздела"""
+    blocks = []
+    last = 0
+    for match in _CODE_BLOCK_RE.finditer(text):
+        blocks.extend(_paragraphs(text[last:match.start()], chunk_tokens))
+        blocks.append(match.group().strip())
+        last = match.end()
+    blocks.extend(_paragraphs(text[last:], chunk_tokens))
+    return blocks
+
+
+def _paragraphs(text: str, chunk_tokens: int) -> List[str]:
+    """Абзацы текста; слишком длинные делятся по предложениям"""
+    paragraphs = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= chunk_tokens:
+            paragraphs.append(paragraph)
+            continue
+        current = ''
+        for sentence in _SENTENCE_RE.split(paragraph):
+            if current and estimate_tokens(current) + estimate_tokens(sentence) > chunk_tokens:
+                paragraphs.append(current)
+                current = ''
+            current = f'{current} {sentence}' if current else sentence
+        if current:
+            paragraphs.append(current)
+    return paragraphs
+
+
+class BM25Index:
+    """BM25 по фрагментам материалов одной темы (десятки фрагментов - считается в памяти)"""
+
+    def __init__(self, chunks: List[Dict]):
+        self.chunks = chunks
+        self.term_counts = [Counter(chunk.get('terms') or tokenize(chunk['content'])) for chunk in chunks]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(chunks)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def search(self, query: str, limit: int = 5) -> List[Dict]:
+        """Фрагменты по убыванию релевантности (только с совпавшими термами)"""
+        terms = set(tokenize(query))
+        if not terms or not self.chunks:
+            return []
+        scored = []
+        for chunk, counts, length in zip(self.chunks, self.term_counts, self.lengths):
+            score = 0.0
+            for term in terms:
+                frequency = counts.get(term)
+                if not frequency:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self.average_length or 1))
+                score += self.idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+            if score > 0:
+                scored.append((score, chunk))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [dict(chunk, score=round(score, 3)) for score, chunk in scored[:limit]]
+
+    def context(self, query: str, max_tokens: int, limit: int = 5) -> Optional[str]:
+        """Самые релевантные фрагменты в пределах бюджета токенов (в порядке релевантности)"""
+        selected = []
+        used = 0
+        for chunk in self.search(query, limit):
+            tokens = estimate_tokens(chunk['content'])
+            if used + tokens > max_tokens:
+                continue
+            selected.append(chunk['content'])
+            used += tokens
+        return '\n\n---\n\n'.join(selected) if selected else None
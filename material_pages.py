@@ -0,0 +1,116 @@
+import re
+from typing import Dict, List, Tuple
+
+from message_splitter import split_html, visible_length, MAX_MESSAGE_LENGTH
+from telegram_markdown import markdown_to_html, html_to_text, escape_html
+
+# Запас длины под заголовок части "📄 Часть i/N"
+PART_HEADER_RESERVE = 32
+
+# Разделы материалов темы: ключ в словаре материалов, заголовок в сообщении и подпись кнопки
+MATERIAL_SECTIONS = [
+    ('tutorial', '📚 Материалы для изучения', '📚 Теория'),
+    ('links', '🔗 Полезные ссылки', '🔗 Ссылки'),
+    ('courses', '🎥 Видео и курсы', '🎥 Курсы'),
+    ('examples', '💡 Практические примеры', '💡 Примеры'),
+]
+
+_PART_HEADER_RE = re.compile(r'^📄 Часть \d+/\d+\n\n')
+
+# Оформление файла с материалами: переносы строк Telegram HTML сохраняются через pre-wrap
+_DOCUMENT_TEMPLATE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; white-space: pre-wrap; max-width: 48em; margin: 2em auto; padding: 0 1em; line-height: 1.5; }}
+pre {{ background: #f4f4f4; padding: 0.75em; overflow-x: auto; }}
+blockquote {{ border-left: 3px solid #ccc; margin: 0; padding-left: 1em; color: #555; }}
+</style>
+</head>
+<body>{body}</body>
+</html>
+"""
+
+# Раздел с названием и описанием темы (до первого раздела материалов)
+OVERVIEW_SECTION = 'overview'
+
+
+def format_topic_materials(topic: Dict, materials: Dict) -> str:
+    """Форматирование материалов темы в Markdown"""
+    lines = [
+        f"**📖 {topic['title']}**",
+        "",
+        f"_{topic.get('description', '')}_",
+        "",
+        f"⏱️ **Время изучения:** {topic.get('learning_time', '')}",
+        f"📊 **Сложность:** {topic.get('difficulty', '')}",
+    ]
+    for key, title, _ in MATERIAL_SECTIONS:
+        lines += ["", f"**{title}:**", materials.get(key, '')]
+    return '\n'.join(lines)
+
+
+def split_rendered(rendered: str, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Разбивка готового HTML на части с запасом под заголовок части"""
+    if visible_length(rendered) <= max_length:
+        return [rendered]
+    return split_html(rendered, max_length - PART_HEADER_RESERVE)
+
+
+def with_part_headers(parts: List[str]) -> List[str]:
+    """Добавить заголовки "📄 Часть i/N" к частям длинного сообщения"""
+    if len(parts) == 1:
+        return parts
+    return [f"📄 Часть {i}/{len(parts)}\n\n{part}" for i, part in enumerate(parts, 1)]
+
+
+def build_material_pages(topic: Dict, materials: Dict) -> List[Dict]:
+    """Готовые к отправке страницы материалов темы.
+
+    Материалы форматируются, преобразуются в HTML и разбиваются один раз -
+    при сохранении; при открытии темы страницы отправляются как есть.
+    Для каждой страницы запоминаются разделы на ней: первым идет раздел,
+    с которого страница начинается, затем начинающиеся на ней разделы.
+    """
+    parts = split_rendered(markdown_to_html(format_topic_materials(topic, materials)))
+    pages = []
+    current = OVERVIEW_SECTION
+    for number, content in enumerate(with_part_headers(parts), 1):
+        sections = [current] + _started_sections(content)
+        pages.append({
+            'page_number': number,
+            'sections': list(dict.fromkeys(sections)),
+            'content': content,
+        })
+        current = sections[-1]
+    return pages
+
+
+def _started_sections(content: str) -> List[str]:
+    """Разделы, заголовки которых есть на странице, в порядке следования"""
+    text = html_to_text(content)
+    return [key for key, title, _ in MATERIAL_SECTIONS if f"{title}:" in text]
+
+
+def section_start_pages(pages: List[Dict]) -> List[Tuple[str, int]]:
+    """Подписи разделов и номера страниц, с которых они начинаются (для кнопок перехода)"""
+    targets = []
+    for key, _, label in MATERIAL_SECTIONS:
+        for page in pages:
+            if key in page['sections']:
+                targets.append((label, page['page_number']))
+                break
+    return targets
+
+
+def render_material_document(topic: Dict, pages: List[Dict]) -> bytes:
+    """HTML файл со всеми материалами темы для отправки одним документом"""
+    body = '\n\n'.join(_PART_HEADER_RE.sub('', page['content']) for page in pages)
+    return _DOCUMENT_TEMPLATE.format(title=escape_html(topic['title']), body=body).encode('utf-8')
+
+
+def document_filename(topic: Dict) -> str:
+    """Имя файла с материалами темы"""
+    return f"topic_{topic['id']}.html"
@@ -0,0 +1,237 @@
+import re
+import html
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Лимит Telegram на длину сообщения - в кодовых единицах UTF-16 после разбора разметки
+MAX_MESSAGE_LENGTH = 4096
+
+_TOKEN_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>|[^<]+')
+_EMPTY_TAG_RE = re.compile(r'<([a-zA-Z]+)[^>]*></\1>')
+
+# Места разрыва в порядке предпочтения: абзац, строка, предложение, пробел
+_PARAGRAPH, _LINE, _SENTENCE, _SPACE = 4, 3, 2, 1
+_PRIORITIES = (_PARAGRAPH, _LINE, _SENTENCE, _SPACE)
+_SENTENCE_ENDS = ('. ', '! ', '? ', ': ', '; ')
+
+# Атом: (тип, тег или видимый текст, имя тега)
+Atom = Tuple[str, str, str]
+OpenTags = Tuple[Tuple[str, str], ...]
+# Кандидат на разрыв: (индекс атома в части, смещение в его тексте, видимая длина до разрыва, открытые теги)
+Candidate = Tuple[int, int, int, OpenTags]
+
+
+def utf16_length(text: str) -> int:
+    """Длина строки в кодовых единицах UTF-16 (так считает Telegram)"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def visible_length(rendered: str) -> int:
+    """Видимая длина HTML сообщения в кодовых единицах UTF-16"""
+    return sum(utf16_length(value) for kind, value, _ in _tokenize(rendered) if kind == 'text')
+
+
+def split_html(rendered: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Разбивка HTML сообщения Telegram на части не длиннее limit.
+
+    Длина считается в UTF-16 по видимому тексту, как ее считает Telegram.
+    Разрыв ищется по абзацам, строкам, предложениям и пробелам вне блоков
+    кода и выделений; если разорвать выделение все же приходится, теги
+    закрываются в конце части и открываются заново в начале следующей.
+    Длинный текст между тегами заранее делится на куски не длиннее limit
+    символов, а длина в UTF-16 считается только для того, что может
+    поместиться в часть, - работа на часть ограничена ее длиной, и
+    разбивка линейна по длине текста.
+    """
+    pending: Deque[Atom] = deque(_bounded(_tokenize(rendered), limit))
+    parts: List[str] = []
+
+    current: List[Atom] = []
+    current_length = 0
+    stack: List[Tuple[str, str]] = []
+    candidates: Dict[Tuple[str, int], Candidate] = {}
+
+    def start_part(open_tags: OpenTags):
+        nonlocal current, current_length, candidates, stack
+        stack = list(open_tags)
+        current = [('open', tag, name) for name, tag in open_tags]
+        current_length = 0
+        candidates = {}
+
+    def finish_part(atoms: List[Atom], open_tags: OpenTags):
+        # Пробелы и переносы в конце части не нужны (в блоке кода оставляем как есть)
+        if atoms and atoms[-1][0] == 'text' and not _in_pre(open_tags):
+            atoms[-1] = ('text', atoms[-1][1].rstrip(), '')
+        if not any(kind == 'text' and value.strip() for kind, value, _ in atoms):
+            return
+        body = ''.join(
+            html.escape(value, quote=False) if kind == 'text' else value
+            for kind, value, _ in atoms
+        )
+        body += ''.join(f'</{name}>' for name, _ in reversed(open_tags))
+        parts.append(_EMPTY_TAG_RE.sub('', body))
+
+    def add_candidates(text: str, end: int, index: int, cls: str, snapshot: OpenTags):
+        for priority, offset in _last_breaks(text, end):
+            length = current_length + utf16_length(text[:offset])
+            candidates[(cls, priority)] = (index, offset, length, snapshot)
+
+    while pending:
+        atom = pending.popleft()
+        kind, text, name = atom
+
+        if kind == 'open':
+            current.append(atom)
+            stack.append((name, text))
+            continue
+        if kind == 'close':
+            current.append(atom)
+            if stack and stack[-1][0] == name:
+                stack.pop()
+            continue
+
+        # В начале части пропускаем переносы и пробелы (но не отступы внутри кода)
+        if current_length == 0:
+            text = text.lstrip('\n') if _in_pre(stack) else text.lstrip()
+            if not text:
+                continue
+
+        cls = _candidate_class(stack)
+        snapshot = tuple(stack)
+        index = len(current)
+        current.append(('text', text, ''))
+
+        cut = _prefix_within(text, limit - current_length)
+        if cut == len(text):
+            add_candidates(text, len(text), index, cls, snapshot)
+            current_length += utf16_length(text)
+            continue
+
+        # Переполнение: выбираем разрыв среди прежних мест и в поместившемся начале фрагмента
+        add_candidates(text, cut, index, cls, snapshot)
+        candidate = _choose_candidate(candidates, limit)
+        if candidate is None:
+            # Подходящего места нет (очень длинное слово) - режем по лимиту
+            candidate = (index, cut, limit, snapshot)
+
+        split_index, offset, _, open_tags = candidate
+        split_text = current[split_index][1]
+        head = current[:split_index]
+        if offset:
+            head.append(('text', split_text[:offset], ''))
+        remainder = current[split_index + 1:]
+        if offset < len(split_text):
+            remainder.insert(0, ('text', split_text[offset:], ''))
+
+        finish_part(head, open_tags)
+        start_part(open_tags)
+        pending.extendleft(reversed(remainder))
+
+    finish_part(current, tuple(stack))
+    return parts
+
+
+def _tokenize(rendered: str) -> List[Atom]:
+    """Разбор HTML на теги и фрагменты видимого текста"""
+    atoms: List[Atom] = []
+    for match in _TOKEN_RE.finditer(rendered):
+        if match.group(2):
+            kind = 'close' if match.group(1) else 'open'
+            atoms.append((kind, match.group(0), match.group(2).lower()))
+        else:
+            source = match.group(0)
+            # Сущности (&lt; и т.п.) встречаются редко - разбираем только при наличии
+            atoms.append(('text', html.unescape(source) if '&' in source else source, ''))
+    return atoms
+
+
+def _bounded(atoms: List[Atom], limit: int) -> List[Atom]:
+    """Текст длиннее limit символов - кусками не длиннее limit (по переносу или пробелу, если есть)"""
+    bounded: List[Atom] = []
+    for atom in atoms:
+        text = atom[1]
+        if atom[0] != 'text' or len(text) <= limit:
+            bounded.append(atom)
+            continue
+        start = 0
+        while len(text) - start > limit:
+            end = start + limit
+            # Разделитель остается в конце куска - места разрыва не теряются
+            position = max(text.rfind('\n', start + limit // 2, end), text.rfind(' ', start + limit // 2, end))
+            if position != -1:
+                end = position + 1
+            bounded.append(('text', text[start:end], ''))
+            start = end
+        bounded.append(('text', text[start:], ''))
+    return bounded
+
+
+def _last_breaks(text: str, end: int) -> List[Tuple[int, int]]:
+    """Последние места разрыва каждого вида в text[:end]: (приоритет, смещение после разделителя)"""
+    breaks = []
+    position = text.rfind('\n\n', 0, end)
+    if position != -1:
+        breaks.append((_PARAGRAPH, position + 2))
+    position = text.rfind('\n', 0, end)
+    if position != -1:
+        breaks.append((_LINE, position + 1))
+    position = max(text.rfind(mark, 0, end) for mark in _SENTENCE_ENDS)
+    if position != -1:
+        breaks.append((_SENTENCE, position + 2))
+    position = text.rfind(' ', 0, end)
+    if position != -1:
+        breaks.append((_SPACE, position + 1))
+    return breaks
+
+
+def _prefix_within(text: str, room: int) -> int:
+    """Сколько символов text помещается в room кодовых единиц UTF-16, не разрывая суррогатные пары"""
+    # Символ занимает хотя бы одну кодовую единицу - дальше room символов смотреть незачем
+    text = text[:max(room, 0)]
+    if text.isascii():
+        return len(text)
+    units = text.encode('utf-16-le')[:room * 2]
+    # Старший суррогат без пары в конце отбрасываем (эмодзи не режем пополам)
+    if len(units) >= 2 and 0xD8 <= units[-1] <= 0xDB:
+        units = units[:-2]
+    return len(units.decode('utf-16-le'))
+
+
+def _in_pre(stack) -> bool:
+    return any(name == 'pre' for name, _ in stack)
+
+
+def _candidate_class(stack: List[Tuple[str, str]]) -> str:
+    """Класс места разрыва: вне разметки, внутри выделения или внутри блока кода"""
+    if _in_pre(stack):
+        return 'pre'
+    if any(name != 'blockquote' for name, _ in stack):
+        return 'inline'
+    return 'clean'
+
+
+def _choose_candidate(candidates: Dict[Tuple[str, int], Candidate], limit: int) -> Optional[Candidate]:
+    """Лучшее место разрыва в текущей части"""
+    half = limit // 2
+
+    # Во второй половине части: сначала вне разметки, затем внутри выделений
+    for cls in ('clean', 'inline'):
+        for priority in _PRIORITIES:
+            candidate = candidates.get((cls, priority))
+            if candidate and candidate[2] > half:
+                return candidate
+
+    # Иначе - последний разрыв вне разметки (например, перед длинным блоком кода)
+    clean = [c for (cls, _), c in candidates.items() if cls == 'clean']
+    if clean:
+        return max(clean, key=lambda c: c[2])
+
+    # Блок кода длиннее сообщения: режем по строкам кода
+    for priority in _PRIORITIES:
+        candidate = candidates.get(('pre', priority))
+        if candidate and candidate[2] > half:
+            return candidate
+    rest = list(candidates.values())
+    return max(rest, key=lambda c: c[2]) if rest else None
@@ -0,0 +1,132 @@
+import time
+import logging
+import functools
+from typing import Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from telegram.ext import ApplicationHandlerStop
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм: обработчики и БД - миллисекунды..секунды, Grok - секунды..минуты
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SLOW_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180)
+
+HANDLER_DURATION = Histogram(
+    'ai_bot_handler_duration_seconds', 'Время обработчика обновления',
+    ['handler', 'status'], buckets=FAST_BUCKETS
+)
+GROK_DURATION = Histogram(
+    'ai_bot_grok_request_duration_seconds', 'Время запроса к Grok API',
+    ['operation', 'status'], buckets=SLOW_BUCKETS
+)
+GROK_TOKENS = Counter(
+    'ai_bot_grok_tokens_total', 'Токены Grok API по данным usage',
+    ['operation', 'kind']
+)
+DB_QUERY_DURATION = Histogram(
+    'ai_bot_db_query_duration_seconds', 'Время SQL-запроса',
+    ['operation'], buckets=FAST_BUCKETS
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'ai_bot_db_pool_connections', 'Соединения пула БД',
+    ['state']
+)
+CACHE_REQUESTS = Counter(
+    'ai_bot_cache_requests_total', 'Обращения к кешам (result: hit/miss или уровень кеша)',
+    ['cache', 'result']
+)
+TELEGRAM_REQUESTS = Counter(
+    'ai_bot_telegram_requests_total', 'Исходящие запросы к Telegram Bot API',
+    ['method']
+)
+TELEGRAM_FLOOD_WAITS = Counter(
+    'ai_bot_telegram_flood_waits_total', 'Ответы RetryAfter (flood control) от Telegram',
+    ['method']
+)
+TELEGRAM_THROTTLE_SECONDS = Counter(
+    'ai_bot_telegram_throttle_seconds_total', 'Время ожидания в ограничителе исходящих запросов'
+)
+BACKGROUND_TASKS = Gauge('ai_bot_background_tasks', 'Фоновые генерации в работе')
+UPDATES_IN_PROGRESS = Gauge('ai_bot_updates', 'Обновления в обработке', ['state'])
+LOOP_LAG = Histogram(
+    'ai_bot_event_loop_lag_seconds', 'Задержка event loop (перцентили - histogram_quantile)',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+LOOP_STALLS = Counter('ai_bot_event_loop_stalls_total', 'Блокировки event loop дольше LOOP_BLOCK_THRESHOLD')
+
+
+def instrument_handler(callback):
+    """Обертка обработчика: время выполнения по имени обработчика"""
+    name = getattr(callback, '__name__', type(callback).__name__)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            status = 'stopped'
+            raise
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            HANDLER_DURATION.labels(name, status).observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def instrument_handlers(application):
+    """Подключить замер времени ко всем зарегистрированным обработчикам"""
+    count = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = instrument_handler(handler.callback)
+            count += 1
+    logger.info(f"📈 Метрики подключены к обработчикам: {count}")
+
+
+def instrument_engine(engine):
+    """Время SQL-запросов через события SQLAlchemy (для AsyncEngine - по sync_engine)"""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        # Запрос с ошибкой не дойдет до after_cursor_execute
+        connection = context.connection
+        if connection is not None and connection.info.get('query_started'):
+            connection.info['query_started'].pop()
+
+
+def record_cache(cache: str, result: str):
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def refresh_gauges(bot):
+    """Обновить показатели, которые считываются из состояния бота в момент сбора"""
+    pool = bot.db.pool_status()
+    for state in ('checkedout', 'checkedin', 'overflow', 'size'):
+        if state in pool:
+            DB_POOL_CONNECTIONS.labels(state).set(pool[state])
+    BACKGROUND_TASKS.set(bot.tasks.in_flight)
+    UPDATES_IN_PROGRESS.labels('active').set(bot.update_processor.active_updates)
+    UPDATES_IN_PROGRESS.labels('pending').set(bot.update_processor.pending_updates)
+
+
+def render_metrics(bot) -> Dict:
+    """Тело ответа /metrics в формате Prometheus"""
+    refresh_gauges(bot)
+    return {'body': generate_latest(), 'content_type': CONTENT_TYPE_LATEST}
@@ -0,0 +1,79 @@
+import os
+import logging
+from typing import Dict, List, Optional
+
+from token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+FAST, STRONG = 'fast', 'strong'
+
+# Вопросы с такими словами требуют рассуждений или кода - сразу сильная модель
+_COMPLEX_MARKERS = ('```', 'код', 'пример', 'напиши', 'реализ', 'сравни', 'архитектур',
+                    'оптимиз', 'ошибк', 'отлад', 'почему', 'докаж')
+
+# Операции по умолчанию: учебная программа и материалы - сильная модель,
+# короткие вопросы и восстановление разделов материалов - быстрая
+_DEFAULT_ROUTES = {
+    'topics': STRONG,
+    'materials': STRONG,
+    'news': STRONG,
+    'answer': 'auto',
+    'repair': FAST,
+}
+
+
+class ModelRouter:
+    """Выбор модели Grok по операции и сложности запроса.
+
+    Два уровня: fast (дешевле и быстрее) и strong. У каждого своя модель
+    и таймаут. Маршрут операции задается GROK_ROUTE_<ОПЕРАЦИЯ> = fast,
+    strong или auto (для ответов: короткий простой вопрос - fast).
+    Если ответ быстрой модели не прошел проверку (ошибка API, таймаут,
+    пустой текст, неразобранные разделы), запрос повторяется на strong.
+    """
+
+    def __init__(self):
+        self.tiers: Dict[str, Dict] = {
+            FAST: {
+                'model': os.getenv('GROK_FAST_MODEL', 'grok-3-mini'),
+                'timeout': float(os.getenv('GROK_FAST_TIMEOUT', '45')),
+            },
+            STRONG: {
+                'model': os.getenv('GROK_STRONG_MODEL', 'grok-4-latest'),
+                'timeout': float(os.getenv('GROK_STRONG_TIMEOUT', '180')),
+            },
+        }
+        self.fast_max_question_tokens = int(os.getenv('GROK_FAST_MAX_QUESTION_TOKENS', '60'))
+        self.routes = {
+            operation: os.getenv(f'GROK_ROUTE_{operation.upper()}', default).lower()
+            for operation, default in _DEFAULT_ROUTES.items()
+        }
+        self.escalations = 0
+
+    def tier_for(self, operation: str, text: Optional[str] = None) -> str:
+        route = self.routes.get(operation, STRONG)
+        if route in (FAST, STRONG):
+            return route
+        return FAST if text is not None and self.is_simple(text) else STRONG
+
+    def is_simple(self, text: str) -> bool:
+        """Короткий вопрос без кода и без просьб объяснить, сравнить или написать"""
+        lowered = text.lower()
+        return (estimate_tokens(text) <= self.fast_max_question_tokens
+                and not any(marker in lowered for marker in _COMPLEX_MARKERS))
+
+    def attempts(self, operation: str, text: Optional[str] = None) -> List[str]:
+        """Уровни по порядку: быстрая модель с эскалацией на сильную или сразу сильная"""
+        tier = self.tier_for(operation, text)
+        return [FAST, STRONG] if tier == FAST else [STRONG]
+
+    def model(self, tier: str) -> str:
+        return self.tiers[tier]['model']
+
+    def timeout(self, tier: str) -> float:
+        return self.tiers[tier]['timeout']
+
+    def escalate(self, operation: str, reason: str):
+        self.escalations += 1
+        logger.info(f"⬆️ {operation}: ответ быстрой модели не прошел проверку ({reason}), повторяем на сильной")
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from telegram.constants import ChatAction
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressIndicator:
+    """Индикатор длительной операции без временных сообщений.
+
+    Вместо отправки и удаления сообщения "Загружаю..." показывает статус
+    "печатает" (send_chat_action, обновляется по таймеру - Telegram гасит
+    его через ~5 секунд) и при необходимости редактирует целевое сообщение,
+    которое потом будет заменено результатом.
+
+    Быстрые операции не стоят ни одного лишнего запроса: статус и первая
+    правка отправляются только если операция длится дольше задержки.
+    Правки текста объединяются: не чаще одной за min_edit_interval, при
+    частых обновлениях уходит только последний текст.
+
+        async with ProgressIndicator(context.bot, chat_id, message=query.message) as progress:
+            progress.update("🤖 Генерирую материалы...")
+            result = await long_operation()
+    """
+
+    def __init__(self, bot, chat_id: int, message=None, action: str = ChatAction.TYPING,
+                 action_delay: Optional[float] = None, action_interval: Optional[float] = None,
+                 edit_delay: Optional[float] = None, min_edit_interval: Optional[float] = None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message = message
+        self.action = action
+        self.action_delay = action_delay if action_delay is not None else float(os.getenv('PROGRESS_ACTION_DELAY', '0.5'))
+        self.action_interval = action_interval if action_interval is not None else float(os.getenv('PROGRESS_ACTION_INTERVAL', '4'))
+        self.edit_delay = edit_delay if edit_delay is not None else float(os.getenv('PROGRESS_EDIT_DELAY', '1'))
+        self.min_edit_interval = min_edit_interval if min_edit_interval is not None else float(os.getenv('PROGRESS_MIN_EDIT_INTERVAL', '3'))
+
+        self._started_at = 0.0
+        self._last_edit_at: Optional[float] = None
+        self._pending_text: Optional[str] = None
+        self._pending_markup = None
+        self._shown_text: Optional[str] = None
+        self._action_task: Optional[asyncio.Task] = None
+        self._edit_task: Optional[asyncio.Task] = None
+        self._editing = False
+        self._closed = False
+
+        # Статистика для логов и тестов
+        self.actions_sent = 0
+        self.edits_sent = 0
+
+    async def __aenter__(self) -> 'ProgressIndicator':
+        self._started_at = time.monotonic()
+        self._action_task = asyncio.create_task(self._keep_action())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def update(self, text: str, reply_markup=None):
+        """Показать статус в целевом сообщении (с задержкой и объединением частых правок)"""
+        if self.message is None or self._closed or text == self._shown_text:
+            return
+        self._pending_text = text
+        self._pending_markup = reply_markup
+        if self._edit_task is None or self._edit_task.done():
+            self._edit_task = asyncio.create_task(self._flush_edit())
+
+    async def close(self):
+        """Остановить индикатор; начатая правка дожидается завершения, чтобы не перетереть результат"""
+        self._closed = True
+        if self._action_task:
+            self._action_task.cancel()
+        if self._edit_task and not self._edit_task.done():
+            if self._editing:
+                await asyncio.gather(self._edit_task, return_exceptions=True)
+            else:
+                self._edit_task.cancel()
+        if self.actions_sent or self.edits_sent:
+            logger.debug(f"⏳ Индикатор чата {self.chat_id}: статусов {self.actions_sent}, правок {self.edits_sent}")
+
+    async def _keep_action(self):
+        """Статус "печатает" с обновлением по таймеру"""
+        try:
+            await asyncio.sleep(self.action_delay)
+            while not self._closed:
+                try:
+                    await self.bot.send_chat_action(chat_id=self.chat_id, action=self.action)
+                    self.actions_sent += 1
+                except Exception as e:
+                    logger.debug(f"Не удалось отправить статус в чат {self.chat_id}: {e}")
+                await asyncio.sleep(self.action_interval)
+        except asyncio.CancelledError:
+            pass
+
+    async def _flush_edit(self):
+        """Отправить последний текст статуса, соблюдая задержку и минимальный интервал правок"""
+        try:
+            ready_at = self._started_at + self.edit_delay
+            if self._last_edit_at is not None:
+                ready_at = max(ready_at, self._last_edit_at + self.min_edit_interval)
+            await asyncio.sleep(max(0.0, ready_at - time.monotonic()))
+        except asyncio.CancelledError:
+            return
+
+        if self._closed or self._pending_text is None:
+            return
+
+        text, self._pending_text = self._pending_text, None
+        self._editing = True
+        try:
+            await self.message.edit_text(text, reply_markup=self._pending_markup)
+            self._shown_text = text
+            self.edits_sent += 1
+        except BadRequest as e:
+            logger.debug(f"Не удалось обновить статус в чате {self.chat_id}: {e}")
+        except Exception as e:
+            logger.warning(f"Ошибка обновления статуса в чате {self.chat_id}: {e}")
+        finally:
+            self._last_edit_at = time.monotonic()
+            self._editing = False
+
+        # Пока шла правка, мог прийти новый статус
+        if self._pending_text is not None and not self._closed:
+            self._edit_task = asyncio.create_task(self._flush_edit())
@@ -0,0 +1,132 @@
+import os
+import re
+import zlib
+from typing import FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+# Размер символьных n-грамм и размерность вектора (n-граммы хешируются в нее)
+NGRAM_SIZE = 3
+VECTOR_SIZE = int(os.getenv('QUESTION_VECTOR_SIZE', '2048'))
+# Косинусная близость, начиная с которой вопрос считается повтором
+MATCH_THRESHOLD = float(os.getenv('QUESTION_MATCH_THRESHOLD', '0.85'))
+# Доля общих значимых слов (по основам), без которой близкий вектор не считается повтором
+MIN_TERM_OVERLAP = float(os.getenv('QUESTION_MIN_TERM_OVERLAP', '0.75'))
+# Сколько последних вопросов темы держать в индексе
+MAX_QUESTIONS_PER_TOPIC = int(os.getenv('QUESTION_INDEX_MAX_PER_TOPIC', '200'))
+
+_WORD_RE = re.compile(r'[a-zа-яё0-9_+#]+')
+
+# Слова, не меняющие смысла вопроса. Вопросительные слова и отрицания сюда
+# не входят: "почему работает" и "как работает" - разные вопросы
+_FILLER_WORDS = {
+    'это', 'этот', 'эта', 'эти', 'то', 'а', 'и', 'же', 'ли', 'бы', 'вот', 'ну', 'вообще', 'такое', 'такой',
+    'мне', 'меня', 'мы', 'я', 'ты', 'вы', 'пожалуйста', 'или', 'нужно', 'надо',
+    'в', 'во', 'на', 'с', 'со', 'к', 'ко', 'о', 'об', 'по', 'за', 'из', 'от', 'до', 'для', 'при', 'у',
+    'the', 'a', 'an', 'of', 'to', 'in', 'on', 'for', 'is', 'and', 'or',
+}
+# Вопросительные слова по смыслу вопроса: совпадать должен набор смыслов
+_QUESTION_WORDS = {
+    'как': 'how', 'what': 'what', 'how': 'how', 'why': 'why', 'when': 'when', 'where': 'where',
+    'какой': 'which', 'какая': 'which', 'какое': 'which', 'какие': 'which', 'каким': 'which', 'каких': 'which',
+    'что': 'what', 'чем': 'what', 'чего': 'what', 'почему': 'why', 'отчего': 'why', 'зачем': 'purpose',
+    'когда': 'when', 'где': 'where', 'куда': 'where', 'откуда': 'where', 'сколько': 'count', 'кто': 'who',
+}
+_NEGATIONS = {'не', 'нет', 'нельзя', 'ни', 'без', 'not', 'no', 'without'}
+# Длина основы значимого слова: "применить" и "применять" - одна основа
+_STEM_LENGTH = 5
+
+
+def _words(text: str) -> List[str]:
+    return [
+        word for word in _WORD_RE.findall(text.lower().replace('ё', 'е'))
+        if word not in _FILLER_WORDS and (len(word) > 1 or word in _NEGATIONS)
+    ]
+
+
+def vectorize(text: str) -> np.ndarray:
+    """Нормированный вектор символьных n-грамм вопроса.
+
+    Слова-связки отбрасываются, у остальных считаются n-граммы с
+    границами слова (" пр", "при", ... "ть "): "применить" и "применять"
+    совпадают почти всеми n-граммами, а порядок слов не важен.
+    """
+    vector = np.zeros(VECTOR_SIZE, dtype=np.float32)
+    for word in _words(text):
+        padded = f' {word} '
+        for start in range(len(padded) - NGRAM_SIZE + 1):
+            ngram = padded[start:start + NGRAM_SIZE]
+            vector[zlib.crc32(ngram.encode()) % VECTOR_SIZE] += 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def signature(text: str) -> Tuple[FrozenSet[str], bool, FrozenSet[str]]:
+    """Смыслы вопросительных слов, наличие отрицания и основы значимых слов вопроса"""
+    words = _words(text)
+    kinds = frozenset(_QUESTION_WORDS[word] for word in words if word in _QUESTION_WORDS)
+    negated = any(word in _NEGATIONS for word in words)
+    terms = frozenset(
+        word[:_STEM_LENGTH] for word in words
+        if word not in _QUESTION_WORDS and word not in _NEGATIONS
+    )
+    return kinds, negated, terms
+
+
+def same_question(first: Tuple, second: Tuple, min_overlap: float = MIN_TERM_OVERLAP) -> bool:
+    """Вопросы совпадают по типу и отрицанию, а значимые слова - почти целиком"""
+    if first[0] != second[0] or first[1] != second[1]:
+        return False
+    union = first[2] | second[2]
+    if not union:
+        return False
+    return len(first[2] & second[2]) / len(union) >= min_overlap
+
+
+class QuestionIndex:
+    """Прошлые вопросы одной темы с ответами: матрица векторов и поиск ближайшего.
+
+    Близость ко всем вопросам темы считается одним умножением матрицы на
+    вектор. Прошедшие порог кандидаты дополнительно сверяются по
+    signature(): похожие по буквам вопросы с другим вопросительным словом,
+    отрицанием или предметом ("на GPU" / "на CPU") повтором не считаются.
+    При переполнении вытесняются самые старые вопросы.
+    """
+
+    def __init__(self, questions: Optional[List[Tuple[str, str]]] = None,
+                 max_questions: int = MAX_QUESTIONS_PER_TOPIC):
+        self.max_questions = max_questions
+        self.answers: List[str] = []
+        self.signatures: List[Tuple] = []
+        self.vectors = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+        if questions:
+            questions = questions[-max_questions:]
+            self.answers = [answer for _, answer in questions]
+            self.signatures = [signature(question) for question, _ in questions]
+            self.vectors = np.vstack([vectorize(question) for question, _ in questions])
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def match(self, question: str, threshold: float = MATCH_THRESHOLD) -> Optional[Tuple[float, str]]:
+        """Близость и ответ самого похожего вопроса, если она не ниже порога и смысл совпадает"""
+        if not self.answers:
+            return None
+        vector = vectorize(question)
+        if not vector.any():
+            return None
+        scores = self.vectors @ vector
+        candidates = np.flatnonzero(scores >= threshold)
+        if not candidates.size:
+            return None
+        question_signature = signature(question)
+        # Сначала самые близкие
+        for position in candidates[np.argsort(scores[candidates])[::-1]]:
+            if same_question(question_signature, self.signatures[position]):
+                return float(scores[position]), self.answers[position]
+        return None
+
+    def add(self, question: str, answer: str):
+        self.vectors = np.vstack([self.vectors, vectorize(question)])[-self.max_questions:]
+        self.answers = (self.answers + [answer])[-self.max_questions:]
+        self.signatures = (self.signatures + [signature(question)])[-self.max_questions:]
@@ -0,0 +1,151 @@
+import os
+import logging
+from typing import Dict, Optional, Tuple
+
+from rate_limiter import TokenBucket
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis нужен только для нескольких реплик бота
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Лимиты вопросов (каждый вопрос - платный вызов Grok), в вопросах в минуту
+USER_RATE = float(os.getenv('QUESTION_USER_RATE', '4'))
+USER_BURST = float(os.getenv('QUESTION_USER_BURST', '3'))
+GLOBAL_RATE = float(os.getenv('QUESTION_GLOBAL_RATE', '60'))
+GLOBAL_BURST = float(os.getenv('QUESTION_GLOBAL_BURST', '20'))
+
+# Token bucket в Redis: пополнение и списание атомарно, время - по часам Redis
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = math.min(capacity, tokens - requested)
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class MemoryQuotaStore:
+    """Бакеты в памяти процесса (одна реплика бота)"""
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    async def take(self, key: str, rate: float, capacity: float, tokens: float = 1.0) -> float:
+        """Взять токены: 0 при успехе, иначе через сколько секунд повторить"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+            self._prune()
+        if tokens < 0:
+            bucket.tokens = min(bucket.capacity, bucket.tokens - tokens)
+            return 0.0
+        return bucket.try_acquire(tokens)
+
+    def _prune(self):
+        # Полные бакеты не отличаются от новых - их можно не хранить
+        if len(self._buckets) > 10000:
+            for key in [key for key, bucket in self._buckets.items() if bucket.is_idle]:
+                del self._buckets[key]
+
+    async def close(self):
+        pass
+
+
+class RedisQuotaStore:
+    """Бакеты в Redis - общие для всех реплик бота"""
+
+    def __init__(self, url: str):
+        self.client = aioredis.from_url(url)
+        self._script = self.client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, capacity: float, tokens: float = 1.0) -> float:
+        wait = await self._script(keys=[key], args=[rate, capacity, tokens])
+        return float(wait)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class QuestionQuota:
+    """Лимиты вопросов к Grok: на пользователя и общий на бота.
+
+    Сначала проверяется бакет пользователя, затем общий. Активный
+    пользователь упирается в свой лимит раньше, чем в общий, поэтому
+    не может израсходовать емкость LLM за всех остальных. Если общий
+    бакет пуст, токен пользователя возвращается.
+
+    С REDIS_URL бакеты хранятся в Redis и общие для всех реплик; при
+    ошибке Redis проверка временно выполняется по бакетам в памяти.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None,
+                 user_rate: float = USER_RATE, user_burst: float = USER_BURST,
+                 global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST):
+        # Лимиты задаются в минуту, бакеты считают в секундах
+        self.user_limit: Tuple[float, float] = (user_rate / 60, user_burst)
+        self.global_limit: Tuple[float, float] = (global_rate / 60, global_burst)
+
+        self.memory = MemoryQuotaStore()
+        self.store = self.memory
+        redis_url = redis_url if redis_url is not None else os.getenv('REDIS_URL')
+        if redis_url and aioredis is not None:
+            self.store = RedisQuotaStore(redis_url)
+            logger.info("🪣 Лимиты вопросов хранятся в Redis")
+        elif redis_url:
+            logger.warning("REDIS_URL задан, но пакет redis не установлен - лимиты вопросов в памяти")
+
+        # Статистика
+        self.allowed = 0
+        self.rejected = 0
+
+    async def check(self, user_id: int) -> float:
+        """Списать вопрос из лимитов: 0 - можно спрашивать, иначе через сколько секунд"""
+        wait = await self._take(f"quota:question:user:{user_id}", *self.user_limit)
+        if wait == 0:
+            wait = await self._take("quota:question:global", *self.global_limit)
+            if wait > 0:
+                await self._take(f"quota:question:user:{user_id}", *self.user_limit, tokens=-1)
+
+        if wait > 0:
+            self.rejected += 1
+            logger.info(f"🐢 Вопрос пользователя {user_id} отклонен лимитом, повтор через {wait:.0f} сек.")
+        else:
+            self.allowed += 1
+        return wait
+
+    async def refund(self, user_id: int):
+        """Вернуть списанный вопрос в лимиты, если ответ так и не был запущен"""
+        try:
+            await self._take(f"quota:question:user:{user_id}", *self.user_limit, tokens=-1)
+            await self._take("quota:question:global", *self.global_limit, tokens=-1)
+            self.allowed -= 1
+        except Exception as e:
+            logger.warning(f"Не удалось вернуть вопрос пользователя {user_id} в лимит: {e}")
+
+    async def _take(self, key: str, rate: float, capacity: float, tokens: float = 1.0) -> float:
+        try:
+            return await self.store.take(key, rate, capacity, tokens)
+        except Exception as e:
+            if self.store is self.memory:
+                raise
+            logger.warning(f"Ошибка Redis при проверке лимита, используем память: {e}")
+            return await self.memory.take(key, rate, capacity, tokens)
+
+    async def close(self):
+        await self.store.close()
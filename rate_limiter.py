@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import TELEGRAM_FLOOD_WAITS, TELEGRAM_REQUESTS, TELEGRAM_THROTTLE_SECONDS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API: ~30 сообщений в секунду на бота,
+# ~1 сообщение в секунду в личный чат и ~20 сообщений в минуту в группу
+GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+PRIVATE_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+PRIVATE_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+GROUP_CHAT_RATE = float(os.getenv('TELEGRAM_GROUP_RATE', str(20 / 60)))
+MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))
+
+# Методы, которые не создают сообщений в чате и не требуют лимита на чат
+_CHAT_EXEMPT_ENDPOINTS = {'answerCallbackQuery', 'sendChatAction'}
+
+
+class TokenBucket:
+    """Классический token bucket с резервированием токенов.
+
+    Каждый вызов резервирует токен сразу, даже если бакет пуст, и получает
+    время ожидания до момента, когда этот токен появится. Благодаря этому
+    конкурирующие запросы выстраиваются в очередь и равномерно растягиваются
+    во времени, а не просыпаются все одновременно.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Зарезервировать токены и вернуть время ожидания в секундах"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= tokens
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Взять токены без ожидания: 0 при успехе, иначе через сколько секунд повторить"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Через сколько секунд будут токены (без резервирования)"""
+        self._refill(time.monotonic())
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0):
+        """Дождаться токенов"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов на заданное время (например, после RetryAfter)"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    @property
+    def is_idle(self) -> bool:
+        """Бакет полон - его состояние можно не хранить"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """Центральный ограничитель исходящих запросов к Telegram.
+
+    Все запросы бота (reply_text, edit_message_text, send_document, ...)
+    проходят через общий token bucket (~30 запросов в секунду) и через
+    бакет конкретного чата. При RetryAfter отправка в чат приостанавливается
+    на указанное Telegram время и запрос повторяется, поэтому всплески
+    сообщений плавно замедляются вместо ошибок flood control.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = PRIVATE_CHAT_RATE,
+                 chat_burst: float = PRIVATE_CHAT_BURST, group_rate: float = GROUP_CHAT_RATE,
+                 max_retries: int = MAX_RETRIES, max_tracked_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_tracked_chats = max_tracked_chats
+        self._chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+
+        # Статистика для мониторинга
+        self.requests_sent = 0
+        self.flood_waits = 0
+        self.throttled_seconds = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._chat_buckets.clear()
+
+    def _get_chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_tracked_chats:
+                self._prune_idle_buckets()
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(self.group_rate, capacity=self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_idle_buckets(self):
+        """Удалить бакеты чатов, в которые давно ничего не отправлялось"""
+        idle = [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_idle]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Any],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get('chat_id')
+        chat_bucket = None
+        if chat_id is not None and endpoint not in _CHAT_EXEMPT_ENDPOINTS:
+            chat_bucket = self._get_chat_bucket(chat_id)
+
+        # Спан запроса (вместе с ожиданием в ограничителе) - внутри трейса обновления
+        with span(f'telegram.{endpoint}', chat_id=chat_id) as request_span:
+            attempt = 0
+            while True:
+                started = time.monotonic()
+                if chat_bucket is not None:
+                    await chat_bucket.acquire()
+                await self.global_bucket.acquire()
+                throttled = time.monotonic() - started
+                self.throttled_seconds += throttled
+                TELEGRAM_THROTTLE_SECONDS.inc(throttled)
+                if request_span is not None:
+                    request_span.set(throttle_ms=round(throttled * 1000, 1), attempt=attempt + 1)
+
+                try:
+                    result = await callback(*args, **kwargs)
+                    self.requests_sent += 1
+                    TELEGRAM_REQUESTS.labels(endpoint).inc()
+                    return result
+                except RetryAfter as e:
+                    self.flood_waits += 1
+                    TELEGRAM_FLOOD_WAITS.labels(endpoint).inc()
+                    attempt += 1
+                    retry_after = float(e.retry_after)
+                    if attempt > self.max_retries:
+                        logger.error(f"Flood control: {endpoint} в чат {chat_id} не отправлен после {self.max_retries} повторов")
+                        raise
+
+                    logger.warning(f"Flood control: {endpoint} в чат {chat_id}, повтор через {retry_after} сек.")
+                    # Следующая попытка дождется окончания паузы в бакете
+                    (chat_bucket or self.global_bucket).pause(retry_after)
@@ -2,13 +2,15 @@ import asyncio
 import sqlite3
 import os
 from dotenv import load_dotenv
-from grok_service import GrokService
 
-# Загружаем переменные окружения
+# Загружаем переменные окружения (до импорта модулей бота: часть настроек читается при импорте)
 load_dotenv()
 if os.path.exists('.env.local'):
     load_dotenv('.env.local', override=True)
 
+from grok_service import GrokService
+from logging_setup import setup_logging, stop_logging
+
 async def regenerate_1c_topics():
     """Сгенерировать темы по 1C на русском языке"""
     
@@ -61,4 +63,9 @@ async def regenerate_1c_topics():
         print("❌ Не удалось сгенерировать темы по 1C")
 
 if __name__ == "__main__":
-    asyncio.run(regenerate_1c_topics())
+    # Разовый скрипт: логи только в консоль
+    setup_logging(log_file=None)
+    try:
+        asyncio.run(regenerate_1c_topics())
+    finally:
+        stop_logging()
@@ -1,25 +1,17 @@
-import os
 import asyncio
 import logging
 import schedule
 import time
 from datetime import datetime
 from dotenv import load_dotenv
-from database import Database
-from grok_service import GrokService
-from topic_service import TopicService
 
-# Загрузка переменных окружения
+# Загрузка переменных окружения (до импорта модулей бота: часть настроек читается при импорте)
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+from database import Database
+from grok_service import GrokService
+from topic_service import TopicService
+from logging_setup import setup_logging, stop_logging
 
 logger = logging.getLogger(__name__)
 
@@ -129,11 +121,14 @@ class TopicScheduler:
 
 def main():
     """Главная функция"""
-    # Создание директории для логов
-    os.makedirs('logs', exist_ok=True)
-    
-    scheduler = TopicScheduler()
-    scheduler.run()
+    # Логи через очередь, как у бота; свой файл - бот и планировщик работают в разных контейнерах
+    setup_logging(log_file='logs/scheduler.log')
+    try:
+        scheduler = TopicScheduler()
+        scheduler.run()
+    finally:
+        # Дописываем оставшиеся в очереди записи
+        stop_logging()
 
 if __name__ == "__main__":
     main()
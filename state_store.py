@@ -0,0 +1,264 @@
+import os
+import copy
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, select
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import Database, BotState
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis нужен только для нескольких реплик бота
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+StateKey = Tuple[str, int]
+
+# Как часто несохраненные изменения user_data/chat_data записываются в хранилище (секунды)
+FLUSH_INTERVAL = float(os.getenv('BOT_STATE_FLUSH_INTERVAL', '1'))
+# Сколько хранится состояние неактивного пользователя в Redis
+STATE_TTL = timedelta(days=int(os.getenv('BOT_STATE_TTL_DAYS', '30')))
+
+
+class MemoryStateStore:
+    """Хранилище в памяти процесса (для тестов и локального запуска)"""
+
+    def __init__(self):
+        self.items: Dict[StateKey, str] = {}
+        self.batches = 0
+
+    async def load(self, kind: str, object_id: int) -> Optional[str]:
+        return self.items.get((kind, object_id))
+
+    async def save_many(self, items: Dict[StateKey, Optional[str]]):
+        self.batches += 1
+        for key, payload in items.items():
+            if payload is None:
+                self.items.pop(key, None)
+            else:
+                self.items[key] = payload
+
+    async def close(self):
+        pass
+
+
+class RedisStateStore:
+    """Состояние в Redis: ключ bot_state:<kind>:<id> со сроком жизни"""
+
+    def __init__(self, url: str, ttl: timedelta = STATE_TTL):
+        self.client = aioredis.from_url(url)
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(kind: str, object_id: int) -> str:
+        return f"bot_state:{kind}:{object_id}"
+
+    async def load(self, kind: str, object_id: int) -> Optional[str]:
+        payload = await self.client.get(self._key(kind, object_id))
+        return payload.decode('utf-8') if payload is not None else None
+
+    async def save_many(self, items: Dict[StateKey, Optional[str]]):
+        # Все изменения пакета - одним запросом
+        async with self.client.pipeline(transaction=False) as pipe:
+            for (kind, object_id), payload in items.items():
+                if payload is None:
+                    pipe.delete(self._key(kind, object_id))
+                else:
+                    pipe.set(self._key(kind, object_id), payload, ex=self.ttl)
+            await pipe.execute()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class DatabaseStateStore:
+    """Состояние в таблице bot_state основной базы данных"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def load(self, kind: str, object_id: int) -> Optional[str]:
+        async with self.db.async_session() as session:
+            result = await session.execute(
+                select(BotState.data).where(BotState.kind == kind, BotState.object_id == object_id)
+            )
+            return result.scalar_one_or_none()
+
+    async def save_many(self, items: Dict[StateKey, Optional[str]]):
+        # Все изменения пакета - одной транзакцией
+        async with self.db.async_session() as session:
+            for (kind, object_id), payload in items.items():
+                if payload is None:
+                    await session.execute(
+                        delete(BotState).where(BotState.kind == kind, BotState.object_id == object_id)
+                    )
+                else:
+                    await session.merge(BotState(kind=kind, object_id=object_id, data=payload,
+                                                 updated_at=datetime.utcnow()))
+            await session.commit()
+
+    async def close(self):
+        pass
+
+
+class StatePersistence(BasePersistence):
+    """Персистентность user_data/chat_data во внешнем хранилище.
+
+    Данные не загружаются целиком при старте: перед обработкой обновления
+    PTB вызывает refresh_*_data, и состояние пользователя/чата читается из
+    хранилища. Так вторая реплика или перезапущенный бот видят, например,
+    waiting_for_question, сохраненный другим процессом.
+
+    Запись объединяется: PTB раз в update_interval передает данные
+    пользователей, которые обращались к боту; неизменившиеся данные не
+    пишутся, остальные уходят в хранилище одним пакетом. Пока изменение
+    не записано, чтение из хранилища его не перетирает.
+    """
+
+    def __init__(self, store, update_interval: float = FLUSH_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.store = store
+        self._synced: Dict[StateKey, Dict] = {}
+        self._pending: Dict[StateKey, Optional[str]] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+        # Статистика
+        self.loads = 0
+        self.writes = 0
+        self.skipped_writes = 0
+
+    # Загрузка при старте не нужна - состояние читается по мере обращений
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict):
+        await self._refresh(('user', user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict):
+        await self._refresh(('chat', chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict):
+        pass
+
+    async def update_user_data(self, user_id: int, data: Dict):
+        self._schedule(('user', user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict):
+        self._schedule(('chat', chat_id), data)
+
+    async def drop_user_data(self, user_id: int):
+        self._schedule(('user', user_id), None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._schedule(('chat', chat_id), None)
+
+    async def update_bot_data(self, data: Dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name: str, key, new_state):
+        pass
+
+    async def flush(self):
+        """Записать все несохраненные изменения (при остановке бота)"""
+        if self._writer and not self._writer.done():
+            await asyncio.gather(self._writer, return_exceptions=True)
+        if self._pending:
+            await self._write_pending()
+        await self.store.close()
+        logger.info(f"💾 Состояние сохранено: чтений {self.loads}, записей {self.writes}, "
+                    f"пропущено без изменений {self.skipped_writes}")
+
+    async def _refresh(self, key: StateKey, data: Dict):
+        """Подтянуть состояние из хранилища, если в памяти нет несохраненных изменений"""
+        if key in self._pending or data != self._synced.get(key, {}):
+            return
+        try:
+            payload = await self.store.load(*key)
+        except Exception as e:
+            logger.warning(f"Ошибка чтения состояния {key[0]} {key[1]}, используем данные в памяти: {e}")
+            return
+        self.loads += 1
+
+        stored = json.loads(payload) if payload else {}
+        if stored != data:
+            data.clear()
+            data.update(stored)
+        self._synced[key] = copy.deepcopy(stored)
+
+    def _schedule(self, key: StateKey, data: Optional[Dict]):
+        """Поставить изменение в очередь записи; одинаковые данные не пишутся повторно"""
+        if data is None:
+            self._synced.pop(key, None)
+            self._pending[key] = None
+        else:
+            if data == self._synced.get(key, {}) and key not in self._pending:
+                self.skipped_writes += 1
+                return
+            try:
+                self._pending[key] = json.dumps(data, ensure_ascii=False)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Состояние {key[0]} {key[1]} не сериализуется в JSON: {e}")
+                return
+            self._synced[key] = data
+
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        # Даем PTB поставить в очередь остальные изменения этого прохода
+        await asyncio.sleep(0)
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await self.store.save_many(batch)
+                self.writes += len(batch)
+            except Exception as e:
+                # Вернем несохраненное в очередь (если его не заменили более новые данные)
+                for key, payload in batch.items():
+                    self._pending.setdefault(key, payload)
+                logger.error(f"Ошибка записи состояния ({len(batch)} шт.), повторим позже: {e}")
+                return
+
+
+def create_state_persistence(db: Database) -> Optional[StatePersistence]:
+    """Персистентность по BOT_STATE_BACKEND: redis, db или memory (без сохранения)"""
+    redis_url = os.getenv('REDIS_URL')
+    backend = os.getenv('BOT_STATE_BACKEND', 'redis' if redis_url else 'db').lower()
+
+    if backend == 'redis':
+        if redis_url and aioredis is not None:
+            logger.info("💾 Состояние диалогов хранится в Redis")
+            return StatePersistence(RedisStateStore(redis_url))
+        logger.warning("Redis для состояния недоступен (нет REDIS_URL или пакета redis), используем БД")
+        backend = 'db'
+
+    if backend == 'db':
+        logger.info("💾 Состояние диалогов хранится в базе данных")
+        return StatePersistence(DatabaseStateStore(db))
+
+    return None
@@ -0,0 +1,146 @@
+import os
+import asyncio
+import logging
+from typing import Coroutine, Dict, Optional, Set, Tuple
+
+from tracing import Span, start_span, use_span
+
+logger = logging.getLogger(__name__)
+
+
+class TaskRegistry:
+    """Реестр фоновых задач для долгих операций (генерация через Grok).
+
+    Обработчик ставит работу в реестр и сразу возвращается, освобождая слот
+    обработки обновлений; результат доставляется правкой сообщения из самой
+    задачи. Реестр ограничивает число задач на пользователя и общее число,
+    позволяет отменить задачи пользователя и показывает, сколько генераций
+    выполняется сейчас.
+
+    Задачи учитываются по пользователю и чату: переход пользователя в другое
+    место чата (другая тема, "Назад к темам") отменяет его задачи в этом
+    чате, чтобы не платить за генерацию и не присылать ненужный результат.
+    """
+
+    def __init__(self, max_per_user: Optional[int] = None, max_total: Optional[int] = None):
+        self.max_per_user = max_per_user or int(os.getenv('BACKGROUND_TASKS_PER_USER', '2'))
+        self.max_total = max_total or int(os.getenv('BACKGROUND_TASKS_MAX', '64'))
+
+        self._owners: Dict[asyncio.Task, int] = {}
+        self._coros: Dict[asyncio.Task, Coroutine] = {}
+        self._by_user: Dict[int, Set[asyncio.Task]] = {}
+        self._by_chat: Dict[Tuple[int, Optional[int]], Set[asyncio.Task]] = {}
+        self._chats: Dict[asyncio.Task, Tuple[int, Optional[int]]] = {}
+        self._spans: Dict[asyncio.Task, Optional[Span]] = {}
+
+        # Статистика
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Сколько задач выполняется сейчас"""
+        return len(self._owners)
+
+    def user_count(self, user_id: int) -> int:
+        """Сколько задач пользователя выполняется сейчас"""
+        return len(self._by_user.get(user_id, ()))
+
+    def can_submit(self, user_id: int) -> bool:
+        """Есть ли место для новой задачи пользователя"""
+        return self.user_count(user_id) < self.max_per_user and self.in_flight < self.max_total
+
+    def submit(self, user_id: int, coro: Coroutine, name: str, chat_id: Optional[int] = None) -> Optional[asyncio.Task]:
+        """Запустить задачу в фоне; None, если лимит пользователя или общий лимит исчерпан"""
+        if not self.can_submit(user_id):
+            coro.close()
+            self.rejected += 1
+            logger.warning(f"⛔ Задача {name} пользователя {user_id} отклонена: "
+                           f"у пользователя {self.user_count(user_id)}, всего {self.in_flight}")
+            return None
+
+        # Спан открывается сразу: трейс обновления дождется завершения задачи
+        span = start_span('task', task=name)
+        task = asyncio.create_task(self._run(coro, name, span), name=name)
+        self._owners[task] = user_id
+        self._spans[task] = span
+        self._coros[task] = coro
+        self._by_user.setdefault(user_id, set()).add(task)
+        self._chats[task] = (user_id, chat_id)
+        self._by_chat.setdefault((user_id, chat_id), set()).add(task)
+        task.add_done_callback(self._on_done)
+        self.started += 1
+        logger.info(f"🚀 Фоновая задача {name} запущена, выполняется: {self.in_flight}")
+        return task
+
+    def cancel_user(self, user_id: int) -> int:
+        """Отменить все задачи пользователя; возвращает число отмененных"""
+        return self._cancel(list(self._by_user.get(user_id, ())))
+
+    def cancel_all(self) -> int:
+        """Отменить все задачи (при остановке бота)"""
+        return self._cancel(list(self._owners))
+
+    def cancel_chat(self, user_id: int, chat_id: Optional[int]) -> int:
+        """Отменить задачи пользователя в чате (пользователь ушел на другой экран)"""
+        cancelled = self._cancel(list(self._by_chat.get((user_id, chat_id), ())))
+        if cancelled:
+            logger.info(f"🛑 Отменено задач пользователя {user_id} в чате {chat_id}: {cancelled}")
+        return cancelled
+
+    def _cancel(self, tasks) -> int:
+        cancelled = 0
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+            # Отмененная задача сразу перестает занимать лимит пользователя
+            self._forget(task)
+        return cancelled
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться завершения всех задач; False, если за timeout завершились не все"""
+        if not self._owners:
+            return True
+        _, pending = await asyncio.wait(list(self._owners), timeout=timeout)
+        return not pending
+
+    async def _run(self, coro: Coroutine, name: str, span: Optional[Span] = None):
+        try:
+            with use_span(span):
+                result = await coro
+            self.completed += 1
+            return result
+        except asyncio.CancelledError:
+            logger.info(f"🛑 Фоновая задача {name} отменена")
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка фоновой задачи {name}: {e}")
+
+    def _forget(self, task: asyncio.Task):
+        """Убрать задачу из учета по пользователю и чату"""
+        slot = self._chats.pop(task, None)
+        if slot is None:
+            return
+        for index, key in ((self._by_user, slot[0]), (self._by_chat, slot)):
+            tasks = index.get(key)
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks:
+                    del index[key]
+
+    def _on_done(self, task: asyncio.Task):
+        self._owners.pop(task, None)
+        # Задача могла быть отменена до запуска - закрываем корутину, чтобы она не повисла
+        self._coros.pop(task).close()
+        self._forget(task)
+        span = self._spans.pop(task, None)
+        if span is not None:
+            span.end(error=asyncio.CancelledError() if task.cancelled() else None)
+
+        if task.cancelled():
+            self.cancelled += 1
@@ -0,0 +1,205 @@
+import re
+import html
+from typing import List, Optional, Tuple
+
+# Поддерживаемые инлайн-разметки Markdown и соответствующие HTML теги Telegram
+_INLINE_TAGS = {
+    '**': 'b',
+    '__': 'b',
+    '*': 'i',
+    '_': 'i',
+    '~~': 's',
+}
+
+_FENCE_RE = re.compile(r'^\s*```\s*([\w+#-]*)\s*$')
+_HEADING_RE = re.compile(r'^\s*#{1,6}\s+(.*?)\s*#*\s*$')
+_BULLET_RE = re.compile(r'^(\s*)[-*+•]\s+(.*)$')
+_QUOTE_RE = re.compile(r'^\s*>\s?(.*)$')
+_RULE_RE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+_LINK_RE = re.compile(r'\[([^\[\]\n]+)\]\(\s*(\S+?)\s*\)')
+_SAFE_URL_RE = re.compile(r'^(https?://|tg://|mailto:)', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPECIAL_RE = re.compile(r'[`\[*_~]')
+
+
+def escape_html(text: str) -> str:
+    """Экранирование текста для parse_mode='HTML'"""
+    return html.escape(text, quote=False)
+
+
+def html_to_text(rendered: str) -> str:
+    """Убрать HTML теги и вернуть видимый текст сообщения"""
+    return html.unescape(_TAG_RE.sub('', rendered))
+
+
+def markdown_to_html(text: str) -> str:
+    """Преобразование Markdown от Grok в корректный HTML для Telegram.
+
+    Результат всегда экранирован и сбалансирован: незакрытые выделения
+    выводятся как обычный текст, незакрытый блок кода закрывается в конце.
+    Поэтому Telegram принимает сообщение с первой попытки, без повторной
+    отправки plain text.
+    """
+    output: List[str] = []
+    code_lines: Optional[List[str]] = None
+    code_language = ''
+
+    for line in text.split('\n'):
+        fence = _FENCE_RE.match(line)
+
+        if code_lines is not None:
+            if fence and not fence.group(1):
+                output.append(_render_code_block(code_lines, code_language))
+                code_lines = None
+            else:
+                code_lines.append(line)
+            continue
+
+        if fence:
+            code_lines = []
+            code_language = fence.group(1)
+            continue
+
+        output.append(_render_line(line))
+
+    if code_lines is not None:
+        output.append(_render_code_block(code_lines, code_language))
+
+    return '\n'.join(output)
+
+
+def _render_code_block(lines: List[str], language: str) -> str:
+    code = escape_html('\n'.join(lines))
+    if language:
+        return f'<pre><code class="language-{escape_html(language)}">{code}</code></pre>'
+    return f'<pre>{code}</pre>'
+
+
+def _render_line(line: str) -> str:
+    """Блочная разметка одной строки: заголовки, списки, цитаты"""
+    heading = _HEADING_RE.match(line)
+    if heading:
+        content = heading.group(1).strip()
+        # Заголовок и так выделен жирным - убираем лишнее выделение внутри
+        if content.startswith('**') and content.endswith('**') and len(content) > 4:
+            content = content[2:-2]
+        return f'<b>{render_inline(content)}</b>'
+
+    if _RULE_RE.match(line):
+        return '──────────'
+
+    bullet = _BULLET_RE.match(line)
+    if bullet:
+        return f'{bullet.group(1)}• {render_inline(bullet.group(2))}'
+
+    quote = _QUOTE_RE.match(line)
+    if quote:
+        return f'<blockquote>{render_inline(quote.group(1))}</blockquote>'
+
+    return render_inline(line)
+
+
+def render_inline(text: str) -> str:
+    """Инлайн-разметка: жирный, курсив, зачеркнутый, код и ссылки"""
+    # Каждый элемент - (html, открывающий разделитель или None)
+    pieces: List[Tuple[str, Optional[str]]] = []
+    # Стек открытых разделителей: (разделитель, индекс в pieces)
+    stack: List[Tuple[str, int]] = []
+    i = 0
+    length = len(text)
+    plain_start = 0
+
+    def flush_plain(end: int):
+        if end > plain_start:
+            pieces.append((escape_html(text[plain_start:end]), None))
+
+    while i < length:
+        # Обычный текст пропускаем целиком до следующего спецсимвола
+        special = _SPECIAL_RE.search(text, i)
+        if not special:
+            break
+        i = special.start()
+        char = text[i]
+
+        # Инлайн-код: содержимое не разбирается
+        if char == '`':
+            close = text.find('`', i + 1)
+            if close > i + 1:
+                flush_plain(i)
+                pieces.append((f'<code>{escape_html(text[i + 1:close])}</code>', None))
+                i = plain_start = close + 1
+                continue
+
+        # Ссылки [текст](url)
+        if char == '[':
+            link = _LINK_RE.match(text, i)
+            if link:
+                flush_plain(i)
+                label, url = link.group(1), link.group(2)
+                if _SAFE_URL_RE.match(url):
+                    href = html.escape(url, quote=True)
+                    pieces.append((f'<a href="{href}">{render_inline(label)}</a>', None))
+                else:
+                    pieces.append((f'{render_inline(label)} ({escape_html(url)})', None))
+                i = plain_start = link.end()
+                continue
+
+        delimiter = _match_delimiter(text, i)
+        if delimiter:
+            prev_char = text[i - 1] if i > 0 else ' '
+            next_pos = i + len(delimiter)
+            next_char = text[next_pos] if next_pos < length else ' '
+            open_index = _find_open(stack, delimiter)
+
+            can_close = open_index is not None and not prev_char.isspace()
+            can_open = not next_char.isspace()
+            if delimiter in ('_', '__'):
+                # Подчеркивания внутри слов (snake_case) не являются разметкой
+                can_close = can_close and not next_char.isalnum()
+                can_open = can_open and not prev_char.isalnum()
+
+            if can_close:
+                flush_plain(i)
+                _close(pieces, stack, open_index)
+                i = plain_start = next_pos
+                continue
+            if can_open:
+                flush_plain(i)
+                stack.append((delimiter, len(pieces)))
+                pieces.append((escape_html(delimiter), delimiter))
+                i = plain_start = next_pos
+                continue
+
+        i += 1
+
+    flush_plain(length)
+    # Незакрытые разделители остаются обычным текстом
+    return ''.join(piece for piece, _ in pieces)
+
+
+def _match_delimiter(text: str, pos: int) -> Optional[str]:
+    for delimiter in ('**', '__', '~~', '*', '_'):
+        if text.startswith(delimiter, pos):
+            return delimiter
+    return None
+
+
+def _find_open(stack: List[Tuple[str, int]], delimiter: str) -> Optional[int]:
+    for index in range(len(stack) - 1, -1, -1):
+        if stack[index][0] == delimiter:
+            return index
+    return None
+
+
+def _close(pieces: List[Tuple[str, Optional[str]]], stack: List[Tuple[str, int]], open_index: int):
+    """Закрыть выделение; пересекающиеся внутренние выделения становятся текстом"""
+    delimiter, piece_index = stack[open_index]
+    # Разделители, открытые внутри и не закрытые, остаются литералами
+    del stack[open_index:]
+    tag = _INLINE_TAGS[delimiter]
+    if piece_index == len(pieces) - 1:
+        # Пустое выделение (например, "****") выводим как есть
+        pieces.append((escape_html(delimiter), None))
+        return
+    pieces[piece_index] = (f'<{tag}>', None)
+    pieces.append((f'</{tag}>', None))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Тест подавления повторных нажатий кнопок и повторных обновлений
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+
+from callback_guard import CallbackGuard
+
+
+def make_update(update_id: int, data: str, user_id: int = 1) -> dict:
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': '1',
+            'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Тест'},
+        },
+    }
+
+
+def build_dispatch(guard: CallbackGuard, handler):
+    """Порядок групп как в Application: before (-1), обработчик (0), after (1000)"""
+    async def dispatch(update_id: int, data: str):
+        update = Update.de_json(make_update(update_id, data), None)
+        try:
+            await guard.before(update, None)
+        except ApplicationHandlerStop:
+            return
+        await handler(update, None)
+        await guard.after(update, None)
+    return dispatch
+
+
+def test_repeated_taps_are_dropped():
+    """Повторное нажатие в окне после первого отбрасывается, другое нажатие проходит"""
+    print("🧪 Проверяем повторные нажатия...")
+    guard = CallbackGuard(window=0.2)
+    handled = []
+
+    async def handler(update, context):
+        handled.append(update.callback_query.data)
+
+    dispatch = build_dispatch(guard, handler)
+
+    async def scenario():
+        for update_id, data in ((1, "complete_5"), (2, "complete_5"), (3, "topic_7")):
+            await dispatch(update_id, data)
+        await asyncio.sleep(0.25)
+        await dispatch(4, "complete_5")
+
+    asyncio.run(scenario())
+    print(f"   Обработано: {handled}, отброшено: {guard.duplicate_taps}")
+    assert handled == ["complete_5", "topic_7", "complete_5"]
+    assert guard.duplicate_taps == 1
+    print("✅ Повторное нажатие отброшено")
+
+
+def test_held_until_background_task_finishes():
+    """Пока идет фоновая задача нажатия, повторы отбрасываются даже после окна"""
+    print("🧪 Проверяем удержание на время фоновой задачи...")
+    guard = CallbackGuard(window=0.01)
+    handled = []
+
+    async def handler(update, context):
+        handled.append(update.update_id)
+        guard.hold(update, asyncio.create_task(asyncio.sleep(0.2)))
+
+    dispatch = build_dispatch(guard, handler)
+
+    async def scenario():
+        await dispatch(1, "topic_7")
+        await asyncio.sleep(0.1)
+        await dispatch(2, "topic_7")
+        await asyncio.sleep(0.15)
+        await dispatch(3, "topic_7")
+
+    asyncio.run(scenario())
+    print(f"   Обработаны обновления: {handled}")
+    assert handled == [1, 3]
+    print("✅ Нажатие удерживается до конца задачи")
+
+
+def test_redelivered_update_dropped():
+    """Обновление с уже обработанным update_id не обрабатывается повторно"""
+    print("🧪 Проверяем повторную доставку обновлений...")
+    guard = CallbackGuard(window=0)
+    handled = []
+
+    async def handler(update, context):
+        handled.append(update.update_id)
+
+    dispatch = build_dispatch(guard, handler)
+
+    async def scenario():
+        for update_id, data in ((10, "page_1_2"), (10, "page_1_2"), (11, "page_1_3")):
+            await dispatch(update_id, data)
+
+    asyncio.run(scenario())
+    assert handled == [10, 11]
+    assert guard.duplicate_updates == 1
+    print("✅ Повторное обновление отброшено")
+
+
+if __name__ == "__main__":
+    test_repeated_taps_are_dropped()
+    test_held_until_background_task_finishes()
+    test_redelivered_update_dropped()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Тест проверок здоровья внутри процесса бота
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+from aiohttp.test_utils import make_mocked_request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_bot():
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    bot = AILearningBot()
+    bot.health.port = 0
+    bot.grok_service.generate_ai_topics = AsyncMock()
+    bot.grok_service.answer_question = AsyncMock()
+    return bot
+
+
+def running_application():
+    application = MagicMock()
+    application.running = True
+    application.updater.running = True
+    return application
+
+
+def test_ready_reports_state_without_grok_calls():
+    """Готовность собирается из данных в памяти, без обращений к Grok"""
+    print("🧪 Проверяем /health/ready...")
+    bot = make_bot()
+
+    async def scenario():
+        await bot.health.start(running_application())
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        response = await bot.health.ready(make_mocked_request('GET', '/health/ready'))
+        elapsed = time.perf_counter() - started
+        await bot.health.stop()
+        return response, elapsed
+
+    response, elapsed = asyncio.run(scenario())
+    body = json.loads(response.text)
+    print(f"   Статус: {response.status}, время ответа: {elapsed * 1e6:.0f} мкс")
+    assert response.status == 200
+    assert body['status'] == 'ok' and body['polling']
+    assert body['grok']['state'] == 'ok'
+    assert 'loop' in body and 'database' in body and 'background_tasks' in body
+    bot.grok_service.generate_ai_topics.assert_not_called()
+    bot.grok_service.answer_question.assert_not_called()
+    # Ответ из памяти; запас на паузы GC при полном прогоне тестов
+    assert elapsed < 0.1
+    print("✅ Проверка готовности работает")
+
+
+def test_not_ready_while_stopping_or_blocked():
+    """Бот не готов при остановке и при заблокированном event loop"""
+    print("🧪 Проверяем отказ готовности...")
+    bot = make_bot()
+    bot.health.loop_monitor.interval = 0.01
+
+    async def scenario():
+        await bot.health.start(running_application())
+        await asyncio.sleep(0.05)
+        time.sleep(bot.health.max_loop_lag + 0.2)  # синхронная блокировка loop
+        await asyncio.sleep(0.05)
+        # Проверка живости перед готовностью не должна стирать всплеск задержки
+        await bot.health.live(make_mocked_request('GET', '/health/live'))
+        blocked = await bot.health.ready(make_mocked_request('GET', '/health/ready'))
+        bot.health.stopping = True
+        stopping = await bot.health.ready(make_mocked_request('GET', '/health/ready'))
+        live = await bot.health.live(make_mocked_request('GET', '/health/live'))
+        await bot.health.stop()
+        return blocked, stopping, live
+
+    blocked, stopping, live = asyncio.run(scenario())
+    print(f"   Блокировка: {json.loads(blocked.text)['problems']}, остановка: {json.loads(stopping.text)['problems']}")
+    assert blocked.status == 503 and 'loop_lag' in json.loads(blocked.text)['problems']
+    assert stopping.status == 503 and 'stopping' in json.loads(stopping.text)['problems']
+    assert live.status == 200
+    print("✅ Отказ готовности работает")
+
+
+def test_grok_failures_are_tracked():
+    """Ошибки Grok учитываются по реальным вызовам"""
+    print("🧪 Проверяем учет ошибок Grok...")
+    from grok_service import GrokService
+
+    grok = GrokService()
+    for _ in range(3):
+        grok._record_call(False)
+    failing = grok.health()
+    grok._record_call(True)
+    recovered = grok.health()
+    assert failing['state'] == 'failing' and failing['consecutive_failures'] == 3
+    assert recovered['state'] == 'ok' and recovered['total_failures'] == 3
+    print("✅ Ошибки Grok учитываются")
+
+
+if __name__ == "__main__":
+    test_ready_reports_state_without_grok_calls()
+    test_not_ready_while_stopping_or_blocked()
+    test_grok_failures_are_tracked()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Тест пула бэкендов Grok: переключение при ошибках и лимитах, выбор по задержке
+"""
+import asyncio
+import json
+import os
+import sys
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_pool import Backend, LLMPool, parse_duration
+
+
+def make_app(calls):
+    """Три бэкенда на одном тестовом сервере: с лимитом, медленный и быстрый"""
+
+    def reply(name, content='Ответ.'):
+        calls.append(name)
+        return web.json_response({'choices': [{'message': {'content': content}, 'finish_reason': 'stop'}]})
+
+    async def limited(request):
+        calls.append('limited')
+        return web.json_response({'error': 'rate limit'}, status=429, headers={'Retry-After': '30'})
+
+    async def slow(request):
+        await asyncio.sleep(0.2)
+        return reply('slow')
+
+    async def fast(request):
+        payload = await request.json()
+        return reply('fast', f"Модель {payload['model']}.")
+
+    app = web.Application()
+    app.router.add_post('/limited', limited)
+    app.router.add_post('/slow', slow)
+    app.router.add_post('/fast', fast)
+    return app
+
+
+def run(backends, action):
+    async def scenario():
+        from grok_service import GrokService
+        calls = []
+        async with TestServer(make_app(calls)) as server:
+            for backend in backends:
+                if backend.url.startswith('/'):
+                    backend.url = str(server.make_url(backend.url))
+            grok = GrokService()
+            grok.pool = LLMPool(backends, max_wait=0)
+            try:
+                return await action(grok), calls, grok
+            finally:
+                await grok.close()
+
+    return asyncio.run(scenario())
+
+
+def test_failover_on_rate_limit_and_connection_errors():
+    """429 и недоступный адрес - запрос уходит на следующий бэкенд, лимит соблюдается"""
+    print("🧪 Проверяем переключение бэкендов...")
+    backends = [
+        Backend('limited', '/limited', 'key-1'),
+        Backend('down', 'http://127.0.0.1:1/v1/chat/completions', 'key-2'),
+        Backend('fast', '/fast', 'key-3'),
+    ]
+
+    async def action(grok):
+        answers = []
+        for _ in range(3):
+            answers.append(await grok.generate_ai_topics())
+        return answers
+
+    _, calls, grok = run(backends, action)
+    snapshot = {backend['name']: backend for backend in grok.pool.snapshot()}
+    print(f"   Вызовы: {calls}, переключений: {grok.pool.failovers}")
+    # Бэкенд с 429 больше не получает запросов до сброса лимита
+    assert calls.count('limited') == 1
+    assert calls.count('fast') == 3
+    assert snapshot['limited']['available_in'] > 20
+    assert snapshot['down']['failures'] >= 1
+    assert grok.health()['consecutive_failures'] == 0
+    print("✅ Переключение работает")
+
+
+def test_routes_by_latency_and_overrides_model():
+    """Быстрый бэкенд получает большинство запросов; локальная замена - со своей моделью"""
+    print("🧪 Проверяем выбор по задержке...")
+    backends = [Backend('slow', '/slow', 'key-1'), Backend('fast', '/fast', None, model='local-llama')]
+
+    async def action(grok):
+        return [await grok.answer_question("Что такое RAG?", {'id': 1, 'title': 'RAG'}) for _ in range(6)]
+
+    answers, calls, _ = run(backends, action)
+    print(f"   Вызовы: {calls}")
+    assert calls.count('fast') >= 4
+    assert 'Модель local-llama.' in answers
+    print("✅ Выбор по задержке работает")
+
+
+def test_parse_rate_limit_durations():
+    print("🧪 Проверяем разбор времени сброса лимита...")
+    assert parse_duration('7') == 7
+    assert parse_duration('1m30s') == 90
+    assert parse_duration('250ms') == 0.25
+    assert parse_duration(None) is None
+    print("✅ Разбор работает")
+
+
+def test_invalid_backend_specs_are_skipped():
+    """Некорректные элементы GROK_BACKENDS пропускаются, бот стартует с основными ключами; имена уникальны"""
+    print("🧪 Проверяем разбор GROK_BACKENDS...")
+    specs = [
+        {'name': 'no-url', 'key': 'k'},
+        'http://llm:8000/v1/chat/completions',
+        {'url': 'http://llm:8000/v1/chat/completions', 'weight': 'heavy'},
+        {'name': 'local', 'url': 'http://llm:8000/v1/chat/completions', 'model': 'qwen2.5-7b', 'rpm': 60},
+        # Повторяющиеся имена: при повторе запроса бэкенды исключаются по имени
+        {'name': 'local', 'url': 'http://llm2:8000/v1/chat/completions'},
+        {'name': 'xai', 'url': 'http://proxy:8000/v1/chat/completions'},
+    ]
+    saved = {name: os.environ.get(name) for name in ('GROK_BACKENDS', 'GROK_API_KEYS', 'GROK_API_KEY')}
+    try:
+        os.environ.pop('GROK_API_KEYS', None)
+        os.environ['GROK_API_KEY'] = 'main-key'
+        os.environ['GROK_BACKENDS'] = json.dumps(specs)
+        names = [backend.name for backend in LLMPool.from_env().backends]
+        os.environ['GROK_BACKENDS'] = json.dumps({'url': 'http://llm:8000'})
+        fallback = [backend.name for backend in LLMPool.from_env().backends]
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    print(f"   Бэкенды: {names}, без корректных элементов: {fallback}")
+    assert names == ['xai', 'local', 'local-2', 'xai-2']
+    assert fallback == ['xai']
+    print("✅ Некорректные элементы пропущены")
+
+
+if __name__ == "__main__":
+    test_failover_on_rate_limit_and_connection_errors()
+    test_routes_by_latency_and_overrides_model()
+    test_parse_rate_limit_durations()
+    test_invalid_backend_specs_are_skipped()
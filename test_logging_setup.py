@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Тест логирования через очередь: JSON-записи, trace_id, выборка больших текстов
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import logging_setup
+import tracing
+
+
+def test_records_are_written_off_thread_as_json():
+    """Запись в файл идет в потоке слушателя, строки - JSON с trace_id и extra"""
+    print("🧪 Проверяем очередь логов...")
+    log_file = os.path.join(tempfile.mkdtemp(), 'bot.log')
+    writer_threads = set()
+
+    class SlowDisk(logging.Handler):
+        def emit(self, record):
+            writer_threads.add(threading.get_ident())
+            time.sleep(0.05)
+
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    listener = logging_setup.setup_logging(level='INFO', log_file=log_file)
+    listener.handlers = listener.handlers + (SlowDisk(),)
+    try:
+        logger = logging.getLogger('test_logging')
+        started = time.perf_counter()
+        with tracing.span('update', root=True) as span:
+            for i in range(10):
+                logger.info(f"Сообщение {i}", extra={'topic_id': 7})
+        elapsed = time.perf_counter() - started
+        try:
+            raise ValueError("сбой")
+        except ValueError:
+            logger.exception("Ошибка обработки")
+    finally:
+        logging_setup.stop_logging()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
+
+    with open(log_file, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    print(f"   10 записей за {elapsed * 1000:.1f} мс при медленном диске")
+    assert elapsed < 0.1
+    assert threading.get_ident() not in writer_threads
+    assert records[0]['message'] == "Сообщение 0" and records[0]['topic_id'] == 7
+    assert records[0]['trace_id'] == span.trace.trace_id
+    assert 'ValueError' in records[-1]['exc']
+    print("✅ Логи пишутся в фоне")
+
+
+def test_payload_sampling_and_cap():
+    """Большой текст пишется только в выборке и обрезается"""
+    print("🧪 Проверяем выборку больших текстов...")
+    messages = []
+
+    class Collect(logging.Handler):
+        def emit(self, record):
+            messages.append(record)
+
+    logger = logging.getLogger('test_payload')
+    logger.propagate = False
+    logger.addHandler(Collect())
+    logger.setLevel(logging.INFO)
+    saved = logging_setup.PAYLOAD_SAMPLE_RATE, logging_setup.PAYLOAD_MAX_CHARS
+    try:
+        logging_setup.PAYLOAD_SAMPLE_RATE, logging_setup.PAYLOAD_MAX_CHARS = 0.0, 100
+        logging_setup.log_payload(logger, "Ответ", "x" * 5000)
+        assert messages == []
+        logging_setup.PAYLOAD_SAMPLE_RATE = 1.0
+        logging_setup.log_payload(logger, "Ответ", "x" * 5000)
+    finally:
+        logging_setup.PAYLOAD_SAMPLE_RATE, logging_setup.PAYLOAD_MAX_CHARS = saved
+    assert len(messages) == 1
+    assert messages[0].payload_chars == 5000
+    assert len(messages[0].getMessage()) < 200
+    print("✅ Большие тексты ограничены")
+
+
+if __name__ == "__main__":
+    test_records_are_written_off_thread_as_json()
+    test_payload_sampling_and_cap()
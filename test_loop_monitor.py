@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Тест монитора event loop: задержка, перцентили, стек блокирующего кода
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loop_monitor import LoopMonitor
+
+
+def blocking_parser():
+    """Синхронный код, который держит event loop"""
+    time.sleep(0.4)
+
+
+def test_stall_is_logged_with_stack():
+    """Блокировка loop обнаруживается во время блокировки, стек указывает на виновника"""
+    print("🧪 Проверяем обнаружение блокировки...")
+    monitor = LoopMonitor(interval=0.02, block_threshold=0.15)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.2)
+        blocking_parser()
+        await asyncio.sleep(0.1)
+        snapshot = monitor.snapshot()
+        await monitor.stop()
+        return snapshot
+
+    snapshot = asyncio.run(scenario())
+    print(f"   Блокировок: {monitor.stalls}, задержка: max {snapshot['max_lag']} сек., p99 {snapshot['p99']} сек.")
+    assert monitor.stalls == 1
+    assert 'blocking_parser' in monitor.last_stall_stack
+    assert snapshot['max_lag'] >= 0.3
+    assert snapshot['p50'] < 0.05
+    print("✅ Блокировка найдена")
+
+
+def test_percentiles():
+    """Перцентили считаются по окну измерений"""
+    monitor = LoopMonitor(interval=1, block_threshold=0, window=100)
+    monitor.samples.extend(i / 1000 for i in range(100))
+    percentiles = monitor.percentiles()
+    assert percentiles == {'p50': 0.05, 'p95': 0.094, 'p99': 0.098}
+    print("✅ Перцентили верные")
+
+
+def test_snapshot_keeps_recent_spike():
+    """Чтение snapshot не сбрасывает всплеск: он виден, пока не выйдет из окна recent"""
+    monitor = LoopMonitor(interval=1, block_threshold=0, window=100)
+    monitor.recent = 3
+    monitor.samples.extend([0.0, 2.5, 0.0, 0.0])
+    # Проверка живости и проверка готовности читают одно и то же
+    assert monitor.snapshot()['max_lag'] == 2.5
+    assert monitor.snapshot()['max_lag'] == 2.5
+    monitor.samples.append(0.01)
+    assert monitor.snapshot()['max_lag'] == 0.01
+    print("✅ Всплеск задержки не теряется при чтении")
+
+
+if __name__ == "__main__":
+    test_stall_is_logged_with_stack()
+    test_percentiles()
+    test_snapshot_keeps_recent_spike()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Тест поиска по материалам: фрагменты, BM25 и контекст для ответов на вопросы
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from material_index import BM25Index, chunk_materials, tokenize
+from token_budget import estimate_tokens
+
+TOPIC = {'id': 1, 'title': 'RAG', 'description': 'Генерация с поиском по документам'}
+
+MATERIALS = {
+    'tutorial': (
+        "RAG объединяет поиск документов и генерацию ответа языковой моделью.\n\n"
+        + "Эмбеддинги превращают текст в векторы, а векторная база хранит эмбеддинги документов. " * 6
+        + "\n\n"
+        + "Чанкинг делит документы на фрагменты перед индексацией. " * 6
+    ),
+    'links': "• [Документация LangChain](https://python.langchain.com)",
+    'courses': "• Курс по поиску и ранжированию",
+    'examples': "```python\nretriever = store.as_retriever()\n\ndocs = retriever.invoke(query)\n```",
+}
+
+
+def test_chunking_and_ranking():
+    """Разделы режутся по абзацам, код не разрывается, релевантный фрагмент - первый"""
+    print("🧪 Проверяем фрагменты и BM25...")
+    assert tokenize("Что такое эмбеддинги?") == tokenize("эмбеддингов")
+    chunks = chunk_materials(MATERIALS, chunk_tokens=80)
+    print(f"   Фрагментов: {len(chunks)}")
+    assert len([chunk for chunk in chunks if chunk['section'] == 'tutorial']) > 1
+    examples = [chunk for chunk in chunks if chunk['section'] == 'examples']
+    assert len(examples) == 1 and examples[0]['content'].endswith('```')
+
+    index = BM25Index(chunks)
+    found = index.search("Как хранить эмбеддинги?")
+    assert 'векторная база' in found[0]['content']
+    assert index.search("квантовая физика") == []
+
+    context = index.context("эмбеддинги и чанкинг", max_tokens=100)
+    assert context and estimate_tokens(context) <= 100
+    print("✅ Поиск по фрагментам работает")
+
+
+def test_index_built_at_save_time():
+    """Фрагменты пишутся в material_chunks при сохранении и читаются без перегенерации"""
+    print("🧪 Проверяем индекс при сохранении материалов...")
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from database import Database, Topic
+    from topic_service import TopicService
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        async with db.async_session() as session:
+            session.add(Topic(id=1, title=TOPIC['title'], description=TOPIC['description']))
+            await session.commit()
+
+        grok = AsyncMock()
+        grok.generate_learning_materials.return_value = MATERIALS
+        await TopicService(db, grok).get_material_pages(TOPIC)
+
+        # Новый сервис (как после перезапуска) - индекс собирается из базы
+        service = TopicService(db, grok)
+        context = await service.get_question_context(TOPIC, "Что делает retriever?", 200)
+        cached = 1 in service._indexes
+        empty = await service.get_question_context({'id': 2, 'title': 'Другая'}, "retriever", 200)
+        await db.close()
+        return context, cached, empty, grok.generate_learning_materials.call_count
+
+    context, cached, empty, generations = asyncio.run(scenario())
+    print(f"   Контекст: {context!r}")
+    assert 'retriever' in context
+    assert cached
+    assert empty is None
+    assert generations == 1
+    print("✅ Индекс строится при сохранении")
+
+
+if __name__ == "__main__":
+    test_chunking_and_ranking()
+    test_index_built_at_save_time()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Тест готовых страниц материалов: форматирование и разбивка один раз при сохранении
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from material_pages import build_material_pages
+from message_splitter import visible_length, MAX_MESSAGE_LENGTH
+
+TOPIC = {
+    'id': 1,
+    'title': 'Детекция аномалий',
+    'description': 'Поиск необычных транзакций',
+    'learning_time': '1-3 дня',
+    'difficulty': 'Средний',
+}
+
+MATERIALS = {
+    'tutorial': "**Введение** 🚀 " + "Подробное объяснение метода. " * 400,
+    'links': "• [Документация](https://example.com)",
+    'courses': "• Курс по ML",
+    'examples': "```python\nprint('пример')\n```",
+}
+
+
+def test_pages_are_ready_to_send():
+    """Страницы укладываются в лимит, пронумерованы и знают свои разделы"""
+    print("🧪 Проверяем построение страниц...")
+    pages = build_material_pages(TOPIC, MATERIALS)
+    print(f"   Страниц: {len(pages)}")
+
+    assert len(pages) > 1
+    for page in pages:
+        assert visible_length(page['content']) <= MAX_MESSAGE_LENGTH
+        assert page['content'].startswith(f"📄 Часть {page['page_number']}/{len(pages)}")
+    assert pages[0]['sections'][:2] == ['overview', 'tutorial']
+    assert 'examples' in pages[-1]['sections']
+    print("✅ Страницы готовы к отправке")
+
+
+def test_pages_built_once():
+    """Повторное открытие темы берет страницы из базы без повторного рендеринга"""
+    print("🧪 Проверяем кеширование страниц...")
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from database import Database, Topic
+    from topic_service import TopicService
+    import topic_service as topic_service_module
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        async with db.async_session() as session:
+            session.add(Topic(id=1, title=TOPIC['title'], description=TOPIC['description']))
+            await session.commit()
+
+        grok = AsyncMock()
+        grok.generate_learning_materials.return_value = MATERIALS
+        service = TopicService(db, grok)
+
+        with patch.object(topic_service_module, 'build_material_pages',
+                          wraps=build_material_pages) as builder:
+            first = await service.get_material_pages(TOPIC)
+            second = await service.get_material_pages(TOPIC)
+
+        return first, second, builder.call_count, grok.generate_learning_materials.call_count
+
+    first, second, builds, generations = asyncio.run(scenario())
+    print(f"   Построений: {builds}, генераций: {generations}")
+    assert first == second
+    assert builds == 1
+    assert generations == 1
+    print("✅ Страницы строятся один раз")
+
+
+def test_legacy_materials_get_pages_once():
+    """Материалы, сохраненные без страниц, получают страницы при первом открытии"""
+    print("🧪 Проверяем страницы для материалов старого формата...")
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from datetime import datetime, timezone
+    from database import Database, LearningMaterial, Topic
+    from topic_service import TopicService
+    import topic_service as topic_service_module
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        async with db.async_session() as session:
+            session.add(Topic(id=1, title=TOPIC['title'], description=TOPIC['description']))
+            for material_type, content in MATERIALS.items():
+                session.add(LearningMaterial(topic_id=1, material_type=material_type, title=material_type,
+                                             content=content, created_at=datetime.now(timezone.utc)))
+            await session.commit()
+
+        grok = AsyncMock()
+        with patch.object(topic_service_module, 'build_material_pages',
+                          wraps=build_material_pages) as builder:
+            first = await TopicService(db, grok).get_material_pages(TOPIC)
+            # Новый сервис (как после перезапуска) читает страницы из базы
+            restarted = TopicService(db, grok)
+            second = await restarted.get_material_pages(TOPIC)
+            context = await restarted.get_question_context(TOPIC, "Подробное объяснение метода", 200)
+
+        await db.close()
+        return first, second, context, builder.call_count, grok.generate_learning_materials.call_count
+
+    first, second, context, builds, generations = asyncio.run(scenario())
+    print(f"   Построений: {builds}, генераций: {generations}")
+    assert first == second
+    assert builds == 1
+    assert generations == 0
+    assert context and 'объяснение' in context
+    print("✅ Страницы старых материалов сохранены")
+
+
+def test_viewer_uses_single_message():
+    """Тема открывается одним сообщением, страницы листаются его редактированием"""
+    print("🧪 Проверяем постраничный просмотр...")
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    pages = build_material_pages(TOPIC, MATERIALS)
+    bot = AILearningBot()
+    bot.topic_service = MagicMock()
+    bot.topic_service.get_topic_by_id = AsyncMock(return_value=TOPIC)
+    bot.topic_service.get_material_pages = AsyncMock(return_value=pages)
+    bot.topic_service.get_stored_pages = AsyncMock(return_value=pages)
+    bot.db = MagicMock()
+    bot.db.set_current_topic = AsyncMock()
+
+    def make_update(data):
+        update = MagicMock()
+        update.callback_query.data = data
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.edit_message_text = AsyncMock()
+        update.callback_query.message.reply_text = AsyncMock()
+        return update
+
+    async def open_topic(update):
+        await bot.handle_topic_selection(update, MagicMock())
+        # Материалы загружаются в фоновой задаче
+        await bot.tasks.wait()
+
+    opened = make_update("topic_1")
+    asyncio.run(open_topic(opened))
+    opened.callback_query.edit_message_text.assert_called_once()
+    opened.callback_query.message.reply_text.assert_not_called()
+
+    flipped = make_update("page_1_2")
+    asyncio.run(bot.show_material_page(flipped, MagicMock()))
+    args, kwargs = flipped.callback_query.edit_message_text.call_args
+    assert args[0] == pages[1]['content']
+    buttons = [button.callback_data for row in kwargs['reply_markup'].inline_keyboard for button in row]
+    print(f"   Кнопки: {buttons}")
+    assert "page_1_1" in buttons and "page_1_3" in buttons
+    assert "complete_1" in buttons
+    # Страницы берутся из кеша, без генерации
+    bot.topic_service.get_material_pages.assert_called_once()
+    print("✅ Один запрос на открытие темы")
+
+
+def test_stale_page_regenerated_in_background():
+    """Страница устаревших материалов готовится в фоновой задаче, обработчик не ждет генерацию"""
+    print("🧪 Проверяем листание устаревших материалов...")
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    pages = build_material_pages(TOPIC, MATERIALS)
+    bot = AILearningBot()
+    bot.topic_service = MagicMock()
+    bot.topic_service.get_topic_by_id = AsyncMock(return_value=TOPIC)
+    bot.topic_service.get_material_pages = AsyncMock(return_value=pages)
+    bot.topic_service.get_stored_pages = AsyncMock(return_value=None)
+    bot.db = MagicMock()
+    bot.db.set_current_topic = AsyncMock()
+
+    update = MagicMock()
+    update.callback_query.data = "page_1_2"
+    update.callback_query.answer = AsyncMock()
+    update.callback_query.edit_message_text = AsyncMock()
+
+    async def scenario():
+        await bot.show_material_page(update, MagicMock())
+        in_background = bot.tasks.in_flight
+        await bot.tasks.wait()
+        return in_background
+
+    in_background = asyncio.run(scenario())
+    answer = update.callback_query.answer.call_args.args[0]
+    print(f"   Ответ на нажатие: {answer}")
+    assert in_background == 1
+    assert answer.startswith("🔄")
+    assert update.callback_query.edit_message_text.call_args.args[0] == pages[1]['content']
+    print("✅ Материалы обновлены в фоне")
+
+
+def test_document_sent_by_file_id_after_first_upload():
+    """Файл материалов загружается один раз, дальше отправляется по file_id"""
+    print("🧪 Проверяем отправку материалов файлом...")
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from bot import AILearningBot
+    from database import Database, Topic
+    from topic_service import TopicService
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        async with db.async_session() as session:
+            session.add(Topic(id=1, title=TOPIC['title'], description=TOPIC['description']))
+            await session.commit()
+
+        grok = AsyncMock()
+        grok.generate_learning_materials.return_value = MATERIALS
+        bot = AILearningBot()
+        bot.topic_service = TopicService(db, grok)
+
+        sent = []
+
+        async def send_document(chat_id, document, **kwargs):
+            sent.append(document)
+            message = MagicMock()
+            message.document.file_id = "FILE_ID_1"
+            return message
+
+        context = MagicMock()
+        context.bot.send_document = send_document
+        for _ in range(2):
+            update = MagicMock()
+            update.callback_query.data = "document_1"
+            update.callback_query.answer = AsyncMock()
+            await bot.send_material_document(update, context)
+        return sent
+
+    sent = asyncio.run(scenario())
+    print(f"   Отправки: {[type(item).__name__ for item in sent]}")
+    assert len(sent) == 2
+    assert b'<!DOCTYPE html>' in sent[0].input_file_content
+    assert sent[1] == "FILE_ID_1"
+    print("✅ Повторная отправка без загрузки")
+
+
+if __name__ == "__main__":
+    test_pages_are_ready_to_send()
+    test_pages_built_once()
+    test_legacy_materials_get_pages_once()
+    test_viewer_uses_single_message()
+    test_stale_page_regenerated_in_background()
+    test_document_sent_by_file_id_after_first_upload()
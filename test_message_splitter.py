@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Тест разбивки длинных HTML сообщений с учетом лимита Telegram в UTF-16
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from message_splitter import split_html, visible_length, utf16_length
+from telegram_markdown import markdown_to_html, html_to_text
+from test_telegram_markdown import assert_balanced
+
+
+def assert_same_text(rendered, parts):
+    """Разбивка не теряет и не дублирует текст (без учета пробелов на границах)"""
+    original = re.sub(r'\s+', '', html_to_text(rendered))
+    joined = re.sub(r'\s+', '', ''.join(html_to_text(part) for part in parts))
+    assert original == joined, "Текст потерян при разбивке"
+
+
+def test_emoji_counted_in_utf16():
+    """Эмодзи занимают две единицы UTF-16 и учитываются в лимите"""
+    print("🧪 Проверяем подсчет длины в UTF-16...")
+    assert utf16_length("🚀") == 2
+    assert utf16_length("Привет") == 6
+
+    rendered = markdown_to_html("🔥🚀📊 " * 300)
+    parts = split_html(rendered, 100)
+    print(f"   Частей: {len(parts)}")
+    for part in parts:
+        assert visible_length(part) <= 100
+        # Суррогатные пары не разорваны
+        part.encode('utf-8')
+    assert_same_text(rendered, parts)
+    print("✅ Лимит соблюдается для эмодзи")
+
+
+def test_code_block_kept_whole():
+    """Блок кода, помещающийся в сообщение, не разрывается между частями"""
+    print("🧪 Проверяем целостность блока кода...")
+    code = "```python\n" + "\n".join(f"x_{i} = {i}" for i in range(20)) + "\n```"
+    text = "Введение в тему. " * 10 + "\n\n" + code + "\n\nЗаключение."
+    rendered = markdown_to_html(text)
+    parts = split_html(rendered, 300)
+    print(f"   Частей: {len(parts)}")
+
+    with_code = [part for part in parts if '<pre>' in part]
+    assert len(with_code) == 1
+    assert 'x_0 = 0' in with_code[0] and 'x_19 = 19' in with_code[0]
+    for part in parts:
+        assert_balanced(part)
+        assert visible_length(part) <= 300
+    print("✅ Блок кода целиком в одной части")
+
+
+def test_formatting_reopened_across_parts():
+    """Выделение, разорванное между частями, закрывается и открывается заново"""
+    print("🧪 Проверяем перенос выделения...")
+    rendered = markdown_to_html("**" + "очень длинный жирный текст " * 20 + "конец**")
+    parts = split_html(rendered, 120)
+    print(f"   Частей: {len(parts)}")
+    assert len(parts) > 1
+    for part in parts:
+        assert part.startswith('<b>') and part.endswith('</b>')
+        assert_balanced(part)
+    assert_same_text(rendered, parts)
+    print("✅ Выделение корректно переносится")
+
+
+def test_long_word_is_cut():
+    """Слово длиннее лимита режется по лимиту без потери символов"""
+    print("🧪 Проверяем разрез длинного слова...")
+    rendered = markdown_to_html("a" * 250 + "😀" * 30)
+    parts = split_html(rendered, 100)
+    for part in parts:
+        assert visible_length(part) <= 100
+    assert_same_text(rendered, parts)
+    print("✅ Длинное слово разрезано")
+
+
+def test_long_fragment_split_in_linear_time():
+    """Длинный текст без тегов: части по пробелам, время на 1K символов не растет с размером"""
+    print("🧪 Проверяем разбивку длинного фрагмента...")
+    import time
+
+    def per_kilochar(size):
+        rendered = ("Привет мир 🚀 " * (size // 13 + 1))[:size]
+        started = time.perf_counter()
+        parts = split_html(rendered, 1000)
+        elapsed = time.perf_counter() - started
+        assert all(visible_length(part) <= 1000 for part in parts)
+        assert all(part.endswith(('мир', '🚀', 'Привет')) for part in parts[:-1])
+        assert_same_text(rendered, parts)
+        return elapsed / size * 1000
+
+    small, large = per_kilochar(40_000), per_kilochar(640_000)
+    print(f"   мкс/1K: {small * 1e6:.1f} -> {large * 1e6:.1f}")
+    # Квадратичная разбивка здесь замедлялась бы в ~16 раз
+    assert large < small * 4
+    print("✅ Длинный фрагмент разбит за линейное время")
+
+
+if __name__ == "__main__":
+    test_emoji_counted_in_utf16()
+    test_code_block_kept_whole()
+    test_formatting_reopened_across_parts()
+    test_long_word_is_cut()
+    test_long_fragment_split_in_linear_time()
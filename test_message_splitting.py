@@ -18,8 +18,6 @@ try:
     # Проверяем методы разбивки сообщений
     methods_to_check = [
         '_split_long_message',
-        '_send_long_message', 
-        '_send_long_text_message'
     ]
     
     for method_name in methods_to_check:
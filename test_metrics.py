@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Тест метрик Prometheus: обработчики, Grok, БД, кеши
+"""
+import asyncio
+import os
+import sys
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer, make_mocked_request
+from prometheus_client import REGISTRY
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from metrics import instrument_handler
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_handler_latency():
+    """Время обработчика попадает в гистограмму с его именем и статусом"""
+    print("🧪 Проверяем метрики обработчиков...")
+
+    async def show_topics(update, context):
+        await asyncio.sleep(0.01)
+
+    async def broken_handler(update, context):
+        raise ValueError("ошибка")
+
+    before = sample('ai_bot_handler_duration_seconds_count', handler='show_topics', status='ok')
+
+    async def scenario():
+        await instrument_handler(show_topics)(None, None)
+        try:
+            await instrument_handler(broken_handler)(None, None)
+        except ValueError:
+            pass
+
+    asyncio.run(scenario())
+    assert sample('ai_bot_handler_duration_seconds_count', handler='show_topics', status='ok') == before + 1
+    assert sample('ai_bot_handler_duration_seconds_count', handler='broken_handler', status='error') >= 1
+    assert sample('ai_bot_handler_duration_seconds_sum', handler='show_topics', status='ok') >= 0.01
+    print("✅ Метрики обработчиков работают")
+
+
+def test_grok_latency_and_tokens():
+    """Запрос к Grok: время по операции и статусу, токены из usage"""
+    print("🧪 Проверяем метрики Grok...")
+    from grok_service import GrokService
+
+    async def completions(request):
+        return web.json_response({
+            'choices': [{'message': {'content': 'Ответ'}}],
+            'usage': {'prompt_tokens': 120, 'completion_tokens': 30}
+        })
+
+    before = sample('ai_bot_grok_tokens_total', operation='answer', kind='prompt')
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', completions)
+        async with TestServer(app) as server:
+            grok = GrokService()
+            grok.base_url = str(server.make_url('/v1/chat/completions'))
+            answer = await grok.answer_question("Что такое RAG?", {'title': 'RAG'})
+            await grok.close()
+            return answer
+
+    answer = asyncio.run(scenario())
+    assert answer == 'Ответ'
+    assert sample('ai_bot_grok_tokens_total', operation='answer', kind='prompt') == before + 120
+    assert sample('ai_bot_grok_tokens_total', operation='answer', kind='completion') >= 30
+    assert sample('ai_bot_grok_request_duration_seconds_count', operation='answer', status='200') >= 1
+    print("✅ Метрики Grok работают")
+
+
+def test_db_queries_and_metrics_endpoint():
+    """SQL-запросы замеряются, /metrics отдает все группы метрик"""
+    print("🧪 Проверяем метрики БД и /metrics...")
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from bot import AILearningBot
+
+    bot = AILearningBot()
+    before = sample('ai_bot_db_query_duration_seconds_count', operation='SELECT')
+
+    async def scenario():
+        await bot.db.init_db()
+        await bot.db.get_user_stats(1)
+        return await bot.health.metrics(make_mocked_request('GET', '/metrics'))
+
+    response = asyncio.run(scenario())
+    body = response.body.decode()
+    assert sample('ai_bot_db_query_duration_seconds_count', operation='SELECT') > before
+    assert response.headers['Content-Type'].startswith('text/plain')
+    for name in ('ai_bot_handler_duration_seconds', 'ai_bot_grok_request_duration_seconds',
+                 'ai_bot_db_query_duration_seconds', 'ai_bot_background_tasks', 'ai_bot_event_loop_lag_seconds'):
+        assert name in body, name
+    print("✅ /metrics работает")
+
+
+if __name__ == "__main__":
+    test_handler_latency()
+    test_grok_latency_and_tokens()
+    test_db_queries_and_metrics_endpoint()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Тест выбора модели Grok: быстрая для простых запросов, сильная с эскалацией
+"""
+import asyncio
+import json
+import os
+import sys
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from model_router import FAST, STRONG, ModelRouter
+
+
+def test_routing_policy():
+    """Короткий простой вопрос - быстрая модель, код и учебная программа - сильная"""
+    print("🧪 Проверяем маршрутизацию...")
+    router = ModelRouter()
+    assert router.attempts('answer', "Что такое эмбеддинг?") == [FAST, STRONG]
+    assert router.attempts('answer', "Напиши пример кода для RAG на Python") == [STRONG]
+    assert router.attempts('answer', "Расскажи подробнее " * 30) == [STRONG]
+    assert router.tier_for('topics') == STRONG
+    assert router.tier_for('materials') == STRONG
+    assert router.tier_for('repair') == FAST
+    assert router.timeout(FAST) < router.timeout(STRONG)
+    print(f"   fast: {router.model(FAST)}, strong: {router.model(STRONG)}")
+    print("✅ Маршрутизация работает")
+
+
+def run_with_server(handler, action):
+    async def scenario():
+        from grok_service import GrokService
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', handler)
+        async with TestServer(app) as server:
+            grok = GrokService()
+            grok.base_url = str(server.make_url('/v1/chat/completions'))
+            try:
+                return await action(grok), grok.router.escalations
+            finally:
+                await grok.close()
+
+    return asyncio.run(scenario())
+
+
+def test_answer_escalates_when_fast_model_fails():
+    """Пустой ответ быстрой модели - вопрос повторяется на сильной"""
+    print("🧪 Проверяем эскалацию ответа...")
+    models = []
+
+    async def completions(request):
+        payload = await request.json()
+        models.append(payload['model'])
+        content = '' if payload['model'] == ModelRouter().model(FAST) else 'Эмбеддинг - вектор признаков.'
+        return web.json_response({'choices': [{'message': {'content': content}, 'finish_reason': 'stop'}]})
+
+    answer, escalations = run_with_server(
+        completions, lambda grok: grok.answer_question("Что такое эмбеддинг?", {'id': 1, 'title': 'ML'})
+    )
+    print(f"   Модели: {models}, ответ: {answer}")
+    assert models == [ModelRouter().model(FAST), ModelRouter().model(STRONG)]
+    assert answer == 'Эмбеддинг - вектор признаков.'
+    assert escalations == 1
+    print("✅ Эскалация работает")
+
+
+def test_missing_material_sections_are_repaired():
+    """Пропущенные разделы материалов дописывает быстрая модель, остальные не перегенерируются.
+
+    Запрос на досоздание уходит после завершения первого: соединение первого
+    запроса к этому моменту уже освобождено.
+    """
+    print("🧪 Проверяем восстановление разделов...")
+    requests = []
+    services = []
+
+    async def completions(request):
+        payload = await request.json()
+        in_flight = sum(backend.in_flight for backend in services[0].pool.backends)
+        requests.append((payload['model'], payload['messages'][-1]['content'], in_flight))
+        if len(requests) == 1:
+            content = "### TUTORIAL\nВведение в тему.\n### LINKS\n• [Документация](https://example.com)"
+        else:
+            content = "### COURSES\n• [Курс](https://example.com/course)\n### EXAMPLES\n```python\nprint('пример')\n```"
+        return web.json_response({'choices': [{'message': {'content': content}, 'finish_reason': 'stop'}]})
+
+    async def generate(grok):
+        services.append(grok)
+        return await grok.generate_learning_materials({'id': 1, 'title': 'RAG'})
+
+    materials, escalations = run_with_server(completions, generate)
+    print(f"   Запросы: {[(model, in_flight) for model, _, in_flight in requests]}")
+    assert len(requests) == 2
+    assert requests[0][0] == ModelRouter().model(STRONG)
+    assert requests[1][0] == ModelRouter().model(FAST)
+    assert '### COURSES' in requests[1][1] and '### TUTORIAL' not in requests[1][1]
+    # Во время досоздания открыт только сам запрос на досоздание
+    assert requests[1][2] == 1
+    assert materials['tutorial'] == 'Введение в тему.'
+    assert 'course' in materials['courses'] and 'print' in materials['examples']
+    assert escalations == 0
+    print("✅ Разделы восстановлены")
+
+
+if __name__ == "__main__":
+    test_routing_policy()
+    test_answer_escalates_when_fast_model_fails()
+    test_missing_material_sections_are_repaired()
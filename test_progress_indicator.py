@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Тест индикатора длительных операций (статус "печатает" и правки сообщения)
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from progress_indicator import ProgressIndicator
+
+
+def make_bot_and_message():
+    bot = MagicMock()
+    bot.send_chat_action = AsyncMock()
+    message = MagicMock()
+    message.edit_text = AsyncMock()
+    return bot, message
+
+
+def test_fast_operation_costs_nothing():
+    """Быстрая операция не отправляет ни статуса, ни правок"""
+    print("🧪 Проверяем быструю операцию...")
+    bot, message = make_bot_and_message()
+
+    async def scenario():
+        async with ProgressIndicator(bot, 1, message=message, action_delay=0.2, edit_delay=0.2) as progress:
+            progress.update("🤖 Генерирую...")
+            await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    bot.send_chat_action.assert_not_called()
+    message.edit_text.assert_not_called()
+    print("✅ Лишних запросов нет")
+
+
+def test_slow_operation_refreshes_action_and_debounces_edits():
+    """Статус обновляется по таймеру, частые правки объединяются"""
+    print("🧪 Проверяем длительную операцию...")
+    bot, message = make_bot_and_message()
+
+    async def scenario():
+        async with ProgressIndicator(bot, 1, message=message, action_delay=0, action_interval=0.1,
+                                     edit_delay=0.05, min_edit_interval=0.2) as progress:
+            for step in range(20):
+                progress.update(f"Шаг {step}")
+                await asyncio.sleep(0.02)
+            await asyncio.sleep(0.25)
+        return progress
+
+    progress = asyncio.run(scenario())
+    edited = [call.args[0] for call in message.edit_text.call_args_list]
+    print(f"   Статусов: {progress.actions_sent}, правки: {edited}")
+    assert progress.actions_sent >= 4
+    # 20 обновлений за 0.4 сек при интервале 0.2 сек - не больше 3 правок
+    assert 1 <= len(edited) <= 3
+    assert edited[-1] == "Шаг 19"
+    print("✅ Статус обновляется, правки объединяются")
+
+
+if __name__ == "__main__":
+    test_fast_operation_costs_nothing()
+    test_slow_operation_refreshes_action_and_debounces_edits()
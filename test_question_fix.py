@@ -18,8 +18,6 @@ def test_method_availability():
         
         # Проверяем наличие методов отправки сообщений
         methods_to_check = [
-            '_send_long_message',
-            '_send_long_text_message',
             'handle_question',
             'handle_question_button'
         ]
@@ -31,18 +29,6 @@ def test_method_availability():
             else:
                 print(f"  ❌ {method_name} - НЕ найден или не вызываемый")
         
-        print("\n🧪 Анализируем сигнатуры методов:")
-        
-        if hasattr(bot, '_send_long_message'):
-            import inspect
-            sig = inspect.signature(bot._send_long_message)
-            print(f"  📋 _send_long_message{sig}")
-            
-        if hasattr(bot, '_send_long_text_message'):
-            import inspect
-            sig = inspect.signature(bot._send_long_text_message)
-            print(f"  📋 _send_long_text_message{sig}")
-        
         return True
         
     except Exception as e:
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Тест повторного использования ответов: похожие вопросы по теме без обращения к Grok
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from question_index import QuestionIndex, vectorize
+
+TOPIC = {'id': 1, 'title': 'RAG', 'description': 'Генерация с поиском по документам'}
+
+
+def test_similar_questions_match():
+    """Перефразированный вопрос находит ответ, вопрос о другом - нет"""
+    print("🧪 Проверяем поиск похожих вопросов...")
+    index = QuestionIndex([
+        ("Как применить на практике?", "Ответ о практике"),
+        ("Что такое RAG?", "Ответ о RAG"),
+        ("Как выбрать размер чанка?", "Ответ о чанках"),
+    ])
+    match = index.match("как это применять на практике")
+    print(f"   Совпадение: {match}")
+    assert match and match[1] == "Ответ о практике"
+    assert index.match("Как мне выбрать размер чанка")[1] == "Ответ о чанках"
+    assert index.match("Что такое LLM?") is None
+    assert index.match("Как выбрать размер батча?") is None
+    assert index.match("Что это?") is None
+    assert abs(float(vectorize("Что такое RAG?") @ vectorize("что такое rag"))) > 0.99
+    print("✅ Похожие вопросы находятся")
+
+
+def test_different_questions_do_not_match():
+    """Похожие по буквам, но разные по смыслу вопросы не получают чужой ответ"""
+    print("🧪 Проверяем, что разные вопросы не совпадают...")
+    pairs = [
+        ("Почему это работает?", "Как это работает?"),
+        ("Зачем нужен RAG?", "Когда не нужен RAG?"),
+        ("Что такое LoRA?", "Где LoRA?"),
+        ("Как запустить модель на GPU?", "Как запустить модель на CPU?"),
+        ("Можно ли дообучить модель?", "Нельзя ли дообучить модель?"),
+        ("Как использовать эмбеддинги?", "Как не использовать эмбеддинги?"),
+    ]
+    for stored, asked in pairs:
+        index = QuestionIndex([(stored, "чужой ответ")])
+        score = float(index.vectors[0] @ vectorize(asked))
+        print(f"   {stored!r} / {asked!r}: близость {score:.3f}")
+        assert index.match(asked) is None, f"{asked!r} получил ответ на {stored!r}"
+    print("✅ Разные вопросы не совпадают")
+
+
+def test_index_keeps_latest_questions():
+    print("🧪 Проверяем вытеснение старых вопросов...")
+    index = QuestionIndex(max_questions=2)
+    index.add("Что такое эмбеддинг?", "первый")
+    index.add("Как работает attention?", "второй")
+    index.add("Зачем нужен reranker?", "третий")
+    assert len(index) == 2 and index.vectors.shape[0] == 2
+    assert index.match("что такое эмбеддинги") is None
+    assert index.match("А зачем нужен этот reranker")[1] == "третий"
+    print("✅ Хранятся последние вопросы")
+
+
+def test_answers_reused_across_restarts():
+    """Ответ сохраняется в question_answers; индекс темы загружается при первом вопросе и вытесняется"""
+    print("🧪 Проверяем сохраненные ответы...")
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from database import Database, Topic
+    from topic_service import TopicService
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        async with db.async_session() as session:
+            session.add(Topic(id=1, title=TOPIC['title'], description=TOPIC['description']))
+            session.add(Topic(id=2, title='LLM', description='Языковые модели'))
+            await session.commit()
+
+        service = TopicService(db, AsyncMock())
+        missed = await service.find_answer(TOPIC, "Как применить на практике?")
+        await service.save_answer(TOPIC, "Как применить на практике?", "Ответ о практике")
+        in_memory = await service.find_answer(TOPIC, "как это применять на практике")
+
+        # Новый сервис (как после перезапуска) читает ответы из базы
+        restarted = TopicService(db, AsyncMock())
+        restarted._question_indexes_size = 1
+        from_db = await restarted.find_answer(TOPIC, "Как применять на практике")
+        other_topic = await restarted.find_answer({'id': 2, 'title': 'LLM'}, "Как применить на практике?")
+        loaded = list(restarted._question_indexes)
+        await db.close()
+        return missed, in_memory, from_db, other_topic, loaded
+
+    missed, in_memory, from_db, other_topic, loaded = asyncio.run(scenario())
+    print(f"   Индексы в памяти: {loaded}")
+    assert missed is None
+    assert in_memory == "Ответ о практике"
+    assert from_db == "Ответ о практике"
+    assert other_topic is None
+    assert loaded == [2]
+    print("✅ Ответы используются повторно")
+
+
+if __name__ == "__main__":
+    test_similar_questions_match()
+    test_different_questions_do_not_match()
+    test_index_keeps_latest_questions()
+    test_answers_reused_across_restarts()
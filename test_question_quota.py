@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Тест лимитов вопросов к Grok
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from question_quota import QuestionQuota
+
+
+def test_user_limit_does_not_starve_others():
+    """Активный пользователь упирается в свой лимит, остальные продолжают спрашивать"""
+    print("🧪 Проверяем лимит на пользователя...")
+    quota = QuestionQuota(redis_url='', user_rate=1, user_burst=3, global_rate=60, global_burst=10)
+
+    async def scenario():
+        heavy = [await quota.check(1) for _ in range(10)]
+        others = [await quota.check(user_id) for user_id in range(2, 6)]
+        return heavy, others
+
+    heavy, others = asyncio.run(scenario())
+    print(f"   Активный пользователь: пропущено {sum(1 for w in heavy if w == 0)} из {len(heavy)}")
+    assert [w == 0 for w in heavy] == [True] * 3 + [False] * 7
+    assert heavy[-1] > 30  # 1 вопрос в минуту - ждать почти минуту
+    assert all(w == 0 for w in others)
+    print("✅ Лимит на пользователя работает")
+
+
+def test_global_limit_refunds_user_token():
+    """Общий лимит отказывает всем, но не расходует лимит пользователя"""
+    print("🧪 Проверяем общий лимит...")
+    quota = QuestionQuota(redis_url='', user_rate=1, user_burst=2, global_rate=1, global_burst=3)
+
+    async def scenario():
+        allowed = [await quota.check(user_id) for user_id in (1, 2, 3)]
+        rejected = await quota.check(4)
+        # Общий бакет пополнился - пользователь 4 может спросить дважды
+        quota.memory._buckets["quota:question:global"].tokens = 3
+        again = [await quota.check(4), await quota.check(4)]
+        return allowed, rejected, again
+
+    allowed, rejected, again = asyncio.run(scenario())
+    assert all(w == 0 for w in allowed)
+    assert rejected > 0
+    assert again == [0, 0]
+    assert quota.rejected == 1 and quota.allowed == 5
+    print("✅ Общий лимит работает")
+
+
+def test_question_over_quota_skips_grok():
+    """Вопрос сверх лимита получает отказ сразу, без вызова Grok"""
+    print("🧪 Проверяем отказ без обращения к Grok...")
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    bot = AILearningBot()
+    bot.question_quota = QuestionQuota(redis_url='', user_rate=1, user_burst=1)
+    bot.grok_service.answer_question = AsyncMock(return_value="Ответ")
+    bot.topic_service = MagicMock()
+    bot.topic_service.get_topic_by_id = AsyncMock(return_value={'id': 7, 'title': 'Тема'})
+    bot.topic_service.get_question_context = AsyncMock(return_value=None)
+    bot.topic_service.find_answer = AsyncMock(return_value=None)
+    bot.topic_service.save_answer = AsyncMock()
+
+    placeholder = MagicMock()
+    placeholder.edit_text = AsyncMock()
+    update = MagicMock()
+    update.effective_user.id = 1
+    update.message.text = "Что такое RAG?"
+    update.message.reply_text = AsyncMock(return_value=placeholder)
+    context = MagicMock()
+    context.user_data = {}
+    context.bot.send_chat_action = AsyncMock()
+
+    async def scenario():
+        context.user_data['waiting_for_question'] = 7
+        await bot.handle_question(update, context)
+        await bot.tasks.wait()
+        context.user_data['waiting_for_question'] = 7
+        await bot.handle_question(update, context)
+        await bot.tasks.wait()
+
+    asyncio.run(scenario())
+    reply = update.message.reply_text.call_args.args[0]
+    print(f"   Ответ бота: {reply}")
+    assert bot.grok_service.answer_question.await_count == 1
+    assert reply.startswith("🐢")
+    # Вопрос можно повторить позже без повторного нажатия кнопки
+    assert context.user_data['waiting_for_question'] == 7
+    print("✅ Лишний вопрос отклонен без вызова Grok")
+
+
+def test_question_refunded_when_task_rejected():
+    """Место в очереди заняли во время проверок: заглушка заменяется отказом, вопрос не списан"""
+    print("🧪 Проверяем отказ фоновой задачи после заглушки...")
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    bot = AILearningBot()
+    bot.question_quota = QuestionQuota(redis_url='', user_rate=1, user_burst=1)
+    bot.grok_service.answer_question = AsyncMock(return_value="Ответ")
+    bot.topic_service = MagicMock()
+    bot.topic_service.get_topic_by_id = AsyncMock(return_value={'id': 7, 'title': 'Тема'})
+    # Первая проверка в начале обработчика проходит, к моменту запуска места уже нет
+    bot.tasks.can_submit = MagicMock(side_effect=[True, False])
+
+    placeholder = MagicMock()
+    placeholder.edit_text = AsyncMock()
+    update = MagicMock()
+    update.effective_user.id = 1
+    update.message.text = "Что такое RAG?"
+    update.message.reply_text = AsyncMock(return_value=placeholder)
+    context = MagicMock()
+    context.user_data = {'waiting_for_question': 7}
+
+    async def scenario():
+        await bot.handle_question(update, context)
+        await bot.tasks.wait()
+        return await bot.question_quota.check(1)
+
+    wait = asyncio.run(scenario())
+    edited = placeholder.edit_text.call_args.args[0]
+    print(f"   Заглушка: {edited}")
+    assert edited.startswith("⏳")
+    assert bot.grok_service.answer_question.await_count == 0
+    assert wait == 0
+    assert context.user_data['waiting_for_question'] == 7
+    print("✅ Вопрос возвращен в лимит")
+
+
+if __name__ == "__main__":
+    test_user_limit_does_not_starve_others()
+    test_global_limit_refunds_user_token()
+    test_question_over_quota_skips_grok()
+    test_question_refunded_when_task_rejected()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Тест ограничителя исходящих запросов к Telegram
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.error import RetryAfter
+from rate_limiter import TokenBucket, TelegramRateLimiter
+
+
+def test_token_bucket_spreads_burst():
+    """Всплеск запросов растягивается во времени по скорости бакета"""
+    print("🧪 Проверяем token bucket...")
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    delays = [bucket.reserve() for _ in range(5)]
+    print(f"   Задержки: {[round(d, 2) for d in delays]}")
+
+    # Первые два запроса проходят сразу, остальные - с шагом 0.1 сек
+    assert delays[0] == 0 and delays[1] == 0
+    assert abs(delays[2] - 0.1) < 0.01
+    assert abs(delays[4] - 0.3) < 0.01
+    assert bucket.try_acquire() > 0
+    print("✅ Token bucket работает")
+
+
+def test_retry_after_is_handled():
+    """RetryAfter приводит к паузе и повтору, а не к ошибке"""
+    print("🧪 Проверяем обработку RetryAfter...")
+    limiter = TelegramRateLimiter(global_rate=100, chat_rate=100, chat_burst=10)
+    calls = []
+
+    async def callback(endpoint, data):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RetryAfter(0.2)
+        return True
+
+    async def scenario():
+        return await limiter.process_request(
+            callback, ('sendMessage', {}), {}, 'sendMessage', {'chat_id': 42}, None
+        )
+
+    result = asyncio.run(scenario())
+    print(f"   Попыток: {len(calls)}, пауза: {calls[1] - calls[0]:.2f} сек.")
+    assert result is True
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.19
+    assert limiter.flood_waits == 1
+    assert limiter.requests_sent == 1
+    print("✅ RetryAfter обработан")
+
+
+def test_chat_limit_does_not_block_other_chats():
+    """Лимит одного чата не задерживает отправку в другие чаты"""
+    print("🧪 Проверяем независимость лимитов чатов...")
+    limiter = TelegramRateLimiter(global_rate=1000, chat_rate=5, chat_burst=1)
+    finished = {}
+
+    async def callback(endpoint, data):
+        finished.setdefault(data['chat_id'], []).append(time.monotonic())
+        return True
+
+    async def scenario():
+        started = time.monotonic()
+        requests = [
+            limiter.process_request(callback, ('sendMessage', {'chat_id': chat_id}), {},
+                                    'sendMessage', {'chat_id': chat_id}, None)
+            for chat_id in (1, 1, 1, 2)
+        ]
+        await asyncio.gather(*requests)
+        return started
+
+    started = asyncio.run(scenario())
+    assert finished[2][0] - started < 0.05
+    assert finished[1][-1] - started >= 0.39
+    print("✅ Чаты ограничиваются независимо")
+
+
+if __name__ == "__main__":
+    test_token_bucket_spreads_burst()
+    test_retry_after_is_handled()
+    test_chat_limit_does_not_block_other_chats()
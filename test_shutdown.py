@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Тест штатной остановки бота
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_bot():
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    bot = AILearningBot()
+    bot.grok_service.close = AsyncMock()
+    bot.db.close = AsyncMock()
+    bot.question_quota.close = AsyncMock()
+    return bot
+
+
+def make_application(calls):
+    application = MagicMock()
+    application.running = True
+    application.updater.running = True
+    application.updater.stop = AsyncMock(side_effect=lambda: calls.append("updater.stop"))
+    application.stop = AsyncMock(side_effect=lambda: calls.append("stop"))
+    application.shutdown = AsyncMock(side_effect=lambda: calls.append("shutdown"))
+    return application
+
+
+def test_shutdown_drains_background_tasks():
+    """Остановка прекращает прием обновлений и дожидается начатых генераций"""
+    print("🧪 Проверяем дожидание фоновых задач...")
+    bot = make_bot()
+    calls, finished = [], []
+    application = make_application(calls)
+
+    async def generation():
+        await asyncio.sleep(0.1)
+        finished.append("generation")
+        calls.append("generation")
+
+    async def scenario():
+        bot.tasks.submit(1, generation(), name="generation")
+        await bot.shutdown(application)
+
+    asyncio.run(scenario())
+    print(f"   Порядок: {calls}")
+    assert calls == ["updater.stop", "generation", "stop", "shutdown"]
+    assert finished == ["generation"]
+    bot.grok_service.close.assert_awaited_once()
+    bot.db.close.assert_awaited_once()
+    print("✅ Генерация завершилась до остановки")
+
+
+def test_shutdown_cancels_after_deadline():
+    """Задачи, не уложившиеся в дедлайн, отменяются, остановка не зависает"""
+    print("🧪 Проверяем дедлайн остановки...")
+    os.environ['SHUTDOWN_DRAIN_TIMEOUT'] = '0.1'
+    bot = make_bot()
+    application = make_application([])
+
+    async def scenario():
+        bot.tasks.submit(1, asyncio.sleep(60), name="stuck")
+        await bot.shutdown(application)
+
+    try:
+        asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    finally:
+        del os.environ['SHUTDOWN_DRAIN_TIMEOUT']
+    print(f"   Отменено задач: {bot.tasks.cancelled}")
+    assert bot.tasks.cancelled == 1 and bot.tasks.in_flight == 0
+    application.shutdown.assert_awaited_once()
+    print("✅ Зависшая задача отменена")
+
+
+if __name__ == "__main__":
+    test_shutdown_drains_background_tasks()
+    test_shutdown_cancels_after_deadline()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Тест общего состояния диалогов (user_data) для нескольких реплик бота
+"""
+import asyncio
+import copy
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from state_store import MemoryStateStore, StatePersistence, DatabaseStateStore
+
+
+async def handle(persistence, user_data, user_id, handler):
+    """Как PTB: refresh перед обработчиком, update_user_data на очередном проходе сохранения"""
+    await persistence.refresh_user_data(user_id, user_data)
+    handler(user_data)
+    await persistence.update_user_data(user_id, copy.deepcopy(user_data))
+    await persistence._writer
+
+
+def test_question_flow_across_replicas():
+    """Кнопка "Задать вопрос" на одной реплике, текст вопроса - на другой"""
+    print("🧪 Проверяем передачу состояния между репликами...")
+    store = MemoryStateStore()
+    replica_a, replica_b = StatePersistence(store), StatePersistence(store)
+    data_a, data_b = {}, {}
+    seen = {}
+
+    async def scenario():
+        # Загрузка при старте пустая - состояние читается по мере обращений
+        assert await replica_a.get_user_data() == {}
+        await handle(replica_a, data_a, 1, lambda data: data.update(waiting_for_question='7'))
+        await handle(replica_b, data_b, 1, lambda data: seen.update(topic=data.pop('waiting_for_question', None)))
+        # Реплика A видит, что вопрос уже обработан
+        await replica_a.refresh_user_data(1, data_a)
+
+    asyncio.run(scenario())
+    print(f"   Реплика B получила тему: {seen['topic']}, состояние A: {data_a}")
+    assert seen['topic'] == '7'
+    assert data_a == {}
+    print("✅ Состояние общее для реплик")
+
+
+def test_writes_are_coalesced():
+    """Неизменившиеся данные не пишутся, изменения одного прохода уходят одним пакетом"""
+    print("🧪 Проверяем объединение записей...")
+    store = MemoryStateStore()
+    persistence = StatePersistence(store)
+
+    async def scenario():
+        for user_id in range(1, 6):
+            await persistence.update_user_data(user_id, {'waiting_for_question': str(user_id)})
+        await persistence._writer
+        for user_id in range(1, 6):
+            await persistence.update_user_data(user_id, {'waiting_for_question': str(user_id)})
+
+    asyncio.run(scenario())
+    print(f"   Пакетов: {store.batches}, записей: {persistence.writes}, пропущено: {persistence.skipped_writes}")
+    assert store.batches == 1
+    assert persistence.writes == 5 and persistence.skipped_writes == 5
+    print("✅ Записи объединяются")
+
+
+def test_unsaved_changes_survive_refresh():
+    """Чтение из хранилища не перетирает изменения, которые еще не записаны"""
+    print("🧪 Проверяем несохраненные изменения...")
+    store = MemoryStateStore()
+    store.items[('user', 1)] = '{"old": true}'
+    persistence = StatePersistence(store)
+    user_data = {}
+
+    async def scenario():
+        await persistence.refresh_user_data(1, user_data)
+        assert user_data == {'old': True}
+        user_data['waiting_for_question'] = '3'
+        await persistence.refresh_user_data(1, user_data)
+
+    asyncio.run(scenario())
+    assert user_data == {'old': True, 'waiting_for_question': '3'}
+    print("✅ Несохраненные изменения сохранены")
+
+
+def test_database_store_roundtrip():
+    """Хранилище в таблице bot_state: запись, чтение, удаление"""
+    print("🧪 Проверяем хранилище в БД...")
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from database import Database
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        persistence = StatePersistence(DatabaseStateStore(db))
+        await persistence.update_user_data(5_000_000_000, {'waiting_for_question': '12'})
+        await persistence.flush()
+        loaded = {}
+        await StatePersistence(DatabaseStateStore(db)).refresh_user_data(5_000_000_000, loaded)
+        await persistence.drop_user_data(5_000_000_000)
+        await persistence.flush()
+        dropped = await DatabaseStateStore(db).load('user', 5_000_000_000)
+        return loaded, dropped
+
+    loaded, dropped = asyncio.run(scenario())
+    print(f"   Прочитано: {loaded}")
+    assert loaded == {'waiting_for_question': '12'}
+    assert dropped is None
+    print("✅ Хранилище в БД работает")
+
+
+if __name__ == "__main__":
+    test_question_flow_across_replicas()
+    test_writes_are_coalesced()
+    test_unsaved_changes_survive_refresh()
+    test_database_store_roundtrip()
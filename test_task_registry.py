@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Тест реестра фоновых задач для долгих генераций
+"""
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from task_registry import TaskRegistry
+
+
+def test_per_user_limit_and_cancellation():
+    """Лимит задач на пользователя, отмена и подсчет выполняющихся задач"""
+    print("🧪 Проверяем лимиты и отмену...")
+    registry = TaskRegistry(max_per_user=2, max_total=10)
+
+    async def scenario():
+        first = registry.submit(1, asyncio.sleep(10), name="a")
+        second = registry.submit(1, asyncio.sleep(10), name="b")
+        rejected = registry.submit(1, asyncio.sleep(10), name="c")
+        other = registry.submit(2, asyncio.sleep(0.01), name="d")
+        in_flight = registry.in_flight
+
+        cancelled = registry.cancel_user(1)
+        finished = await registry.wait(timeout=1)
+        return first, second, rejected, other, in_flight, cancelled, finished
+
+    first, second, rejected, other, in_flight, cancelled, finished = asyncio.run(scenario())
+    print(f"   Выполнялось: {in_flight}, отменено: {cancelled}, отклонено: {registry.rejected}")
+    assert first and second and other
+    assert rejected is None
+    assert in_flight == 3
+    assert cancelled == 2
+    assert finished and registry.in_flight == 0
+    assert registry.cancelled == 2 and registry.completed == 1
+    print("✅ Лимиты и отмена работают")
+
+
+def test_question_handler_returns_immediately():
+    """Обработчик вопроса не ждет Grok: ответ приходит правкой заглушки"""
+    print("🧪 Проверяем фоновый ответ на вопрос...")
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    bot = AILearningBot()
+
+    async def slow_answer(question, topic, context=None):
+        await asyncio.sleep(0.3)
+        return "Ответ **Grok**"
+
+    bot.grok_service.answer_question = slow_answer
+    bot.db = MagicMock()
+    bot.db.get_current_topic = AsyncMock(return_value={'id': 7, 'title': 'Тема'})
+
+    placeholder = MagicMock()
+    placeholder.edit_text = AsyncMock()
+    update = MagicMock()
+    update.effective_user.id = 1
+    update.message.text = "Что такое RAG?"
+    update.message.reply_text = AsyncMock(return_value=placeholder)
+    context = MagicMock()
+    context.user_data = {}
+    context.bot.send_chat_action = AsyncMock()
+
+    async def scenario():
+        started = time.monotonic()
+        await bot.handle_question(update, context)
+        handler_time = time.monotonic() - started
+        in_flight = bot.tasks.in_flight
+        await bot.tasks.wait()
+        return handler_time, in_flight
+
+    handler_time, in_flight = asyncio.run(scenario())
+    print(f"   Обработчик: {handler_time * 1000:.0f} мс, в работе: {in_flight}")
+    assert handler_time < 0.1
+    assert in_flight == 1
+    update.message.reply_text.assert_called_once()
+    assert update.message.reply_text.call_args.args[0] == "🤔 Готовлю ответ..."
+    args, kwargs = placeholder.edit_text.call_args
+    assert "<b>Grok</b>" in args[0]
+    assert kwargs['reply_markup'] is not None
+    print("✅ Ответ доставлен правкой заглушки")
+
+
+def test_navigation_cancels_previous_generation():
+    """Выбор другой темы отменяет незавершенную генерацию в том же чате"""
+    print("🧪 Проверяем отмену при переходе...")
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    bot = AILearningBot()
+    started, finished = [], []
+
+    async def get_material_pages(topic):
+        started.append(topic['id'])
+        await asyncio.sleep(0.2)
+        finished.append(topic['id'])
+        return [{'page_number': 1, 'sections': ['overview'], 'content': f"Тема {topic['id']}"}]
+
+    bot.topic_service = MagicMock()
+    bot.topic_service.get_topic_by_id = AsyncMock(side_effect=lambda topic_id: {'id': topic_id, 'title': 'T'})
+    bot.topic_service.get_material_pages = get_material_pages
+    bot.db = MagicMock()
+    bot.db.set_current_topic = AsyncMock()
+
+    def make_update(data):
+        update = MagicMock()
+        update.callback_query.data = data
+        update.callback_query.from_user.id = 1
+        update.callback_query.message.chat_id = 100
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.edit_message_text = AsyncMock()
+        return update
+
+    first, second = make_update("topic_1"), make_update("topic_2")
+
+    async def scenario():
+        await bot.handle_topic_selection(first, MagicMock())
+        await asyncio.sleep(0.05)
+        await bot.handle_topic_selection(second, MagicMock())
+        await bot.tasks.wait()
+
+    asyncio.run(scenario())
+    print(f"   Начаты: {started}, завершены: {finished}")
+    assert started == [1, 2]
+    assert finished == [2]
+    first.callback_query.edit_message_text.assert_not_called()
+    assert bot.tasks.cancelled == 1
+    print("✅ Старая генерация отменена")
+
+
+def test_generation_coalescing():
+    """Одновременные запросы темы ждут одну генерацию; она отменяется с последним ожидающим"""
+    print("🧪 Проверяем объединение генераций...")
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from database import Database
+    from topic_service import TopicService
+
+    calls = {'started': 0, 'cancelled': 0}
+
+    async def slow_generation(topic):
+        calls['started'] += 1
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            calls['cancelled'] += 1
+            raise
+        return {'tutorial': 'Текст', 'links': '', 'courses': '', 'examples': ''}
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        grok = MagicMock()
+        grok.generate_learning_materials = slow_generation
+        service = TopicService(db, grok)
+        topic = {'id': 5, 'title': 'Тема', 'description': ''}
+
+        # Два ожидающих, один уходит - второй все равно получает результат
+        leaving = asyncio.create_task(service.get_material_pages(topic))
+        staying = asyncio.create_task(service.get_material_pages(topic))
+        await asyncio.sleep(0.05)
+        leaving.cancel()
+        pages = await staying
+
+        # Единственный ожидающий уходит - генерация отменяется
+        other = asyncio.create_task(service.get_material_pages({'id': 6, 'title': 'Другая'}))
+        await asyncio.sleep(0.05)
+        other.cancel()
+        await asyncio.gather(other, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        return pages
+
+    pages = asyncio.run(scenario())
+    print(f"   Генераций: {calls['started']}, отменено: {calls['cancelled']}")
+    assert 'Текст' in pages[0]['content']
+    assert calls['started'] == 2
+    assert calls['cancelled'] == 1
+    print("✅ Генерации объединяются и отменяются")
+
+
+if __name__ == "__main__":
+    test_per_user_limit_and_cancellation()
+    test_question_handler_returns_immediately()
+    test_navigation_cancels_previous_generation()
+    test_generation_coalescing()
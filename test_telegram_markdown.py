@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Тест преобразования Markdown от Grok в HTML для Telegram
+"""
+import asyncio
+import os
+import re
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram_markdown import markdown_to_html, html_to_text
+
+
+def assert_balanced(rendered: str):
+    """Проверяет, что все HTML теги закрыты в правильном порядке"""
+    stack = []
+    for closing, tag in re.findall(r'<(/?)(\w+)[^>]*>', rendered):
+        if closing:
+            assert stack and stack[-1] == tag, f"Несбалансированный тег </{tag}> в {rendered!r}"
+            stack.pop()
+        else:
+            stack.append(tag)
+    assert not stack, f"Незакрытые теги {stack} в {rendered!r}"
+
+
+def test_basic_formatting():
+    """Основная разметка Grok превращается в теги Telegram"""
+    print("🧪 Проверяем базовую разметку...")
+    rendered = markdown_to_html(
+        "### TUTORIAL\n"
+        "**Краткое введение** и *акцент*, `код`\n"
+        "- пункт списка\n"
+        "• **Документация:** [Docs](https://example.com/a?b=1&c=2)"
+    )
+    print(rendered)
+    assert rendered == (
+        "<b>TUTORIAL</b>\n"
+        "<b>Краткое введение</b> и <i>акцент</i>, <code>код</code>\n"
+        "• пункт списка\n"
+        "• <b>Документация:</b> <a href=\"https://example.com/a?b=1&amp;c=2\">Docs</a>"
+    )
+    print("✅ Разметка преобразована")
+
+
+def test_code_blocks_are_escaped():
+    """Содержимое блоков кода экранируется и не разбирается как Markdown"""
+    print("🧪 Проверяем блоки кода...")
+    rendered = markdown_to_html("```python\nif a < b and x_1 * 2:\n    print('**')\n```")
+    print(rendered)
+    assert rendered == (
+        '<pre><code class="language-python">if a &lt; b and x_1 * 2:\n'
+        "    print('**')</code></pre>"
+    )
+    print("✅ Код экранирован")
+
+
+def test_broken_markdown_stays_balanced():
+    """Сломанная разметка LLM всегда дает корректный HTML"""
+    print("🧪 Проверяем сломанную разметку...")
+    samples = [
+        "**незакрытый жирный",
+        "**a *b** c*",
+        "snake_case_name и __init__ метод",
+        "```\nнезакрытый блок кода <tag>",
+        "[найди: \"ключевые слова\"] и [ссылка](javascript:alert(1))",
+        "*** ** * _ __ ~~",
+        "Формула 2 * 3 * 4 < 100 & true",
+    ]
+    for sample in samples:
+        rendered = markdown_to_html(sample)
+        print(f"   {sample!r} -> {rendered!r}")
+        assert_balanced(rendered)
+        assert '<' not in html_to_text(rendered).replace('<tag>', '').replace('< 100', '')
+    print("✅ HTML всегда сбалансирован")
+
+
+def test_send_uses_single_html_request():
+    """Сообщение отправляется одним запросом с parse_mode='HTML'"""
+    print("🧪 Проверяем отправку в один запрос...")
+    os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    from bot import AILearningBot
+
+    bot = AILearningBot()
+    message = MagicMock()
+    message.edit_text = AsyncMock()
+    message.reply_text = AsyncMock()
+
+    pages = bot._split_long_message("**Ответ** с _разметкой_ и `кодом`")
+    asyncio.run(bot._deliver_pages(message, pages))
+
+    message.edit_text.assert_called_once()
+    message.reply_text.assert_not_called()
+    args, kwargs = message.edit_text.call_args
+    assert kwargs['parse_mode'] == 'HTML'
+    assert args[0] == "<b>Ответ</b> с <i>разметкой</i> и <code>кодом</code>"
+    print("✅ Один запрос к API")
+
+
+if __name__ == "__main__":
+    test_basic_formatting()
+    test_code_blocks_are_escaped()
+    test_broken_markdown_stays_balanced()
+    test_send_uses_single_html_request()
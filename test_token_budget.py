@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Тест бюджета токенов: оценка, сокращение промпта, досрочная остановка потока
+"""
+import asyncio
+import json
+import os
+import sys
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_budget import ANSWER_MAX_CHARS, budget, estimate_tokens, finish_cleanly, trim_to_tokens
+
+
+def test_estimate_and_trim():
+    """Оценка токенов для русского текста и кода, сокращение по границе предложения"""
+    print("🧪 Проверяем оценку и сокращение текста...")
+    russian = "Трансформер обрабатывает последовательность целиком. " * 40
+    code = "def answer(x):\n    return x * 2\n" * 40
+    print(f"   Русский: {len(russian)} симв. -> {estimate_tokens(russian)} ток., "
+          f"код: {len(code)} симв. -> {estimate_tokens(code)} ток.")
+    assert estimate_tokens(russian) > estimate_tokens(code)
+    assert estimate_tokens('') == 0
+
+    trimmed = trim_to_tokens(russian, 100)
+    print(f"   Сокращено до: {len(trimmed)} симв.")
+    assert estimate_tokens(trimmed) <= 101
+    assert trimmed.endswith('целиком.…')
+    assert trim_to_tokens("Короткий вопрос?", 100) == "Короткий вопрос?"
+    print("✅ Оценка и сокращение работают")
+
+
+def test_finish_cleanly():
+    """Обрезанный ответ заканчивается целым предложением, блок кода закрыт"""
+    print("🧪 Проверяем чистое завершение ответа...")
+    text = "Первое предложение. Второе предложение! Третье обрывает"
+    assert finish_cleanly(text, 1000) == "Первое предложение. Второе предложение!"
+
+    with_code = "Пример кода. Смотрите:\n\n```python\nprint('привет')\nx = 1"
+    finished = finish_cleanly(with_code, 1000)
+    print(f"   {finished!r}")
+    assert finished.count('```') % 2 == 0
+    print("✅ Ответ завершается чисто")
+
+
+def test_answer_stream_stops_at_budget():
+    """Ответ читается потоком и прекращается, как только набран лимит сообщения"""
+    print("🧪 Проверяем досрочную остановку потока...")
+    from grok_service import GrokService
+    received = {}
+
+    async def completions(request):
+        received['payload'] = await request.json()
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        sent = 0
+        try:
+            for _ in range(1000):
+                chunk = {'choices': [{'delta': {'content': 'Нейросеть учится на примерах. '}}]}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                sent += 1
+                await asyncio.sleep(0.001)
+            await response.write(b"data: [DONE]\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            received['sent'] = sent
+        return response
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', completions)
+        async with TestServer(app) as server:
+            grok = GrokService()
+            grok.base_url = str(server.make_url('/v1/chat/completions'))
+            answer = await grok.answer_question("Как учится нейросеть?", {'id': 1, 'title': 'ML'})
+            await grok.close()
+            await asyncio.sleep(0.1)
+            return answer
+
+    answer = asyncio.run(scenario())
+    print(f"   Ответ: {len(answer)} симв., фрагментов отправлено: {received['sent']} из 1000")
+    assert received['payload']['stream'] is True
+    assert received['payload']['max_tokens'] == budget('answer')['max_tokens']
+    assert len(answer) <= ANSWER_MAX_CHARS
+    assert answer.endswith('примерах.') and not answer.endswith('...')
+    assert received['sent'] < 1000
+    print("✅ Поток остановлен по бюджету")
+
+
+if __name__ == "__main__":
+    test_estimate_and_trim()
+    test_finish_cleanly()
+    test_answer_stream_stops_at_budget()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Тест трассировки: обновление -> обработчик -> фоновая задача -> БД -> Grok
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tracing
+from task_registry import TaskRegistry
+
+
+def read_traces(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def configure(sample_rate, slow_threshold):
+    path = os.path.join(tempfile.mkdtemp(), 'traces.jsonl')
+    tracing.tracer.sample_rate = sample_rate
+    tracing.tracer.slow_threshold = slow_threshold
+    tracing.tracer.path = path
+    return path
+
+
+def test_trace_covers_background_work():
+    """Трейс обновления включает фоновую задачу, SQL и запрос к Grok"""
+    print("🧪 Проверяем сквозной трейс...")
+    path = configure(sample_rate=1.0, slow_threshold=60)
+    os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+    from database import Database
+    from grok_service import GrokService
+
+    async def completions(request):
+        await asyncio.sleep(0.05)
+        return web.json_response({'choices': [{'message': {'content': 'Ответ'}}],
+                                  'usage': {'prompt_tokens': 10, 'completion_tokens': 5}})
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        app = web.Application()
+        app.router.add_post('/chat', completions)
+        registry = TaskRegistry()
+        async with TestServer(app) as server:
+            grok = GrokService()
+            grok.base_url = str(server.make_url('/chat'))
+
+            async def answer():
+                await db.get_user_stats(1)
+                await grok.answer_question("Вопрос", {'title': 'Тема'})
+
+            # Обработчик только ставит задачу и сразу завершается
+            # (счетчик общий для процесса - другие тесты могли выгрузить трейсы раньше)
+            exported_before = tracing.tracer.exported
+            with tracing.span('update', root=True, user_id=1):
+                with tracing.span('handler.handle_question'):
+                    registry.submit(1, answer(), name="question")
+            exported_early = tracing.tracer.exported - exported_before
+            await registry.wait()
+            await grok.close()
+        await asyncio.sleep(0.05)  # запись в файл идет в потоке
+        return exported_early
+
+    exported_early = asyncio.run(scenario())
+    traces = read_traces(path)
+    names = [span['name'] for span in traces[-1]['spans']]
+    print(f"   Спаны: {names}")
+    assert exported_early == 0  # трейс ждет фоновую задачу
+    assert names[:3] == ['update', 'handler.handle_question', 'task']
+    assert 'db.query' in names and 'grok.answer' in names
+    grok_span = next(span for span in traces[-1]['spans'] if span['name'] == 'grok.answer')
+    assert grok_span['attributes']['prompt_tokens'] == 10
+    assert traces[-1]['duration_ms'] >= 50
+    print("✅ Трейс покрывает всю работу")
+
+
+def test_sampling_keeps_slow_and_failed_traces():
+    """Быстрые трейсы вне выборки не пишутся, медленные и с ошибкой - пишутся"""
+    print("🧪 Проверяем выборку трейсов...")
+    path = configure(sample_rate=0.0, slow_threshold=0.05)
+
+    async def scenario():
+        with tracing.span('fast', root=True):
+            pass
+        with tracing.span('slow', root=True):
+            await asyncio.sleep(0.06)
+        try:
+            with tracing.span('failed', root=True):
+                raise ValueError("ошибка")
+        except ValueError:
+            pass
+        # Вне трейса внутренние спаны ничего не создают
+        with tracing.span('db.query') as orphan:
+            assert orphan is None
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    names = [trace['name'] for trace in read_traces(path)]
+    print(f"   Записаны: {names}")
+    assert names == ['slow', 'failed']
+    print("✅ Выборка работает")
+
+
+def test_task_cancelled_before_start_closes_trace():
+    """Задача, отмененная до запуска, не оставляет трейс открытым"""
+    print("🧪 Проверяем отмену до запуска...")
+    configure(sample_rate=1.0, slow_threshold=60)
+    registry = TaskRegistry()
+
+    async def scenario():
+        with tracing.span('update', root=True) as root:
+            registry.submit(1, asyncio.sleep(10), name="stuck")
+            registry.cancel_user(1)
+        await registry.wait()
+        return root.trace
+
+    trace = asyncio.run(scenario())
+    assert trace.open_spans == 0
+    assert [span.status for span in trace.spans] == ['ok', 'cancelled']
+    print("✅ Трейс закрыт")
+
+
+if __name__ == "__main__":
+    test_trace_covers_background_work()
+    test_sampling_keeps_slow_and_failed_traces()
+    test_task_cancelled_before_start_closes_trace()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Тест параллельной обработки апдейтов с сохранением порядка для пользователя
+"""
+import asyncio
+import os
+import sys
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram import Update
+from update_processor import PerUserUpdateProcessor
+
+
+def make_update(user_id: int):
+    """Создает mock апдейта от пользователя"""
+    update = MagicMock(spec=Update)
+    update.effective_user = MagicMock()
+    update.effective_user.id = user_id
+    return update
+
+
+def test_same_user_updates_are_ordered():
+    """Апдейты одного пользователя обрабатываются строго по очереди"""
+    print("🧪 Проверяем порядок апдейтов одного пользователя...")
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4)
+        events = []
+
+        async def handler(name: str, delay: float):
+            events.append(f"start {name}")
+            await asyncio.sleep(delay)
+            events.append(f"end {name}")
+
+        # Долгая кнопка "Задать вопрос", затем быстрый текст вопроса
+        await asyncio.gather(
+            processor.process_update(make_update(1), handler("button", 0.05)),
+            processor.process_update(make_update(1), handler("question", 0)),
+        )
+        return events, processor
+
+    events, processor = asyncio.run(scenario())
+    print(f"   События: {events}")
+    assert events == ["start button", "end button", "start question", "end question"]
+    assert processor.pending_updates == 0
+    assert processor.active_updates == 0
+    assert not processor._user_locks
+    print("✅ Порядок сохраняется")
+
+
+def test_different_users_run_concurrently():
+    """Медленный хендлер одного пользователя не блокирует других"""
+    print("🧪 Проверяем параллельность для разных пользователей...")
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4)
+        events = []
+
+        async def slow():
+            events.append("slow start")
+            await asyncio.sleep(0.1)
+            events.append("slow end")
+
+        async def fast():
+            events.append("fast")
+
+        await asyncio.gather(
+            processor.process_update(make_update(1), slow()),
+            processor.process_update(make_update(2), fast()),
+        )
+        return events
+
+    events = asyncio.run(scenario())
+    print(f"   События: {events}")
+    assert events.index("fast") < events.index("slow end")
+    print("✅ Пользователи обрабатываются параллельно")
+
+
+def test_concurrency_limit():
+    """Одновременно выполняется не больше max_concurrent_updates хендлеров"""
+    print("🧪 Проверяем лимит параллельности...")
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+        peak = 0
+
+        async def handler():
+            nonlocal peak
+            peak = max(peak, processor.active_updates)
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[
+            processor.process_update(make_update(user_id), handler())
+            for user_id in range(10)
+        ])
+        return peak
+
+    peak = asyncio.run(scenario())
+    print(f"   Пиковая параллельность: {peak}")
+    assert peak == 2
+    print("✅ Лимит соблюдается")
+
+
+def test_user_burst_does_not_starve_others():
+    """Очередь апдейтов одного пользователя не занимает слоты обработки других"""
+    print("🧪 Проверяем, что поток апдейтов одного пользователя не блокирует других...")
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        other_ran_at = None
+
+        async def slow():
+            await asyncio.sleep(0.1)
+
+        async def instant():
+            nonlocal other_ran_at
+            other_ran_at = loop.time() - started
+
+        burst = [processor.process_update(make_update(1), slow()) for _ in range(5)]
+        await asyncio.gather(*burst, processor.process_update(make_update(2), instant()))
+        return other_ran_at, processor
+
+    other_ran_at, processor = asyncio.run(scenario())
+    print(f"   Другой пользователь обработан через {other_ran_at:.3f} сек.")
+    assert other_ran_at < 0.05
+    assert processor.max_concurrent_updates >= 256
+    print("✅ Другие пользователи не ждут")
+
+
+if __name__ == "__main__":
+    test_same_user_updates_are_ordered()
+    test_different_users_run_concurrently()
+    test_concurrency_limit()
+    test_user_burst_does_not_starve_others()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Тест журнала вызовов Grok: токены, время, стоимость, сводки по операциям и темам
+"""
+import asyncio
+import os
+import sys
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///:memory:'
+
+from database import Database, Topic
+from usage_ledger import UsageLedger, call_context, format_rollup, parse_prices
+
+
+def test_grok_calls_are_recorded_in_batches():
+    """Каждый вызов Grok попадает в grok_calls: токены из usage, статус, тема, промах кеша"""
+    print("🧪 Проверяем журнал вызовов Grok...")
+    from grok_service import GrokService
+
+    async def completions(request):
+        payload = await request.json()
+        if 'сломай' in payload['messages'][-1]['content']:
+            return web.json_response({'error': 'overloaded'}, status=503)
+        return web.json_response({
+            'choices': [{'message': {'content': 'Ответ'}}],
+            'usage': {'prompt_tokens': 1000, 'completion_tokens': 200}
+        })
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        async with db.async_session() as session:
+            session.add(Topic(id=7, title='RAG', category='general'))
+            await session.commit()
+
+        ledger = UsageLedger(db, flush_interval=60)
+        ledger.prices = parse_prices('grok-4-latest:3/15,grok-3-mini:0.3/0.5')
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', completions)
+        async with TestServer(app) as server:
+            grok = GrokService()
+            grok.ledger = ledger
+            grok.base_url = str(server.make_url('/v1/chat/completions'))
+            await grok.answer_question("Что такое RAG?", {'id': 7, 'title': 'RAG'})
+            await grok.answer_question("сломай", {'id': 7, 'title': 'RAG'})
+            with call_context(cache='miss'):
+                await grok.generate_learning_materials({'id': 7, 'title': 'RAG'})
+            await grok.close()
+
+        # До flush_interval в БД ничего не пишется - запись не задерживает ответы
+        buffered = len(ledger._buffer)
+        await ledger.close()
+        rollup = await ledger.rollup(days=1)
+        await db.close()
+        return buffered, ledger.written, rollup
+
+    buffered, written, rollup = asyncio.run(scenario())
+    print(f"   В буфере: {buffered}, записано одним пакетом: {written}")
+    print(f"   Операции: {rollup['operations']}")
+    # Ошибка быстрой модели повторяется на сильной - два вызова
+    assert buffered == 4 and written == 4
+    answer = rollup['operations']['answer']
+    assert answer['calls'] == 3 and answer['errors'] == 2
+    assert answer['prompt_tokens'] == 1000 and answer['completion_tokens'] == 200
+    # Короткий вопрос - быстрая модель: 1000 * $0.3 + 200 * $0.5 за 1M токенов
+    assert abs(answer['cost_usd'] - 0.0004) < 1e-9
+    materials = rollup['operations']['materials']
+    assert materials['cache_misses'] == 1
+    assert abs(materials['cost_usd'] - 0.006) < 1e-9
+    assert rollup['topics']['RAG']['calls'] == 4
+    assert 'RAG' in format_rollup(rollup)
+    print("✅ Журнал вызовов Grok работает")
+
+
+def test_rollup_aggregates_in_database():
+    """Сводка: суммы и среднее считает БД, p95 - по группе, сортировка по стоимости, топ тем"""
+    print("🧪 Проверяем сводку...")
+    from datetime import datetime
+    from database import GrokCall
+
+    async def scenario():
+        db = Database()
+        await db.init_db()
+        async with db.async_session() as session:
+            session.add_all([Topic(id=1, title='RAG', category='general'),
+                             Topic(id=2, title='LLM', category='general')])
+            now = datetime.utcnow()
+            session.add_all([
+                GrokCall(created_at=now, operation='answer', model='grok-3-mini', topic_id=1, status='200',
+                         prompt_tokens=10, completion_tokens=5, latency_ms=ms, cost_usd=0.001, cache='none')
+                for ms in range(100, 2100, 100)
+            ] + [
+                GrokCall(created_at=now, operation='materials', model='grok-4-latest', topic_id=2, status='503',
+                         prompt_tokens=900, completion_tokens=4000, latency_ms=30000, cost_usd=0.5, cache='miss')
+            ])
+            await session.commit()
+        rollup = await UsageLedger(db).rollup(days=1, top_topics=1)
+        await db.close()
+        return rollup
+
+    rollup = asyncio.run(scenario())
+    print(f"   {rollup['operations']}")
+    assert list(rollup['operations']) == ['materials', 'answer']
+    answer = rollup['operations']['answer']
+    assert answer['calls'] == 20 and answer['prompt_tokens'] == 200
+    assert answer['avg_latency_ms'] == 1050
+    assert answer['p95_latency_ms'] == 1900
+    assert rollup['operations']['materials']['errors'] == 1
+    assert rollup['operations']['materials']['cache_misses'] == 1
+    assert rollup['total']['calls'] == 21 and abs(rollup['total']['cost_usd'] - 0.52) < 1e-9
+    assert set(rollup['models']) == {'grok-3-mini', 'grok-4-latest'}
+    assert list(rollup['topics']) == ['LLM']
+    assert 'По моделям' in format_rollup(rollup)
+    print("✅ Сводка считается правильно")
+
+
+if __name__ == "__main__":
+    test_grok_calls_are_recorded_in_batches()
+    test_rollup_aggregates_in_database()
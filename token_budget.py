@@ -0,0 +1,113 @@
+import os
+import re
+import math
+import logging
+from typing import Dict, List
+
+from message_splitter import MAX_MESSAGE_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# Средняя длина токена в символах: латиница и код ~4, кириллица ~2.5.
+# Оценка нужна без запроса к API и с запасом - точный токенизатор Grok не публикуется
+LATIN_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 2.5
+# Запас на служебные токены сообщений (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Ответ на вопрос должен помещаться в одно сообщение Telegram вместе с заголовком и разметкой
+ANSWER_MAX_CHARS = int(os.getenv('ANSWER_MAX_CHARS', str(MAX_MESSAGE_LENGTH - 600)))
+
+# Бюджеты операций: max_tokens ответа и лимиты частей промпта (в токенах)
+_DEFAULT_BUDGETS = {
+    # 20 тем в JSON по ~250 символов
+    'topics': {'max_tokens': 4000},
+    # Четыре раздела материалов; страницы и документ строятся из всего ответа
+    'materials': {'max_tokens': 6000, 'description': 400},
+    # Одно сообщение Telegram; генерация останавливается по ANSWER_MAX_CHARS раньше лимита
+    # context - найденные по вопросу фрагменты материалов (material_index.py)
+    'answer': {'max_tokens': 0, 'description': 300, 'question': 800, 'context': 700},
+    'news': {'max_tokens': 3000},
+    # Дописывание пропущенных разделов материалов
+    'repair': {'max_tokens': 3000},
+}
+
+_SENTENCE_END_RE = re.compile(r'[.!?…](?=\s|$)|\n\n')
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов текста без токенизатора (с округлением вверх)"""
+    if not text:
+        return 0
+    latin = sum(1 for char in text if char.isascii())
+    return math.ceil(latin / LATIN_CHARS_PER_TOKEN + (len(text) - latin) / OTHER_CHARS_PER_TOKEN)
+
+
+def estimate_messages(messages: List[Dict]) -> int:
+    """Оценка токенов промпта (все сообщения запроса)"""
+    return sum(estimate_tokens(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def chars_to_tokens(chars: int) -> int:
+    """Сколько токенов нужно на chars символов русского текста (с запасом 15%)"""
+    return math.ceil(chars / OTHER_CHARS_PER_TOKEN * 1.15)
+
+
+def budget(operation: str) -> Dict[str, int]:
+    """Бюджет операции; max_tokens переопределяется GROK_MAX_TOKENS_<ОПЕРАЦИЯ>"""
+    values = dict(_DEFAULT_BUDGETS.get(operation, {'max_tokens': 4000}))
+    if operation == 'answer' and not values['max_tokens']:
+        values['max_tokens'] = chars_to_tokens(ANSWER_MAX_CHARS)
+    override = os.getenv(f'GROK_MAX_TOKENS_{operation.upper()}')
+    if override:
+        values['max_tokens'] = int(override)
+    return values
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Сократить текст до бюджета токенов по границе предложения или слова"""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    # Оценка монотонна по длине - ищем самый длинный подходящий префикс
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    trimmed = _cut_at_boundary(text[:low], min_keep=low // 2)
+    logger.debug(f"Текст сокращен до бюджета {max_tokens} токенов: {len(text)} -> {len(trimmed)} символов")
+    return trimmed + '…'
+
+
+def finish_cleanly(text: str, max_chars: int) -> str:
+    """Текст не длиннее max_chars, который заканчивается целым предложением.
+
+    Нужен, когда генерация остановлена по бюджету: вместо обрыва на
+    полуслове с "..." ответ заканчивается последним законченным
+    предложением или абзацем, а незакрытый блок кода закрывается.
+    """
+    text = text.rstrip()
+    if len(text) > max_chars - 4:
+        # Запас на закрытие блока кода
+        text = text[:max_chars - 4]
+    if text.count('```') % 2:
+        # Оборвались внутри блока кода: оставляем целые строки кода и закрываем блок
+        fence = text.rfind('```')
+        line_end = text.rfind('\n')
+        if line_end > fence:
+            text = text[:line_end]
+        return text.rstrip() + '\n```'
+    return _cut_at_boundary(text, min_keep=len(text) // 2)
+
+
+def _cut_at_boundary(text: str, min_keep: int) -> str:
+    """Обрезать по последнему концу предложения/абзаца, иначе по пробелу"""
+    ends = [match.end() for match in _SENTENCE_END_RE.finditer(text)]
+    if ends and ends[-1] >= min_keep:
+        return text[:ends[-1]].rstrip()
+    space = text.rfind(' ')
+    if space >= min_keep:
+        return text[:space].rstrip()
+    return text.rstrip()
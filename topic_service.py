@@ -1,19 +1,43 @@
+import os
 import logging
 import asyncio
-from typing import List, Dict, Optional
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta, timezone
-from database import Database, Topic, LearningMaterial
+from database import Database, Topic, LearningMaterial, MaterialPage, MaterialDocument, MaterialChunk, QuestionAnswer
 from grok_service import GrokService
+from material_pages import build_material_pages, render_material_document, document_filename
+from material_index import BM25Index, chunk_materials, tokenize
+from question_index import QuestionIndex, MAX_QUESTIONS_PER_TOPIC
+from metrics import record_cache
+from tracing import traced
+from usage_ledger import call_context
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, update, delete, func
 
 logger = logging.getLogger(__name__)
 
+# Срок годности сгенерированных материалов и страниц
+MATERIALS_TTL = timedelta(days=3)
+# Сколько дней ответ на вопрос может отдаваться повторно
+ANSWERS_TTL = timedelta(days=int(os.getenv('QUESTION_ANSWER_TTL_DAYS', '30')))
+
 class TopicService:
     def __init__(self, database: Database, grok_service: GrokService):
         self.db = database
         self.grok = grok_service
         self._last_update = {}  # Отслеживание последнего обновления тем
+        # Кеш готовых страниц в памяти: topic_id -> (время создания, страницы)
+        self._pages_cache: "OrderedDict[int, Tuple[datetime, List[Dict]]]" = OrderedDict()
+        self._pages_cache_size = int(os.getenv('MATERIAL_PAGES_CACHE_SIZE', '64'))
+        # Выполняющиеся генерации материалов: topic_id -> общая задача и число ожидающих
+        self._generations: Dict[int, Dict] = {}
+        # Поисковые индексы фрагментов материалов: topic_id -> (время создания, индекс)
+        self._indexes: "OrderedDict[int, Tuple[datetime, BM25Index]]" = OrderedDict()
+        self._indexes_size = int(os.getenv('MATERIAL_INDEX_CACHE_SIZE', '64'))
+        # Индексы прошлых вопросов: topic_id -> индекс, загружается при первом вопросе по теме
+        self._question_indexes: "OrderedDict[int, QuestionIndex]" = OrderedDict()
+        self._question_indexes_size = int(os.getenv('QUESTION_INDEX_CACHE_SIZE', '32'))
 
     async def get_topics_by_category(self, category: str) -> List[Dict]:
         """Получить темы по категории"""
@@ -69,6 +93,7 @@ class TopicService:
             logger.error(f"Ошибка получения темы {topic_id}: {e}")
             return None
 
+    @traced('topic_service.generate_learning_materials')
     async def generate_learning_materials(self, topic: Dict) -> Dict:
         """Генерация материалов для изучения темы"""
         
@@ -83,11 +108,12 @@ class TopicService:
             
             # Генерируем новые материалы через Grok
             logger.info("Генерируем новые материалы через Grok API")
-            materials = await self.grok.generate_learning_materials(topic)
+            with call_context(cache='miss'):
+                materials = await self.grok.generate_learning_materials(topic)
             logger.info(f"Получены материалы от Grok: {len(str(materials))} символов")
             
             # Сохраняем материалы в базе для кеширования
-            await self._save_materials_to_db(topic['id'], materials)
+            await self._save_materials_to_db(topic, materials)
             
             return materials
             
@@ -100,6 +126,273 @@ class TopicService:
                 'examples': "Примеры будут добавлены."
             }
 
+    @traced('topic_service.get_material_pages')
+    async def get_material_pages(self, topic: Dict) -> List[Dict]:
+        """Готовые страницы материалов темы для отправки в Telegram.
+
+        Страницы строятся один раз при сохранении материалов, поэтому
+        при открытии темы не нужно заново форматировать и разбивать текст.
+        """
+        pages = await self.get_stored_pages(topic['id'])
+        if pages:
+            return pages
+
+        # Одновременные запросы одной темы ждут одну генерацию
+        return await self._join_generation(topic)
+
+    async def _join_generation(self, topic: Dict) -> List[Dict]:
+        """Присоединиться к генерации страниц темы или запустить ее.
+
+        Каждый ожидающий ждет общую задачу через shield, поэтому отмена одного
+        пользователя не прерывает генерацию для остальных. Когда отменяется
+        последний ожидающий, генерация отменяется вместе с запросом к Grok.
+        """
+        topic_id = topic['id']
+        generation = self._generations.get(topic_id)
+        if generation is None or generation['abandoned']:
+            generation = {
+                'task': asyncio.create_task(self._generate_pages(topic)),
+                'waiters': 0,
+                'abandoned': False
+            }
+            self._generations[topic_id] = generation
+            generation['task'].add_done_callback(
+                lambda _, current=generation: self._finish_generation(topic_id, current)
+            )
+        else:
+            logger.info(f"Присоединяемся к генерации материалов темы {topic_id}")
+
+        generation['waiters'] += 1
+        try:
+            return await asyncio.shield(generation['task'])
+        finally:
+            generation['waiters'] -= 1
+            if generation['waiters'] == 0 and not generation['task'].done():
+                generation['abandoned'] = True
+                generation['task'].cancel()
+                logger.info(f"🛑 Генерация материалов темы {topic_id} отменена: ожидающих не осталось")
+
+    def _finish_generation(self, topic_id: int, generation: Dict):
+        if self._generations.get(topic_id) is generation:
+            del self._generations[topic_id]
+
+    @traced('topic_service.generate_pages')
+    async def _generate_pages(self, topic: Dict) -> List[Dict]:
+        """Генерация материалов темы и получение их страниц"""
+        materials = await self.generate_learning_materials(topic)
+
+        # Свежие материалы сохраняются вместе со страницами
+        pages = await self.get_stored_pages(topic['id'])
+        if pages:
+            return pages
+
+        # Материалы из кеша старого формата (без страниц) или ответ при ошибке
+        return await self._save_material_pages(topic, materials)
+
+    @traced('topic_service.get_stored_pages')
+    async def get_stored_pages(self, topic_id: int) -> Optional[List[Dict]]:
+        """Сохраненные страницы темы: из кеша в памяти, иначе из базы (без генерации)"""
+        cached = self._pages_cache.get(topic_id)
+        if cached and self._is_fresh(cached[0]):
+            self._pages_cache.move_to_end(topic_id)
+            record_cache('material_pages', 'memory')
+            return cached[1]
+
+        loaded = await self._get_cached_pages(topic_id)
+        if not loaded:
+            self._pages_cache.pop(topic_id, None)
+            record_cache('material_pages', 'miss')
+            return None
+
+        record_cache('material_pages', 'database')
+        self._remember_pages(topic_id, *loaded)
+        return loaded[1]
+
+    @traced('topic_service.get_material_document')
+    async def get_material_document(self, topic: Dict) -> Dict:
+        """Все материалы темы одним HTML файлом.
+
+        Возвращает содержимое и имя файла для загрузки, версию материалов
+        и file_id, если файл этой версии уже загружался в Telegram.
+        """
+        pages = await self.get_material_pages(topic)
+        cached = self._pages_cache.get(topic['id'])
+        # Версия есть только у сохраненных страниц; собранные на лету не кешируем
+        version = self._material_version(cached[0]) if cached else None
+
+        file_id = None
+        if version:
+            file_id = await self._get_document_file_id(topic['id'], version)
+        record_cache('material_document', 'hit' if file_id else 'miss')
+
+        return {
+            'version': version,
+            'file_id': file_id,
+            'filename': document_filename(topic),
+            'content': render_material_document(topic, pages)
+        }
+
+    async def save_document_file_id(self, topic_id: int, version: str, file_id: str):
+        """Запомнить file_id загруженного файла материалов для повторной отправки"""
+        try:
+            async with self.db.async_session() as session:
+                await session.execute(
+                    delete(MaterialDocument).where(MaterialDocument.topic_id == topic_id)
+                )
+                session.add(MaterialDocument(
+                    topic_id=topic_id,
+                    version=version,
+                    file_id=file_id,
+                    created_at=datetime.now(timezone.utc)
+                ))
+                await session.commit()
+                logger.info(f"Сохранен file_id файла материалов темы {topic_id}")
+
+        except Exception as e:
+            logger.error(f"Ошибка сохранения file_id для темы {topic_id}: {e}")
+
+    async def _get_document_file_id(self, topic_id: int, version: str) -> Optional[str]:
+        """file_id файла материалов нужной версии"""
+        try:
+            async with self.db.async_session() as session:
+                result = await session.execute(
+                    select(MaterialDocument.file_id).where(
+                        MaterialDocument.topic_id == topic_id,
+                        MaterialDocument.version == version
+                    )
+                )
+                return result.scalars().first()
+
+        except Exception as e:
+            logger.error(f"Ошибка получения file_id для темы {topic_id}: {e}")
+            return None
+
+    @traced('topic_service.get_question_context')
+    async def get_question_context(self, topic: Dict, question: str, max_tokens: int) -> Optional[str]:
+        """Фрагменты материалов темы, относящиеся к вопросу (BM25), в пределах бюджета токенов"""
+        index = await self._get_index(topic['id'])
+        if index is None:
+            return None
+        return index.context(question, max_tokens)
+
+    async def _get_index(self, topic_id: int) -> Optional[BM25Index]:
+        """Индекс темы: из памяти, из material_chunks или из материалов, сохраненных без фрагментов"""
+        cached = self._indexes.get(topic_id)
+        if cached and self._is_fresh(cached[0]):
+            self._indexes.move_to_end(topic_id)
+            record_cache('material_index', 'memory')
+            return cached[1]
+
+        try:
+            async with self.db.async_session() as session:
+                result = await session.execute(
+                    select(MaterialChunk)
+                    .where(MaterialChunk.topic_id == topic_id)
+                    .order_by(MaterialChunk.section, MaterialChunk.position)
+                )
+                rows = result.scalars().all()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки фрагментов материалов темы {topic_id}: {e}")
+            return None
+
+        if rows and self._is_fresh(rows[0].created_at):
+            record_cache('material_index', 'database')
+            chunks = [
+                {'section': row.section, 'position': row.position, 'content': row.content, 'terms': row.terms.split()}
+                for row in rows
+            ]
+            created_at = rows[0].created_at
+        else:
+            # Материалы, сохраненные до появления фрагментов, индексируются на лету
+            materials = await self._get_cached_materials(topic_id)
+            if not materials:
+                self._indexes.pop(topic_id, None)
+                record_cache('material_index', 'miss')
+                return None
+            record_cache('material_index', 'materials')
+            chunks = chunk_materials(materials)
+            created_at = datetime.now(timezone.utc)
+
+        index = BM25Index(chunks)
+        self._remember_index(topic_id, created_at, index)
+        return index
+
+    def _remember_index(self, topic_id: int, created_at: datetime, index: BM25Index):
+        self._indexes[topic_id] = (created_at, index)
+        self._indexes.move_to_end(topic_id)
+        while len(self._indexes) > self._indexes_size:
+            self._indexes.popitem(last=False)
+
+    @traced('topic_service.find_answer')
+    async def find_answer(self, topic: Dict, question: str) -> Optional[str]:
+        """Сохраненный ответ на похожий вопрос по теме (без обращения к Grok)"""
+        index = await self._get_question_index(topic['id'])
+        match = index.match(question) if index is not None else None
+        if match is None:
+            record_cache('question_answer', 'miss')
+            return None
+        score, answer = match
+        record_cache('question_answer', 'hit')
+        logger.info(f"♻️ Похожий вопрос по теме {topic['id']} (близость {score:.2f}) - ответ из базы")
+        return answer
+
+    async def save_answer(self, topic: Dict, question: str, answer: str):
+        """Запомнить ответ Grok для похожих вопросов"""
+        topic_id = topic['id']
+        try:
+            async with self.db.async_session() as session:
+                session.add(QuestionAnswer(
+                    topic_id=topic_id,
+                    question=question,
+                    answer=answer,
+                    created_at=datetime.now(timezone.utc)
+                ))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения ответа по теме {topic_id}: {e}")
+            return
+
+        # Загруженный индекс дополняется; незагруженный прочитает ответ из базы
+        index = self._question_indexes.get(topic_id)
+        if index is not None:
+            index.add(question, answer)
+
+    async def _get_question_index(self, topic_id: int) -> Optional[QuestionIndex]:
+        """Индекс вопросов темы из памяти или из question_answers"""
+        index = self._question_indexes.get(topic_id)
+        if index is not None:
+            self._question_indexes.move_to_end(topic_id)
+            return index
+
+        try:
+            async with self.db.async_session() as session:
+                result = await session.execute(
+                    select(QuestionAnswer.question, QuestionAnswer.answer)
+                    .where(
+                        QuestionAnswer.topic_id == topic_id,
+                        QuestionAnswer.created_at >= datetime.now(timezone.utc) - ANSWERS_TTL
+                    )
+                    .order_by(QuestionAnswer.id.desc())
+                    .limit(MAX_QUESTIONS_PER_TOPIC)
+                )
+                rows = result.all()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки ответов по теме {topic_id}: {e}")
+            return None
+
+        index = QuestionIndex([(question, answer) for question, answer in reversed(rows)])
+        self._question_indexes[topic_id] = index
+        while len(self._question_indexes) > self._question_indexes_size:
+            self._question_indexes.popitem(last=False)
+        return index
+
+    def _remember_pages(self, topic_id: int, created_at: datetime, pages: List[Dict]):
+        """Положить страницы в кеш в памяти, вытесняя давно не открывавшиеся темы"""
+        self._pages_cache[topic_id] = (created_at, pages)
+        self._pages_cache.move_to_end(topic_id)
+        while len(self._pages_cache) > self._pages_cache_size:
+            self._pages_cache.popitem(last=False)
+
     async def update_all_topics(self):
         """Обновить все темы из Grok API"""
         logger.info("Начинаем обновление всех тем...")
@@ -182,7 +475,7 @@ class TopicService:
                 
                 # Проверяем, не старые ли материалы (больше 3 дней)
                 oldest_material = min(materials, key=lambda x: x.created_at)
-                if (datetime.now(timezone.utc) - oldest_material.created_at) > timedelta(days=3):
+                if not self._is_fresh(oldest_material.created_at):
                     return None  # Материалы устарели
                 
                 # Группируем материалы по типу
@@ -207,14 +500,61 @@ class TopicService:
             logger.error(f"Ошибка получения кешированных материалов: {e}")
             return None
 
-    async def _save_materials_to_db(self, topic_id: int, materials: Dict):
-        """Сохранить материалы в базу данных"""
+    async def _get_cached_pages(self, topic_id: int) -> Optional[Tuple[datetime, List[Dict]]]:
+        """Получить сохраненные страницы материалов и время их создания из базы данных"""
+
+        try:
+            async with self.db.async_session() as session:
+                result = await session.execute(
+                    select(MaterialPage)
+                    .where(MaterialPage.topic_id == topic_id)
+                    .order_by(MaterialPage.page_number)
+                )
+                pages = result.scalars().all()
+
+                if not pages or not self._is_fresh(pages[0].created_at):
+                    return None
+
+                return pages[0].created_at, [
+                    {
+                        'page_number': page.page_number,
+                        'sections': page.sections.split(',') if page.sections else [],
+                        'content': page.content
+                    }
+                    for page in pages
+                ]
+
+        except Exception as e:
+            logger.error(f"Ошибка получения страниц материалов: {e}")
+            return None
+
+    @traced('topic_service.save_materials_to_db')
+    async def _save_materials_to_db(self, topic: Dict, materials: Dict):
+        """Сохранить материалы и готовые страницы для отправки в базу данных"""
         
+        topic_id = topic['id']
         try:
+            # Форматирование и разбивка на страницы - один раз, при сохранении
+            pages = build_material_pages(topic, materials)
+            # Фрагменты для поиска контекста к вопросам - тоже при сохранении
+            chunks = chunk_materials(materials)
+            for chunk in chunks:
+                chunk['terms'] = tokenize(chunk['content'])
+            now = datetime.now(timezone.utc)
+
             async with self.db.async_session() as session:
-                # Удаляем старые материалы для этой темы
+                # Удаляем старые материалы и страницы для этой темы
                 await session.execute(
-                    select(LearningMaterial).where(LearningMaterial.topic_id == topic_id)
+                    delete(LearningMaterial).where(LearningMaterial.topic_id == topic_id)
+                )
+                await session.execute(
+                    delete(MaterialPage).where(MaterialPage.topic_id == topic_id)
+                )
+                await session.execute(
+                    delete(MaterialDocument).where(MaterialDocument.topic_id == topic_id)
+                )
+                await session.execute(
+                    delete(MaterialChunk).where(MaterialChunk.topic_id == topic_id)
                 )
                 
                 # Сохраняем новые материалы
@@ -226,16 +566,101 @@ class TopicService:
                             title=f"{material_type.title()} для темы {topic_id}",
                             content=content,
                             is_verified=False,  # Пока не проверены
-                            created_at=datetime.now(timezone.utc)
+                            created_at=now
                         )
                         session.add(material)
+
+                self._add_pages_and_chunks(session, topic_id, pages, chunks, now)
                 
                 await session.commit()
-                logger.info(f"Материалы сохранены для темы {topic_id}")
+                self._remember_pages(topic_id, now, pages)
+                self._remember_index(topic_id, now, BM25Index(chunks))
+                logger.info(f"Материалы сохранены для темы {topic_id}: {len(pages)} стр., {len(chunks)} фрагментов для поиска")
                 
         except Exception as e:
             logger.error(f"Ошибка сохранения материалов: {e}")
 
+    @traced('topic_service.save_material_pages')
+    async def _save_material_pages(self, topic: Dict, materials: Dict) -> List[Dict]:
+        """Собрать страницы и фрагменты по материалам без страниц и сохранить их.
+
+        Материалы, сохраненные до появления страниц, получают страницы один раз:
+        при следующем открытии темы они читаются из базы. Время создания берется
+        у самих материалов, чтобы не продлевать их срок годности. Если свежих
+        материалов в базе нет (ответ при ошибке), страницы только собираются.
+        """
+        topic_id = topic['id']
+        pages = build_material_pages(topic, materials)
+        try:
+            async with self.db.async_session() as session:
+                result = await session.execute(
+                    select(func.min(LearningMaterial.created_at))
+                    .where(LearningMaterial.topic_id == topic_id)
+                )
+                created_at = result.scalar()
+                if created_at is None or not self._is_fresh(created_at):
+                    return pages
+
+                chunks = chunk_materials(materials)
+                for chunk in chunks:
+                    chunk['terms'] = tokenize(chunk['content'])
+
+                await session.execute(
+                    delete(MaterialPage).where(MaterialPage.topic_id == topic_id)
+                )
+                await session.execute(
+                    delete(MaterialChunk).where(MaterialChunk.topic_id == topic_id)
+                )
+                self._add_pages_and_chunks(session, topic_id, pages, chunks, created_at)
+
+                await session.commit()
+                self._remember_pages(topic_id, created_at, pages)
+                self._remember_index(topic_id, created_at, BM25Index(chunks))
+                logger.info(f"Страницы сохранены для материалов темы {topic_id}: {len(pages)} стр., {len(chunks)} фрагментов для поиска")
+
+        except Exception as e:
+            logger.error(f"Ошибка сохранения страниц материалов: {e}")
+        return pages
+
+    @staticmethod
+    def _add_pages_and_chunks(session: AsyncSession, topic_id: int, pages: List[Dict],
+                              chunks: List[Dict], created_at: datetime):
+        """Добавить в сессию строки страниц и фрагментов материалов темы"""
+        for page in pages:
+            session.add(MaterialPage(
+                topic_id=topic_id,
+                page_number=page['page_number'],
+                sections=','.join(page['sections']),
+                content=page['content'],
+                created_at=created_at
+            ))
+
+        for chunk in chunks:
+            session.add(MaterialChunk(
+                topic_id=topic_id,
+                section=chunk['section'],
+                position=chunk['position'],
+                content=chunk['content'],
+                terms=' '.join(chunk['terms']),
+                created_at=created_at
+            ))
+
+    @staticmethod
+    def _material_version(created_at: datetime) -> str:
+        """Версия материалов по времени создания страниц (одинаковая для дат из памяти и из БД)"""
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return created_at.strftime('%Y%m%d%H%M%S%f')
+
+    @staticmethod
+    def _is_fresh(created_at: Optional[datetime]) -> bool:
+        """Не устарели ли сохраненные материалы (даты без часового пояса считаем UTC)"""
+        if not created_at:
+            return False
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - created_at <= MATERIALS_TTL
+
     async def initialize_topics(self):
         """Инициализация тем при первом запуске"""
         logger.info("Инициализация тем...")
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from telegram.ext import ApplicationHandlerStop
+
+logger = logging.getLogger(__name__)
+
+# Доля трейсов, которые записываются всегда; медленные и с ошибкой записываются все
+SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.05'))
+SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_MS', '3000')) / 1000
+TRACE_FILE = os.getenv('TRACE_FILE', 'logs/traces.jsonl')
+# Ограничение памяти на один трейс (длинные генерации с сотнями запросов)
+MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', '500'))
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+class Trace:
+    """Все спаны одного обновления, включая запущенные из него фоновые задачи"""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.open_spans = 0
+        self.dropped_spans = 0
+        self.error = False
+        self.sampled = random.random() < tracer.sample_rate
+
+
+class Span:
+    """Участок работы: имя, время, атрибуты, родитель"""
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = 'ok'
+
+        trace.open_spans += 1
+        if len(trace.spans) < MAX_SPANS:
+            trace.spans.append(self)
+        else:
+            trace.dropped_spans += 1
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None):
+        """Завершить спан (повторный вызов ничего не делает)"""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if isinstance(error, asyncio.CancelledError):
+            self.status = 'cancelled'
+        elif isinstance(error, ApplicationHandlerStop):
+            # Не ошибка: обработчик остановил обработку обновления (дубликат нажатия)
+            self.status = 'stopped'
+        elif error is not None:
+            self.status = 'error'
+            self.attributes['error'] = repr(error)[:300]
+            self.trace.error = True
+
+        self.trace.open_spans -= 1
+        if self.trace.open_spans == 0:
+            tracer.finish(self.trace)
+
+
+class Tracer:
+    """Решает, какие трейсы сохранить, и пишет их в JSONL (одна строка - один трейс).
+
+    Решение принимается после завершения трейса: случайная выборка
+    sample_rate плюс все медленные (дольше slow_threshold) и завершившиеся
+    ошибкой. Поэтому любой медленный запрос можно разобрать по одному трейсу.
+    """
+
+    def __init__(self, sample_rate: float = SAMPLE_RATE, slow_threshold: float = SLOW_THRESHOLD,
+                 path: Optional[str] = TRACE_FILE):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.path = path
+        self.finished = 0
+        self.exported = 0
+
+    def finish(self, trace: Trace):
+        self.finished += 1
+        root = trace.spans[0]
+        duration = max(span.start + (span.duration or 0) for span in trace.spans) - root.start
+        if not (trace.sampled or trace.error or duration >= self.slow_threshold):
+            return
+        if not self.path:
+            return
+
+        line = json.dumps(self._to_record(trace, duration), ensure_ascii=False, default=str)
+        self.exported += 1
+        try:
+            # Запись в файл - вне event loop
+            asyncio.get_running_loop().run_in_executor(None, self._write, line)
+        except RuntimeError:
+            self._write(line)
+
+    @staticmethod
+    def _to_record(trace: Trace, duration: float) -> Dict:
+        root = trace.spans[0]
+        return {
+            'trace_id': trace.trace_id,
+            'name': root.name,
+            'start': datetime.fromtimestamp(root.start, timezone.utc).isoformat(),
+            'duration_ms': round(duration * 1000, 1),
+            'status': 'error' if trace.error else root.status,
+            'dropped_spans': trace.dropped_spans,
+            'spans': [
+                {
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'offset_ms': round((span.start - root.start) * 1000, 1),
+                    'duration_ms': round((span.duration or 0) * 1000, 1),
+                    'status': span.status,
+                    'attributes': span.attributes,
+                }
+                for span in trace.spans
+            ],
+        }
+
+    def _write(self, line: str):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except Exception as e:
+            logger.warning(f"Не удалось записать трейс: {e}")
+
+
+tracer = Tracer()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def annotate(**attributes):
+    """Добавить атрибуты текущему спану (если трейс есть)"""
+    span_ = _current_span.get()
+    if span_ is not None:
+        span_.set(**attributes)
+
+
+@contextmanager
+def span(name: str, root: bool = False, **attributes):
+    """Спан вокруг блока кода.
+
+    Без текущего трейса спан создается только с root=True (обработка
+    обновления); внутренние участки (SQL, Grok, отправка) вне трейса
+    ничего не стоят.
+    """
+    parent = _current_span.get()
+    if parent is None and not root:
+        yield None
+        return
+
+    span_ = Span(parent.trace if parent else Trace(), name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(span_)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span_.end()
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """Дочерний спан, который будет активирован позже (use_span) - например, в фоновой задаче.
+
+    Открытый спан не дает трейсу завершиться, пока задача не выполнится.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+@contextmanager
+def use_span(span_: Optional[Span]):
+    """Сделать спан текущим и завершить его на выходе"""
+    if span_ is None:
+        yield None
+        return
+    token = _current_span.set(span_)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span_.end()
+
+
+def traced(name: str):
+    """Декоратор асинхронной функции: спан на время вызова"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_handlers(application):
+    """Спан для каждого обработчика (внутри трейса обновления)"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = _trace_handler(handler.callback)
+
+
+def _trace_handler(callback):
+    name = getattr(callback, '__name__', type(callback).__name__)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with span(f"handler.{name}"):
+            return await callback(update, context)
+
+    return wrapper
+
+
+def trace_engine(engine):
+    """Спан для каждого SQL-запроса (через события SQLAlchemy)"""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span_ = start_span('db.query', statement=statement[:200])
+        conn.info.setdefault('trace_spans', []).append(span_)
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span_ = conn.info['trace_spans'].pop()
+        if span_ is not None:
+            span_.end()
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        connection = context.connection
+        if connection is not None and connection.info.get('trace_spans'):
+            span_ = connection.info['trace_spans'].pop()
+            if span_ is not None:
+                span_.end(error=context.original_exception)
@@ -0,0 +1,121 @@
+import os
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from tracing import annotate, span
+
+logger = logging.getLogger(__name__)
+
+# Сколько апдейтов обрабатывается одновременно (по всем пользователям)
+DEFAULT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '16'))
+# Сколько апдейтов может ждать своей очереди (включая ожидающие апдейты одного пользователя)
+DEFAULT_MAX_PENDING_UPDATES = int(os.getenv('BOT_MAX_PENDING_UPDATES', '256'))
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка для каждого пользователя.
+
+    Апдейты разных пользователей обрабатываются конкурентно (не более
+    max_concurrent_updates одновременно), а апдейты одного пользователя -
+    строго по очереди. Поэтому долгий handle_topic_selection одного
+    пользователя не блокирует /progress у остальных, а вопрос после кнопки
+    "Задать вопрос" всегда обрабатывается после установки waiting_for_question.
+
+    Апдейт, ожидающий своей очереди у пользователя, не занимает слот
+    обработки - слоты расходуются только на реально выполняющиеся хендлеры.
+    Лимит выполнения хранится в concurrency_limit: max_concurrent_updates
+    базового класса - это общий лимит апдейтов в работе вместе с ожидающими.
+    """
+
+    def __init__(self, max_concurrent_updates: int = DEFAULT_CONCURRENT_UPDATES,
+                 max_pending_updates: int = DEFAULT_MAX_PENDING_UPDATES):
+        self.concurrency_limit = max_concurrent_updates
+        # Семафор базового класса ограничивает общее число апдейтов в работе
+        # (выполняющиеся + ожидающие очереди пользователя)
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._processing_slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_waiters: Dict[int, int] = {}
+        self.active_updates = 0
+        self.pending_updates = 0
+        self.last_update_at: Optional[float] = None
+
+    @staticmethod
+    def _serialization_key(update: object) -> Optional[int]:
+        """Ключ сериализации: пользователь, а при его отсутствии - чат"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Обработка апдейта с блокировкой по пользователю (корневой спан трейса)"""
+        self.last_update_at = time.monotonic()
+        key = self._serialization_key(update)
+        with span('update', root=True, user_id=key, kind=self._update_kind(update)):
+            await self._process_in_order(key, coroutine)
+
+    @staticmethod
+    def _update_kind(update: object) -> str:
+        if isinstance(update, Update):
+            if update.callback_query:
+                return f"callback:{(update.callback_query.data or '').split('_')[0]}"
+            if update.message and update.message.text and update.message.text.startswith('/'):
+                return f"command:{update.message.text.split()[0]}"
+            if update.message:
+                return 'message'
+        return type(update).__name__
+
+    async def _process_in_order(self, key: Optional[int], coroutine: Awaitable[Any]) -> None:
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        lock = self._user_locks.get(key)
+        if lock is None:
+            lock = self._user_locks[key] = asyncio.Lock()
+        self._user_waiters[key] = self._user_waiters.get(key, 0) + 1
+        self.pending_updates += 1
+
+        try:
+            waiting_since = time.perf_counter()
+            try:
+                await lock.acquire()
+            finally:
+                self.pending_updates -= 1
+            annotate(queue_wait_ms=round((time.perf_counter() - waiting_since) * 1000, 1))
+            try:
+                await self._run(coroutine)
+            finally:
+                lock.release()
+        finally:
+            # Удаляем блокировку, когда у пользователя не осталось апдейтов в очереди
+            self._user_waiters[key] -= 1
+            if not self._user_waiters[key]:
+                del self._user_waiters[key]
+                del self._user_locks[key]
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        """Выполнение хендлеров в одном из слотов обработки"""
+        async with self._processing_slots:
+            self.active_updates += 1
+            try:
+                await coroutine
+            finally:
+                self.active_updates -= 1
+
+    async def initialize(self) -> None:
+        logger.info(
+            f"⚙️ Параллельная обработка апдейтов: до {self.concurrency_limit} одновременно, "
+            f"порядок сохраняется для каждого пользователя"
+        )
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,251 @@
+import os
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, select
+
+from database import Database, GrokCall, Topic
+
+logger = logging.getLogger(__name__)
+
+# Поля вызова, которые знает только вызывающий код (результат проверки кеша, повторы)
+_call_context: ContextVar[Dict] = ContextVar('grok_call_context', default={})
+
+
+@contextmanager
+def call_context(**fields):
+    """Дополнительные поля для записей журнала о вызовах Grok внутри блока"""
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_call_context() -> Dict:
+    return _call_context.get()
+
+
+def parse_prices(spec: str) -> Dict[str, tuple]:
+    """Цены моделей из строки вида "grok-4-latest:3/15,grok-3-mini:0.3/0.5" (USD за 1M токенов: вход/выход)"""
+    prices = {}
+    for item in spec.split(','):
+        if ':' not in item:
+            continue
+        model, _, pair = item.strip().partition(':')
+        try:
+            prompt_price, completion_price = (float(value) for value in pair.split('/'))
+        except ValueError:
+            logger.warning(f"Некорректная цена модели в GROK_PRICES: {item}")
+            continue
+        prices[model.strip()] = (prompt_price, completion_price)
+    return prices
+
+
+class UsageLedger:
+    """Журнал вызовов Grok API в таблице grok_calls.
+
+    GrokService сообщает о каждом вызове: операция, тема, статус, время,
+    токены из usage, повторы и результат проверки кеша. Запись в БД не
+    задерживает ответ пользователю: строки копятся в памяти и уходят
+    одним INSERT раз в flush_interval секунд (или сразу при batch_size
+    строк). Стоимость считается при записи по ценам модели из GROK_PRICES,
+    поэтому смена цен не переписывает историю.
+    """
+
+    def __init__(self, db: Database, flush_interval: Optional[float] = None, batch_size: Optional[int] = None):
+        self.db = db
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv('GROK_LEDGER_FLUSH_INTERVAL', '5'))
+        self.batch_size = batch_size or int(os.getenv('GROK_LEDGER_BATCH_SIZE', '100'))
+        # При недоступной БД буфер не растет бесконечно: старые записи теряются
+        self.max_buffer = int(os.getenv('GROK_LEDGER_MAX_BUFFER', '10000'))
+        self.prices = parse_prices(os.getenv('GROK_PRICES', 'grok-4-latest:3/15,grok-3-mini:0.3/0.5'))
+        self._buffer: List[Dict] = []
+        self._writer: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self.written = 0
+        self.dropped = 0
+
+    def cost(self, model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+        prompt_price, completion_price = self.prices.get(model or '', (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def record(self, operation: str, status: str, latency: float, model: Optional[str] = None,
+               topic_id: Optional[int] = None, prompt_tokens: int = 0, completion_tokens: int = 0,
+               retries: int = 0, cache: Optional[str] = None, backend: Optional[str] = None):
+        """Добавить вызов в журнал (без ожидания записи в БД)"""
+        context = current_call_context()
+        self._buffer.append({
+            'created_at': datetime.utcnow(),
+            'operation': operation,
+            'model': model,
+            'backend': backend,
+            'topic_id': topic_id if topic_id is not None else context.get('topic_id'),
+            'status': status,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'latency_ms': int(latency * 1000),
+            # Повторы на другом бэкенде плюс эскалация на другую модель
+            'retries': retries + context.get('retries', 0),
+            'cache': cache or context.get('cache', 'none'),
+            'cost_usd': self.cost(model, prompt_tokens, completion_tokens),
+        })
+        if len(self._buffer) > self.max_buffer:
+            overflow = len(self._buffer) - self.max_buffer
+            del self._buffer[:overflow]
+            self.dropped += overflow
+
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop(), name="grok_ledger")
+
+    async def _write_loop(self):
+        while self._buffer:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not await self._write_batch():
+                return
+
+    async def _write_batch(self) -> bool:
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return True
+        try:
+            async with self.db.async_session() as session:
+                session.add_all([GrokCall(**row) for row in batch])
+                await session.commit()
+            self.written += len(batch)
+            return True
+        except Exception as e:
+            # Вернем строки в буфер: запишутся со следующим вызовом или при остановке
+            self._buffer[:0] = batch
+            logger.error(f"Ошибка записи журнала вызовов Grok ({len(batch)} шт.): {e}")
+            return False
+
+    async def flush(self):
+        """Записать накопленное сейчас, не дожидаясь flush_interval"""
+        await self._write_batch()
+
+    async def close(self):
+        """Записать накопленное (при остановке бота)"""
+        if self._writer and not self._writer.done():
+            # Не отменяем запись на середине пакета: будим писателя и ждем его
+            self._wakeup.set()
+            await asyncio.gather(self._writer, return_exceptions=True)
+        await self.flush()
+        logger.info(f"📒 Журнал вызовов Grok: записано {self.written}, потеряно {self.dropped}")
+
+    async def rollup(self, days: int = 7, top_topics: int = 10) -> Dict:
+        """Сводка за последние days дней: всего, по операциям, моделям, бэкендам и самым дорогим темам.
+
+        Счетчики, токены и стоимость считает БД (GROUP BY); для p95 времени
+        читается одна строка на группу, так что сводка не тянет журнал в память.
+        """
+        since = datetime.utcnow() - timedelta(days=days)
+        async with self.db.async_session() as session:
+            total = (await self._summarize(session, since)).get(None)
+            operations = await self._summarize(session, since, GrokCall.operation)
+            models = await self._summarize(session, since, GrokCall.model)
+            backends = await self._summarize(session, since, GrokCall.backend)
+            topics = await self._summarize(session, since, GrokCall.topic_id, limit=top_topics)
+            titles = {}
+            if topics:
+                result = await session.execute(select(Topic.id, Topic.title).where(Topic.id.in_(list(topics))))
+                titles = dict(result.all())
+        return {
+            'days': days,
+            'total': total if total and total['calls'] else None,
+            'operations': operations,
+            'models': {name or '-': stats for name, stats in models.items()},
+            'backends': {name or '-': stats for name, stats in backends.items()},
+            'topics': {titles.get(topic_id) or f"#{topic_id}": stats for topic_id, stats in topics.items()},
+        }
+
+    @staticmethod
+    async def _summarize(session, since: datetime, column=None, limit: Optional[int] = None) -> Dict:
+        """Вызовы, ошибки, промахи кеша, токены, стоимость, среднее и p95 времени по значениям column.
+
+        Без column - одна группа None по всем вызовам; группы - по убыванию стоимости.
+        """
+        cost = func.coalesce(func.sum(GrokCall.cost_usd), 0.0)
+        query = select(
+            *([column] if column is not None else []),
+            func.count(GrokCall.id),
+            func.coalesce(func.sum(case((GrokCall.status != '200', 1), else_=0)), 0),
+            func.coalesce(func.sum(case((GrokCall.cache == 'miss', 1), else_=0)), 0),
+            func.coalesce(func.sum(GrokCall.prompt_tokens), 0),
+            func.coalesce(func.sum(GrokCall.completion_tokens), 0),
+            cost,
+            func.coalesce(func.avg(GrokCall.latency_ms), 0),
+        ).where(GrokCall.created_at >= since)
+        if column is not None:
+            query = query.group_by(column)
+            if column is GrokCall.topic_id:
+                query = query.where(GrokCall.topic_id.isnot(None))
+        query = query.order_by(cost.desc())
+        if limit:
+            query = query.limit(limit)
+
+        summary = {}
+        for row in (await session.execute(query)).all():
+            key, values = (row[0], row[1:]) if column is not None else (None, row)
+            calls, errors, misses, prompt_tokens, completion_tokens, cost_usd, avg_latency = values
+            conditions = [GrokCall.created_at >= since]
+            if column is not None:
+                conditions.append(column == key if key is not None else column.is_(None))
+            summary[key] = {
+                'calls': calls,
+                'errors': int(errors),
+                'cache_misses': int(misses),
+                'prompt_tokens': int(prompt_tokens),
+                'completion_tokens': int(completion_tokens),
+                'cost_usd': round(float(cost_usd), 4),
+                'avg_latency_ms': int(avg_latency),
+                'p95_latency_ms': await _latency_percentile(session, conditions, calls, 0.95) if calls else 0,
+            }
+        return summary
+
+
+async def _latency_percentile(session, conditions: List, count: int, q: float) -> int:
+    """Перцентиль времени ответа: одна строка по смещению в отсортированной группе"""
+    offset = min(count - 1, int((count - 1) * q + 0.5))
+    result = await session.execute(
+        select(GrokCall.latency_ms).where(*conditions)
+        .order_by(GrokCall.latency_ms).offset(offset).limit(1)
+    )
+    return result.scalar() or 0
+
+
+def format_rollup(rollup: Dict, top_topics: int = 10) -> str:
+    """Сводка для команды /usage"""
+    total = rollup['total']
+    if not total:
+        return f"📒 За {rollup['days']} дн. вызовов Grok не было."
+
+    def line(name: str, stats: Dict) -> str:
+        tokens = stats['prompt_tokens'] + stats['completion_tokens']
+        errors = f", ошибок {stats['errors']}" if stats['errors'] else ''
+        misses = f", после промаха кеша {stats['cache_misses']}" if stats['cache_misses'] else ''
+        return (f"• {name}: {stats['calls']} выз., {tokens / 1000:.1f}K ток., ${stats['cost_usd']:.2f}, "
+                f"ср. {stats['avg_latency_ms'] / 1000:.1f} с, p95 {stats['p95_latency_ms'] / 1000:.1f} с{errors}{misses}")
+
+    lines = [f"📒 Вызовы Grok за {rollup['days']} дн.", "", line('Всего', total), "", "По операциям:"]
+    lines += [line(name, stats) for name, stats in rollup['operations'].items()]
+    if len(rollup.get('models', {})) > 1:
+        lines += ["", "По моделям:"]
+        lines += [line(name, stats) for name, stats in rollup['models'].items()]
+    if len(rollup.get('backends', {})) > 1:
+        lines += ["", "По бэкендам:"]
+        lines += [line(name, stats) for name, stats in rollup['backends'].items()]
+    if rollup['topics']:
+        lines += ["", f"Самые дорогие темы (до {top_topics}):"]
+        lines += [line(name, stats) for name, stats in list(rollup['topics'].items())[:top_topics]]
+    return "\n".join(lines)